@@ -0,0 +1,59 @@
+"""Memory per tracked anti-spam user, old dict layout vs UserState
+
+Run from the NinjaBot directory:
+    python -m benchmarks.antiSpamMemory [--users 10000] [--messages 1 5 50 500]
+"""
+import argparse
+import gc
+import itertools
+import tracemalloc
+from utils.spamState import UserState
+
+CHANNELS = (2000, 2001, 2002)
+TEXT = "hey everyone check out this totally legit link"
+
+def legacyUser(ids, count: int) -> dict:
+    """The layout NinjaAntiSpam used before UserState"""
+    user = {"lm": TEXT, "lmts": 1700000000.0, "abuse": 0, "msgs": [], "channels": []}
+    for i in range(count):
+        channel = CHANNELS[i % len(CHANNELS)]
+        user["msgs"].append([next(ids), channel])
+        if channel not in user["channels"]:
+            user["channels"].append(channel)
+    return user
+
+def slottedUser(ids, count: int, historySize: int) -> UserState:
+    user = UserState(TEXT, TEXT, 1700000000.0, historySize)
+    for i in range(count):
+        channel = CHANNELS[i % len(CHANNELS)]
+        user.messages.append(next(ids), channel)
+        user.channels.add(channel)
+    return user
+
+def measure(build, users: int) -> float:
+    """bytes per user kept alive by 'build'"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    h = {uid: build() for uid in range(users)}
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del h
+    return (after - before) / users
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--messages", type=int, nargs="+", default=[1, 5, 50, 500], help="messages per user")
+    parser.add_argument("--history-size", type=int, default=50, help="UserState ring buffer capacity")
+    args = parser.parse_args()
+
+    print(f"{'msgs/user':>10}{'dict B/user':>16}{'UserState B/user':>20}{'saved':>10}")
+    for count in args.messages:
+        ids = itertools.count(1 << 60)
+        legacy = measure(lambda: legacyUser(ids, count), args.users)
+        slotted = measure(lambda: slottedUser(ids, count, args.history_size), args.users)
+        print(f"{count:>10}{legacy:>16.0f}{slotted:>20.0f}{1 - slotted / legacy:>10.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""FAQ index accuracy and latency on the shipped commands.json
+
+Known questions are paraphrases of what a command answers, unknown ones
+are support questions none of the commands answer and that have to go to
+the LLM. For a range of thresholds it shows how many known questions get
+answered, how many of those answers are right and how many unknown
+questions would wrongly get a canned answer.
+
+Run from the NinjaBot directory:
+    python -m benchmarks.faqIndex [--commands ../commands.json]
+"""
+import argparse
+import json
+import pathlib
+import statistics
+import time
+from utils.faqIndex import FaqIndex
+
+COMMANDS = pathlib.Path(__file__).parent.parent.parent / "commands.json"
+# commands that are jokes or point at the support channels, the sample config excludes them as well
+EXCLUDE = ("ping", "test", "python", "feelfree", "s", "support")
+
+# question, commands that answer it
+KNOWN = (
+    ("Is there an Android app for VDO.Ninja?", {"android"}),
+    ("Where can I download the iOS app?", {"ios"}),
+    ("Why can't my iPhone send 1080p video?", {"iphone"}),
+    ("How many guests can join a room, is there a limit?", {"limit"}),
+    ("How do I make a permanent link that doesn't change every time?", {"permanent"}),
+    ("Can I control VDO.Ninja with my Elgato Stream Deck?", {"streamdeck"}),
+    ("Which browsers are supported?", {"supported", "firefox"}),
+    ("Is Firefox supported?", {"firefox", "supported"}),
+    ("I have high packet loss on my stream, what can I do?", {"packetloss", "wifi"}),
+    ("Guest is on wifi and the video keeps freezing", {"wifi", "packetloss"}),
+    ("How can I test my connection speed to vdo ninja", {"speedtest"}),
+    ("Where can I find the documentation?", {"docs", "wiki"}),
+    ("How can I donate to the project?", {"donate", "sponsor"}),
+    ("Where is the source code on github?", {"github"}),
+    ("I think I found a bug, how do I report it?", {"bug"}),
+    ("How do I reset the microphone permissions in chrome?", {"permissions"}),
+    ("How do I clear the browser cache and force reload?", {"cache"}),
+    ("What changed in the latest version?", {"latest", "updates"}),
+    ("Is there an official reddit?", {"reddit"}),
+    ("How can I contact Steve by email about a private matter?", {"contact"}),
+    ("Is hardware acceleration enabled for my browser source?", {"hwaccel"}),
+    ("Does VDO.Ninja use the GPU or CPU for encoding?", {"cpu"}),
+    ("What is the Electron Capture app?", {"electron"}),
+    ("How do I route audio on windows with Voicemeeter?", {"voicemeeter"}),
+    ("How can I send a specific obs audio source to vdo ninja with the audio monitor plugin?", {"audiomonitor"}),
+    ("Where can I read about stereo modes and audio quality?", {"audio"}),
+    ("VDO.Ninja doesn't work in OBS on macOS, which OBS version do I need?", {"macos"}),
+    ("Is there a remote control for OBS?", {"remoteninja"}),
+    ("Does it work with other software than OBS, like vMix?", {"software"}),
+    ("Where are the advanced parameters documented?", {"advanced"}),
+    ("Is there a list of common issues and known errors?", {"common"}),
+    ("What is the discord invite link?", {"discord"}),
+)
+
+UNKNOWN = (
+    "My guest's video is black in the director view after they joined, what should I check?",
+    "Can I record each guest separately to a local file?",
+    "There is an echo when two guests sit in the same room",
+    "Screen sharing only shows a black window on my mac",
+    "Is it possible to set a password on a room?",
+    "How do I change the bitrate of the view link?",
+    "Can vdo ninja stream directly to youtube with rtmp?",
+    "The director cannot hear the guests but the guests hear each other",
+    "What does &proaudio do?",
+    "Can I get NDI output from a guest?",
+    "How do I transfer a guest to another room?",
+    "My stream has a delay of 3 seconds, how can I reduce latency?",
+    "Is there a way to mute everyone at once as the director?",
+    "My camera image is mirrored horizontally",
+    "The guest's audio keeps cutting out every few seconds",
+    "Can I change my display name after joining?",
+)
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.75, 0.8, 0.9)
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", default=str(COMMANDS))
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true", help="show the best match of every question")
+    args = parser.parse_args()
+
+    with open(args.commands) as f:
+        commands = {name.lower(): reply for name, reply in json.load(f).items()}
+
+    index = FaqIndex(exclude=EXCLUDE)
+    start = time.perf_counter()
+    index.update(commands)
+    print(f"indexed {len(index)} answers in {(time.perf_counter() - start) * 1e3:.2f}ms")
+
+    # a refresh that changes one reply, like an edited commands.json
+    changed = dict(commands)
+    name = next(iter(changed))
+    changed[name] += " (edited)"
+    start = time.perf_counter()
+    index.update(changed)
+    index.update(commands)
+    print(f"incremental update of one answer: {(time.perf_counter() - start) / 2 * 1e6:.1f}us")
+
+    known = [(question, answers, index.search(question, 1)) for question, answers in KNOWN]
+    unknown = [(question, index.search(question, 1)) for question in UNKNOWN]
+    if args.verbose:
+        for question, answers, matches in known:
+            best = matches[0] if matches else None
+            mark = "ok" if best and best.name in answers else "XX"
+            print(f"  {mark} {best.confidence if best else 0:.2f} {best.name if best else '-':<14} {question}")
+        for question, matches in unknown:
+            best = matches[0] if matches else None
+            print(f"  -- {best.confidence if best else 0:.2f} {best.name if best else '-':<14} {question}")
+
+    print(f"\n{'threshold':>10}{'answered':>10}{'correct':>10}{'wrong unknown':>15}")
+    for threshold in THRESHOLDS:
+        answered = [(answers, m[0]) for _, answers, m in known if m and m[0].confidence >= threshold]
+        correct = sum(best.name in answers for answers, best in answered)
+        wrong = sum(1 for _, m in unknown if m and m[0].confidence >= threshold)
+        print(f"{threshold:>10.2f}{len(answered) / len(known):>10.0%}"
+              f"{correct / len(answered) if answered else 1:>10.0%}{wrong / len(unknown):>15.0%}")
+
+    questions = [question for question, _ in KNOWN] + list(UNKNOWN)
+    timings = []
+    for _ in range(args.rounds):
+        for question in questions:
+            start = time.perf_counter()
+            index.answer(question)
+            timings.append((time.perf_counter() - start) * 1e6)
+    print(f"\nlookup latency: mean {statistics.fmean(timings):.1f}us, p50 {percentile(timings, 0.5):.1f}us, "
+          f"p99 {percentile(timings, 0.99):.1f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Offline replay benchmark for the message path
+
+Builds synthetic guild messages from gateway-like payloads, pushes them through
+NinjaBot.on_message and all cog listeners and reports throughput, latency
+percentiles and memory per message (peak traced memory while handling one
+message and the objects/bytes still alive afterwards). Discord's REST API is
+replaced with an in-process fake, nothing goes over the network.
+
+Run from the NinjaBot directory:
+    python -m benchmarks.messagePath [--messages 2000] [--scenario all]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import pathlib
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+import discord
+
+LOCALDIR = pathlib.Path(__file__).parent.parent.resolve()
+
+GUILD_ID = 1000
+BOT_ID = 1001
+MOD_ROLE_ID = 1002
+GENERAL_ID = 2000
+OFFTOPIC_ID = 2001
+SUPPORT_ID = 2002
+BOTLOG_ID = 2003
+THREAD_ID = 3000
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+# ids of messages posted now, older ones (more than 14 days) could never be bulk deleted
+snowflakes = itertools.count(discord.utils.time_snowflake(discord.utils.utcnow()))
+
+MODERATOR_IDS = tuple(range(80_000, 80_005))
+
+def userPayload(uid: int, bot: bool = False) -> dict:
+    return {"id": str(uid), "username": f"user{uid}", "discriminator": "0", "avatar": None, "bot": bot}
+
+def messagePayload(channelId: int, authorId: int, content: str, reference: int | None = None, bot: bool = False, roles=()) -> dict:
+    data = {
+        "id": str(next(snowflakes)), "channel_id": str(channelId), "guild_id": str(GUILD_ID),
+        "author": userPayload(authorId, bot),
+        "member": {"roles": [str(r) for r in roles], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0},
+        "content": content, "timestamp": TIMESTAMP, "edited_timestamp": None, "tts": False,
+        "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+        "pinned": False, "type": 0
+    }
+    if reference:
+        data["type"] = 19
+        data["message_reference"] = {"message_id": str(reference), "channel_id": str(channelId), "guild_id": str(GUILD_ID)}
+        # the gateway sends the replied to message along
+        data["referenced_message"] = messagePayload(channelId, 42, "an earlier message") | {"id": str(reference)}
+    return data
+
+def channelPayload(channelId: int, name: str) -> dict:
+    return {"id": str(channelId), "type": 0, "name": name, "position": 0, "permission_overwrites": [], "guild_id": str(GUILD_ID)}
+
+def threadPayload(threadId: int, parentId: int, name: str, ownerId: int) -> dict:
+    return {"id": str(threadId), "type": 11, "name": name, "parent_id": str(parentId), "owner_id": str(ownerId),
+            "guild_id": str(GUILD_ID), "message_count": 0, "member_count": 1, "thread_metadata": {"archived": False, "auto_archive_duration": 10080,
+                                                            "archive_timestamp": TIMESTAMP, "locked": False}}
+
+def guildPayload() -> dict:
+    role = {"permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False}
+    return {
+        "id": str(GUILD_ID), "name": "benchmark", "owner_id": "1", "member_count": 1000,
+        "roles": [role | {"id": str(GUILD_ID), "name": "@everyone"}, role | {"id": str(MOD_ROLE_ID), "name": "Moderator", "position": 1}],
+        "channels": [channelPayload(GENERAL_ID, "general"), channelPayload(OFFTOPIC_ID, "offtopic"),
+                     channelPayload(SUPPORT_ID, "support"), channelPayload(BOTLOG_ID, "botlog")],
+        "threads": [threadPayload(THREAD_ID, GENERAL_ID, "help thread", 42)],
+        # the moderators scenario authors, in the member cache like after chunking
+        "members": [{"user": userPayload(uid), "roles": [str(MOD_ROLE_ID)], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0}
+                    for uid in MODERATOR_IDS]
+    }
+
+class FakeRest:
+    """Stands in for discord.http.HTTPClient.request and answers with plausible payloads"""
+    def __init__(self) -> None:
+        self.calls = Counter()
+
+    async def request(self, route, **kwargs):
+        self.calls[f"{route.method} {route.path}"] += 1
+        await asyncio.sleep(0)
+        if route.method == "POST" and route.path == "/channels/{channel_id}/messages":
+            content = (kwargs.get("json") or {}).get("content") or ""
+            return messagePayload(route.channel_id, BOT_ID, content, bot=True)
+        if route.method == "GET" and route.path == "/channels/{channel_id}/messages/{message_id}":
+            return messagePayload(route.channel_id, 42, "an earlier message") | {"id": route.url.rsplit("/", 1)[1]}
+        if route.method == "GET" and route.path == "/channels/{channel_id}/messages":
+            return []
+        if route.method == "POST" and route.path == "/channels/{channel_id}/messages/{message_id}/threads":
+            return threadPayload(next(snowflakes), route.channel_id, (kwargs.get("json") or {}).get("name", ""), 42)
+        return None
+
+def scenarios() -> dict:
+    """Each scenario yields (channelId, authorId, content, reference, roles) tuples forever"""
+    def chat():
+        texts = ("hey, how do I share my screen?", "thanks that worked", "is there a way to lower the bitrate?",
+                 "lol", "my camera is black in obs", "which browser works best?")
+        for i in itertools.count():
+            yield GENERAL_ID if i % 2 else OFFTOPIC_ID, 10_000 + i % 500, texts[i % len(texts)], None, ()
+
+    def commands():
+        lines = ("!android", "!audio", "!commands", "!advanced now", "!unknowncommand", "!ANDROID")
+        for i in itertools.count():
+            yield GENERAL_ID, 20_000 + i % 50, lines[i % len(lines)], None, ()
+
+    def invites():
+        for i in itertools.count():
+            yield GENERAL_ID, 30_000 + i % 200, f"join my server discord.gg/abc{i % 97}", None, ()
+
+    def streamKeys():
+        for i in itertools.count():
+            yield OFFTOPIC_ID, 40_000 + i % 200, f"my key is live_{i % 10**8:08d}_{'a' * 32}", None, ()
+
+    def raid():
+        # bursts of identical messages from a group of fresh accounts across channels
+        for i in itertools.count():
+            yield (GENERAL_ID, OFFTOPIC_ID)[i % 2], 50_000 + (i // 2) % 20 + (i // 120) * 20, "FREE NITRO >> bit.ly/free-nitro", None, ()
+
+    def threadReplies():
+        for i in itertools.count():
+            yield THREAD_ID, 60_000 + i % 30, f"reply number {i}", 1234 if i % 3 == 0 else None, ()
+
+    def autoThread():
+        for i in itertools.count():
+            yield SUPPORT_ID, 70_000 + i % 100, f"I need help with my setup #{i}", None, ()
+
+    def moderators():
+        for i in itertools.count():
+            yield GENERAL_ID, MODERATOR_IDS[i % len(MODERATOR_IDS)], "please keep it on topic", None, (MOD_ROLE_ID,)
+
+    return {"chat": chat, "commands": commands, "invites": invites, "streamKeys": streamKeys, "raid": raid,
+            "threadReplies": threadReplies, "autoThread": autoThread, "moderators": moderators}
+
+def mixed():
+    """A traffic mix that roughly resembles a normal day on the server"""
+    gens = {name: factory() for name, factory in scenarios().items()}
+    weights = {"chat": 60, "commands": 10, "threadReplies": 15, "autoThread": 5, "moderators": 5, "invites": 2, "streamKeys": 1, "raid": 2}
+    pattern = [name for name, weight in weights.items() for _ in range(weight)]
+    for i in itertools.count():
+        yield next(gens[pattern[(i * 7) % len(pattern)]])
+
+async def buildBot(tmpdir: pathlib.Path):
+    # importing main sets up logging, silence it so the benchmark measures the bot and not the terminal
+    import main
+    logging.getLogger("NinjaBot").setLevel(logging.ERROR)
+    logging.getLogger("discord").setLevel(logging.ERROR)
+    from utils.config import Config
+    from utils.metrics import instrumentDiscordRequest
+    from utils.deletionScheduler import DeletionScheduler
+
+    options = json.loads((LOCALDIR / "discordbot.sample.cfg").read_text())
+    options.update({"guild": GUILD_ID, "botlogChannel": BOTLOG_ID, "autoThreadEnabledChannels": [SUPPORT_ID],
+                    "autoThreadWelcomeMapping": {str(SUPPORT_ID): "welcomeText"}, "welcomeText": "Hi {usermention}",
+                    "aiEnabledChannels": [], "loggedOnSupportStaff": [], "metrics": {}})
+    # the replay runs far faster than real traffic, posting speed limits would flag every scenario
+    options["antiSpam"]["rate"] = {"userLimit": 10**9, "channelLimit": 10**9}
+    cfgFile = tmpdir / "discordbot.cfg"
+    cfgFile.write_text(json.dumps(options))
+    config = Config(file=cfgFile, flushDelay=3600)
+    await config.parse()
+
+    bot = main.NinjaBot(config)
+    # keep scheduled deletions out of the repository, replaced before setup_hook starts it
+    bot.deletionScheduler = DeletionScheduler(bot, tmpdir / "pendingDeletions.json")
+    rest = FakeRest()
+    bot.http.request = instrumentDiscordRequest(rest.request)
+    await bot._async_setup_hook()
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data=userPayload(BOT_ID, bot=True))
+    state._add_guild_from_data(guildPayload())
+    # normally done on ready
+    bot.roleIndex.rebuild()
+
+    await bot._loadExtensions(main.CRITICAL_EXTENSIONS)
+    # don't fetch commands from github, use the copy in the repository instead
+    github = bot.get_cog("NinjaGithub")
+    if github:
+        github.regularUpdater.cancel()
+        github.commands = json.loads((LOCALDIR.parent / "commands.json").read_text())
+        bot.commandRegistry.setSource("github", github.commands)
+    return bot, rest
+
+def makeMessage(bot, item) -> discord.Message:
+    channelId, authorId, content, reference, roles = item
+    state = bot._connection
+    channel = state._get_guild(GUILD_ID).get_channel_or_thread(channelId)
+    return discord.Message(state=state, channel=channel, data=messagePayload(channelId, authorId, content, reference, roles=roles))
+
+async def processOne(bot, item) -> None:
+    await bot.on_message(makeMessage(bot, item))
+    await bot.messageDispatcher.drain()
+    # warnings are removed right away instead of seconds later
+    await bot.deletionScheduler.deleteDue(math.inf)
+    await bot.actionQueue.join()
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def run(bot, source, count: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await processOne(bot, next(source))
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        t = time.perf_counter()
+        await processOne(bot, next(source))
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+
+    # memory in a separate pass so tracing overhead doesn't skew the timings
+    peaks = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(min(count, 500)):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await processOne(bot, next(source))
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    memoryRuns = len(peaks)
+
+    return {
+        "msgs/s": count / total,
+        "p50 ms": percentile(latencies, 0.50) * 1000,
+        "p99 ms": percentile(latencies, 0.99) * 1000,
+        "peak KiB/msg": sum(peaks) / memoryRuns / 1024,
+        "retained objs/msg": sum(s.count_diff for s in stats if s.count_diff > 0) / memoryRuns,
+        "retained B/msg": sum(s.size_diff for s in stats) / memoryRuns,
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000, help="messages per scenario")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--scenario", default="all", choices=["all", "mixed", *scenarios()])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bot, rest = await buildBot(pathlib.Path(tmpdir))
+        selected = list(scenarios()) + ["mixed"] if args.scenario == "all" else [args.scenario]
+        columns = ("msgs/s", "p50 ms", "p99 ms", "peak KiB/msg", "retained objs/msg", "retained B/msg")
+        print(f"{'scenario':<14}" + "".join(f"{c:>18}" for c in columns))
+        for name in selected:
+            source = mixed() if name == "mixed" else scenarios()[name]()
+            result = await run(bot, source, args.messages, args.warmup)
+            print(f"{name:<14}" + "".join(f"{result[c]:>18.2f}" for c in columns))
+        print("\nREST calls:")
+        for call, count in rest.calls.most_common():
+            print(f"  {count:>8}  {call}")
+        await bot.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Raid index throughput, memory and detection on simulated server traffic
+
+Normal chat from many users is mixed with raids where fresh accounts each
+post a slightly varied copy of the same scam once. Reports the cost per
+indexed message, the memory the index holds at its size limit and how
+many raid and normal accounts got flagged.
+
+Run from the NinjaBot directory:
+    python -m benchmarks.raidIndex [--per-minute 5000] [--minutes 5]
+"""
+import argparse
+import gc
+import random
+import string
+import time
+import tracemalloc
+from utils.raidIndex import RaidIndex
+from utils.similarity import normalize
+from benchmarks.similarity import SPAM, dodge
+
+# what lots of people say within a couple of minutes without being a raid
+SHORT_REPLIES = ("thanks!", "lol", "same here", "+1", "thank you so much!!", "good morning everyone")
+
+def chatMessage(rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        return rng.choice(SHORT_REPLIES)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(rng.randint(3, 25))]
+    return " ".join(words)
+
+def raidMessage(rng: random.Random, scam: str) -> str:
+    return dodge(rng, scam) + " " + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(0, 4)))
+
+def traffic(rng: random.Random, perMinute: int, minutes: int, raids: int, raidSize: int):
+    """(timestamp, author id, text, is raid) in time order"""
+    total = perMinute * minutes
+    step = 60 / perMinute
+    raidStarts = {rng.randrange(total - raidSize * 3): rng.choice(SPAM) for _ in range(raids)}
+    raiders = {}
+    nextRaider = 10 ** 9
+    for i in range(total):
+        if i in raidStarts:
+            for _ in range(raidSize):
+                raiders[nextRaider] = raidStarts[i]
+                nextRaider += 1
+        if raiders and rng.random() < 0.3:
+            uid = next(iter(raiders))
+            yield i * step, uid, raidMessage(rng, raiders.pop(uid)), True
+        else:
+            yield i * step, rng.randrange(2000), chatMessage(rng), False
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-minute", type=int, default=5000)
+    parser.add_argument("--minutes", type=int, default=5)
+    parser.add_argument("--raids", type=int, default=5)
+    parser.add_argument("--raid-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = [(ts, uid, normalize(text), isRaid) for ts, uid, text, isRaid in traffic(rng, args.per_minute, args.minutes, args.raids, args.raid_size)]
+
+    index = RaidIndex(seed=args.seed)
+    flagged = set()
+    timings = []
+    for mid, (ts, uid, text, _) in enumerate(messages):
+        start = time.perf_counter()
+        flagged |= index.add(text, uid, mid, 2000, ts).keys()
+        timings.append(time.perf_counter() - start)
+
+    # tracing slows everything down, so memory is measured on a separate run
+    index = RaidIndex(seed=args.seed)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    peak = 0
+    for mid, (ts, uid, text, _) in enumerate(messages):
+        index.add(text, uid, mid, 2000, ts)
+        if mid % 1000 == 0:
+            peak = max(peak, tracemalloc.get_traced_memory()[0] - baseline)
+    tracemalloc.stop()
+
+    raiders = {uid for _, uid, _, isRaid in messages if isRaid}
+    timings.sort()
+    total = sum(timings)
+    print(f"messages          {len(messages)} ({args.per_minute}/min for {args.minutes} min)")
+    print(f"throughput        {len(messages) / total:,.0f} msgs/s ({len(messages) / total * 60:,.0f} msgs/min)")
+    print(f"p50 / p99         {timings[len(timings) // 2] * 1e6:.1f} / {timings[int(len(timings) * 0.99)] * 1e6:.1f} us")
+    print(f"index entries     {len(index)} (limit {index.maxEntries})")
+    print(f"peak memory       {peak / 1024:,.0f} KiB ({peak / max(1, len(index)):,.0f} B/entry)")
+    print(f"raiders flagged   {len(flagged & raiders)}/{len(raiders)}")
+    print(f"normal flagged    {len(flagged - raiders)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Anti-spam message comparison, strsimpy SIFT4 vs the bounded comparator
+
+Compares timing and how many pairs get flagged (distance <= 1) on a few
+spam and chat corpora. strsimpy is optional, without it only the bounded
+comparator is measured.
+
+Run from the NinjaBot directory:
+    python -m benchmarks.similarity [--pairs 2000]
+"""
+import argparse
+import random
+import string
+import time
+from utils.similarity import boundedDistance, normalize
+
+try:
+    from strsimpy import SIFT4
+except ImportError:
+    SIFT4 = None
+
+SPAM = (
+    "FREE NITRO for everyone >> https://dlscord-gift.com/claim",
+    "@everyone check out my new stream https://twitch.tv/somebody",
+    "Hey I'm giving away my steam account, dm me",
+    "18+ content here discord.gg/xxxxxx",
+)
+CHAT = (
+    "hey, how do I share my screen in vdo ninja?",
+    "my camera is black in obs, any idea?",
+    "is there a way to lower the bitrate for guests?",
+    "thanks, that worked!",
+    "which browser works best for the director view?",
+    "does &push work with the android app?",
+)
+
+def words(rng: random.Random, length: int) -> str:
+    out = []
+    while sum(map(len, out)) + len(out) < length:
+        out.append("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))))
+    return " ".join(out)[:length]
+
+def oneEdit(rng: random.Random, text: str) -> str:
+    pos = rng.randrange(len(text))
+    return text[:pos] + rng.choice(string.ascii_letters) + text[pos + 1:]
+
+def dodge(rng: random.Random, text: str) -> str:
+    """What spammers do to get past exact matching"""
+    out = []
+    for c in text:
+        out.append(c.upper() if rng.random() < 0.3 else c)
+        if rng.random() < 0.1:
+            out.append(rng.choice("\u200b\u200c\u200d\u2060"))
+        if c == " " and rng.random() < 0.3:
+            out.append(" ")
+    return "".join(out)
+
+def corpora(rng: random.Random, pairs: int) -> dict[str, list[tuple[str, str]]]:
+    spam = lambda: rng.choice(SPAM)
+    longText = [words(rng, 2000) for _ in range(20)]
+    return {
+        "identical spam": [(s, s) for s in (spam() for _ in range(pairs))],
+        "one edit spam": [(s, oneEdit(rng, s)) for s in (spam() for _ in range(pairs))],
+        "dodged spam": [(s, dodge(rng, s)) for s in (spam() for _ in range(pairs))],
+        "normal chat": [(rng.choice(CHAT), rng.choice(CHAT)) for _ in range(pairs)],
+        "2k unrelated": [(rng.choice(longText), words(rng, 2000)) for _ in range(pairs // 10)],
+        "2k one edit": [(t, oneEdit(rng, t)) for t in (rng.choice(longText) for _ in range(pairs // 10))],
+    }
+
+def timeIt(compare, pairs: list[tuple[str, str]]) -> tuple[float, float]:
+    """microseconds per comparison and share of pairs flagged as too close"""
+    flagged = 0
+    start = time.perf_counter()
+    for a, b in pairs:
+        if compare(a, b) <= 1:
+            flagged += 1
+    return (time.perf_counter() - start) / len(pairs) * 1e6, flagged / len(pairs)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sift = SIFT4() if SIFT4 else None
+    comparators = {}
+    if sift:
+        comparators["sift4"] = sift.distance
+    comparators["bounded"] = lambda a, b: boundedDistance(a, b, 1)
+    # the cog keeps the normalized last message, so only the new one gets normalized per message
+    comparators["bounded+norm"] = lambda a, b: boundedDistance(a, normalize(b), 1)
+    if not sift:
+        print("strsimpy is not installed, skipping SIFT4\n")
+
+    print(f"{'corpus':<16}" + "".join(f"{name + ' us':>18}{name + ' hit':>18}" for name in comparators))
+    for name, pairs in corpora(random.Random(args.seed), args.pairs).items():
+        row = f"{name:<16}"
+        for compare in comparators.values():
+            if compare is comparators.get("bounded+norm"):
+                pairs = [(normalize(a), b) for a, b in pairs]
+            us, hit = timeIt(compare, pairs)
+            row += f"{us:>18.2f}{hit:>18.0%}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
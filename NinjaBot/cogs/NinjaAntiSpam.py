@@ -1,74 +1,112 @@
 import logging
 import discord
 import utils.embedBuilder as embedBuilder
-import re
-from asyncio import sleep
+import asyncio
+import time
 from discord.ext import commands, tasks
 from discord import DMChannel
 from datetime import datetime, timedelta
-from strsimpy import SIFT4
+from utils.messageDispatch import messageListener, MessageEnvelope
+from utils.metrics import REGISTRY, timedLoop
+from utils.actionQueue import Priority
+from utils.spamState import UserState, RateWindow
+from utils.timingWheel import TimingWheel
+from utils.similarity import boundedDistance, normalize
+from utils.raidIndex import RaidIndex
+from utils.contentRules import ContentRules
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
+TRACKED_USERS = REGISTRY.gauge("ninjabot_antispam_tracked_users", "Users currently tracked by anti-spam")
+EVICTED_USERS = REGISTRY.counter("ninjabot_antispam_evicted_users_total", "Users dropped from anti-spam tracking after being idle")
+RAID_MEMBERS = REGISTRY.counter("ninjabot_antispam_raid_members_total", "Users cleaned up as part of a cross-account raid")
+RATE_LIMITED = REGISTRY.counter("ninjabot_antispam_rate_limited_total", "Messages that raised abuse for being posted too fast", ("scope",))
+RAID_INDEX_SIZE = REGISTRY.gauge("ninjabot_antispam_raid_index_entries", "Messages currently held in the raid index")
+
+# how much of every message is remembered for the spam report
+REPORT_TEXT_LIMIT = 1000
+# abuse score at which a user gets kicked
+KICK_ABUSE = 3
+
 class NinjaAntiSpam(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = True
-        self.s = SIFT4()
-        self.h = {}
+        self.h: dict[int, UserState] = {}
+        antiSpamConfig = self.bot.config.get("antiSpam") or {}
+        # how many messages per user are remembered for cleanup
+        self.historySize = int(antiSpamConfig.get("historySize", 50))
+        # compare messages ignoring case, whitespace and zero-width characters
+        self.normalize = bool(antiSpamConfig.get("normalize", True))
+        # users are forgotten this many seconds after their last (non spam) message
+        self.expiry = TimingWheel(float(antiSpamConfig.get("historyTtl", 60)))
+        # patterns that get a message deleted or warned about, see utils.contentRules for the defaults
+        self.contentRules = ContentRules.fromConfig(antiSpamConfig.get("contentRules"))
+        # posting speed, per user and per channel, counted over a sliding window
+        rateConfig = antiSpamConfig.get("rate") or {}
+        self.rateWindow = float(rateConfig.get("window", 10))
+        self.rateBuckets = int(rateConfig.get("buckets", 10))
+        # more messages than this within the window raise abuse
+        self.userRateLimit = int(rateConfig.get("userLimit", 10))
+        # while a channel gets more messages than channelLimit, users are already limited at floodUserLimit
+        self.channelRateLimit = int(rateConfig.get("channelLimit", 30))
+        self.floodUserRateLimit = int(rateConfig.get("floodUserLimit", 5))
+        self.rateAbuse = float(rateConfig.get("abuse", 1))
+        self.channelRates: dict[int, RateWindow] = {}
+        # near identical messages from many different accounts within a short window are a raid
+        raidConfig = antiSpamConfig.get("raid") or {}
+        self.raidIndex = RaidIndex.fromConfig(raidConfig) if raidConfig.get("enabled", True) else None
+        # by default raid messages are only deleted and reported, people pasting the same error during an outage look alike too
+        self.raidKick = bool(raidConfig.get("kick", False))
+        # running raid cleanups, referenced so they aren't garbage collected halfway
+        self.raidCleanups: set[asyncio.Task] = set()
         self.historyCleanupJob.start()
         # self.botlogCleanupJob.start() disabled for now
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
+    # ignore messages by bots, moderators and system messages
+    @messageListener(allowDM=False, userMessagesOnly=True, skipModerators=True)
+    async def handleMessage(self, env: MessageEnvelope) -> None:
         """For anti-spam purposes we don't care if it's a command or normal message"""
-        if message.author == self.bot.user \
-            or message.author.bot \
-            or isinstance(message.channel, discord.DMChannel) \
-            or (hasattr(message.author, "roles") and discord.utils.get(getattr(message.author, "roles"), name="Moderator")) \
-            or not (message.type == discord.MessageType.default \
-            or message.type == discord.MessageType.reply):
-            # ignore messages by bots, moderators and system messages
-            return
-    
+        message = env.message
+
         # use message text itself or the filename as the message
         if message.content:
-            msg = message.content
+            msg = reportText = message.content
         elif message.attachments:
             msg = message.attachments[0].filename
+            reportText = f"{msg} <{message.attachments[0].url}>"
         else:
-            msg = ""
+            msg = reportText = ""
+        # kept for the spam report, so the messages don't have to be fetched again before deleting them
+        reportText = reportText[:REPORT_TEXT_LIMIT]
     
+        key = normalize(msg) if self.normalize else msg
         now = datetime.now().timestamp()
-        uid = message.author.id
+        uid = env.authorId
         abuseInc = 0
-        current_channel = message.channel.id
+        current_channel = env.channelId
     
-        if not uid in self.h:
+        user = self.h.get(uid)
+        if user is None:
             # user is not currently in our message buffer, add them
             # also can't judge in here if it's spam or not
-            self.h[uid] = dict()
-            self.h[uid]["lm"] = msg
-            self.h[uid]["lmts"] = now
-            self.h[uid]["abuse"] = 0
-            self.h[uid]["msgs"] = [[message.id, message.channel.id]]
-            self.h[uid]["channels"] = [current_channel]  # Track channels
-            logger.debug(f"built new user {str(uid)}/{str(message.author)} object {self.h[uid]}")
+            user = self.h[uid] = UserState(msg, key, now, self.historySize, self.rateWindow, self.rateBuckets)
+            self.expiry.touch(uid, time.monotonic())
+            user.messages.append(message.id, current_channel, reportText)
+            user.channels.add(current_channel)
+            logger.debug("built new user %s/%s object %s", uid, message.author, user)
         else:
             # user has posted their 2nd+ message
-            self.h[uid]["msgs"].append([message.id, message.channel.id])
-            
-            # Add current channel to user's channel list if not already present
-            if current_channel not in self.h[uid]["channels"]:
-                self.h[uid]["channels"].append(current_channel)
+            user.messages.append(message.id, current_channel, reportText)
+            user.channels.add(current_channel)
     
-            # calculate message distance using sift4
-            dist = self.s.distance(self.h[uid]["lm"], msg)
-            logger.debug(f"sift4 distance: {dist}")
+            # only distances 0 and 1 matter, so stop comparing as soon as it's above that
+            dist = boundedDistance(user.lastKey, key, 1)
+            logger.debug("message distance: %s", dist)
             
             # Only increment abuse if posting in DIFFERENT channels
-            if len(self.h[uid]["channels"]) > 1:
+            if len(user.channels) > 1:
                 if dist == 0:
                     # messages are way too close
                     abuseInc = 1.5
@@ -76,69 +114,109 @@ class NinjaAntiSpam(commands.Cog):
                     # messages are too close
                     abuseInc = 1
             
-            if self.h[uid]["abuse"] < 3: # it is not spam (at least yet)
-                self.h[uid]["lmts"] = now
-                self.h[uid]["lm"] = msg
-
-        # filter discord invite links no matter what the sift4 distance is
-        if len(re.findall(r"(?:https?://)?(www\.)?(?:discord(?:app)?\.(?:gg|io|me|li|com))/(?!channels/)\S{,20}", message.content)):
-            logger.info("Discord invite link found, deleting message")
-            abuseInc = 1.5 # increase the abuse count (more then for a normal message)
-            self.h[uid]["msgs"].pop() # remove last saved message since we already delete them here
-            if not isinstance(message.channel, DMChannel):
-                await message.delete()
-
-            botmsg = await message.channel.send(f"Hey there {message.author.mention}, any discord (invite) links are not allowed here! Repeated posts may lead to moderation actions!")
-            await sleep(4)
-            if not isinstance(botmsg.channel, DMChannel):
-                await botmsg.delete()
+            if user.abuse < KICK_ABUSE: # it is not spam (at least yet)
+                user.lastSeen = now
+                user.lastMessage = msg
+                user.lastKey = key
+                self.expiry.touch(uid, time.monotonic())
 
-        # find stream keys in messages and delete them for safetly
-        # right now we have youtube and twitch
-        if len(re.findall(r"(?:live_\d{8}_[a-zA-Z0-9]{32})|(?:[a-z0-9]{4}-){4}[a-z0-9]{4}", message.content)):
-            logger.info("Streamkey was found in message, deleting for safety")
-            if not isinstance(message.channel, DMChannel):
-                await message.delete()
+        # check the message against everyone's recent messages
+        raidCluster = {}
+        if self.raidIndex and key:
+            raidCluster = self.raidIndex.add(key, uid, message.id, current_channel, time.monotonic(), reportText)
+        if raidCluster:
+            # kicking and purging a whole cluster takes a while, the next messages must not wait for it
+            task = asyncio.create_task(self.cleanupRaid(message.guild, raidCluster), name="NinjaBot: raid cleanup")
+            self.raidCleanups.add(task)
+            task.add_done_callback(self.raidCleanups.discard)
+            if uid in raidCluster:
+                return
 
-            botmsg = await message.channel.send(f"Hey there {message.author.mention}, there was a stream key found in your last message. "
-                                                "For your safety the message was deleted. You can post your message again without doxing yourself ;)")
-            await sleep(12)
-            if not isinstance(botmsg.channel, DMChannel):
-                await botmsg.delete()
+        # invites, stream keys and other leaks, no matter what the message distance is
+        rule = self.contentRules.match(message.content)
+        if rule:
+            logger.info("Content rule %s matched, %s", rule.name, "deleting message" if rule.delete else "not deleting")
+            abuseInc = max(abuseInc, rule.abuse)
+            if rule.delete:
+                user.messages.remove(message.id) # forget the message since we already delete it here
+                if not isinstance(message.channel, DMChannel):
+                    await self.bot.actionQueue.delete(message, priority=Priority.MODERATION)
+            if rule.warn:
+                botmsg = await self.bot.actionQueue.send(message.channel, rule.warn.replace("{mention}", message.author.mention))
+                if rule.warnLifetime and not isinstance(botmsg.channel, DMChannel):
+                    self.bot.deletionScheduler.schedule(botmsg, rule.warnLifetime)
 
-        self.h[uid]["abuse"] += abuseInc
+        if abuseInc > 0:
+            user.spamSignal = True
+        abuseInc += self.rateScore(user, current_channel)
+        user.abuse += abuseInc
+        if not user.spamSignal:
+            # posting fast alone never gets anyone kicked, it only makes the next duplicate or rule match count
+            user.abuse = min(user.abuse, KICK_ABUSE - 1)
         if abuseInc > 0: 
-            logger.debug(f"user {self.h[uid]} increased abuse count by {abuseInc} to {self.h[uid]['abuse']}")
-        if self.h[uid]["abuse"] >= 3: # too much spam
+            logger.debug("user %s increased abuse count by %s to %s", uid, abuseInc, user.abuse)
+        if user.abuse >= KICK_ABUSE: # too much spam
             logger.info("starting spam cleanup")
             await self.cleanupMember(message.author)
 
+    def rateScore(self, user: UserState, channelId: int) -> float:
+        """Count the message for the user and channel, returns the abuse it adds for posting too fast
+
+        Staying above the limit only adds abuse once per window.
+        """
+        now = time.monotonic()
+        channelRate = self.channelRates.get(channelId)
+        if channelRate is None:
+            channelRate = self.channelRates[channelId] = RateWindow(self.rateWindow, self.rateBuckets)
+        userCount = user.rate.add(now)
+        channelCount = channelRate.add(now)
+        if userCount > self.userRateLimit:
+            RATE_LIMITED.inc("user")
+        elif channelCount > self.channelRateLimit and userCount > self.floodUserRateLimit:
+            RATE_LIMITED.inc("channel")
+        else:
+            return 0
+        if user.rateLimitedAt is not None and now - user.rateLimitedAt < self.rateWindow:
+            return 0
+        user.rateLimitedAt = now
+        logger.debug("rate limit hit, %s messages by user and %s in channel %s", userCount, channelCount, channelId)
+        return self.rateAbuse
+
     # function to (kick a member and) cleanup their messages
-    async def cleanupMember(self, author, kick=True) -> None:
-        botlogCh = self.bot.get_channel(int(self.bot.config.get("botlogChannel")))
+    async def cleanupMember(self, author, kick=True, messages=()) -> None:
+        """'messages' are (message id, channel id, text) entries to delete besides the recorded history"""
+        botlogCh = self.bot.get_channel(self.bot.config.snapshot.botlogChannel)
 
         if kick:
             try:
-                await author.kick(reason="Spam")
-                logger.warn(f"{author} has been kicked for spam")
-                await botlogCh.send(f"{author} has been kicked for spam. Spam Report:")
+                await self.bot.actionQueue.run(("kick", author.guild.id), lambda: author.kick(reason="Spam"), Priority.MODERATION, "kick")
+                logger.warn("%s has been kicked for spam", author)
+                await self.bot.actionQueue.send(botlogCh, f"{author} has been kicked for spam. Spam Report:")
             except Exception as E:
-                logger.warn(f"Could not kick user {str(author)}")
+                logger.warn("Could not kick user %s", author)
 
+        messages = list(messages)
         while True:
             try:
                 if author.id in self.h:
-                    userData = self.h[author.id].copy()
-                    del self.h[author.id]
-                    if userData["msgs"]:
-                        await self.deleteOldMessages(userData["msgs"], botlogCh)
-                    elif userData["lm"]:
+                    userData = self.h.pop(author.id)
+                    self.expiry.discard(author.id)
+                    recorded = list(userData.messages)
+                    known = {mid for mid, _, _ in recorded}
+                    recorded += [entry for entry in messages if entry[0] not in known]
+                    messages = []
+                    if recorded:
+                        await self.deleteOldMessages(recorded, botlogCh)
+                    elif userData.lastMessage:
                         # if we don't have message history (aka there is nothing to cleanup), only post the last message we saved
-                        await self.sendReport(botlogCh, userData["lm"])
+                        await self.sendReport(botlogCh, [userData.lastMessage])
                     else:
-                        await self.sendReport(botlogCh, "No History available")
+                        await self.sendReport(botlogCh, ["No History available"])
                     logger.debug(userData)
-                    await sleep(2)
+                elif messages:
+                    # the history is gone already, but the messages are still known
+                    await self.deleteOldMessages(messages, botlogCh)
+                    messages = []
                 else:
                     break
             except Exception as E:
@@ -146,41 +224,66 @@ class NinjaAntiSpam(commands.Cog):
                 break
         logger.debug("cleanupMember() done")
 
-    async def deleteOldMessages(self, msgs, botlogCh) -> None:
-        blMsg = line = ""
-        for mid, chid in msgs:
+    async def cleanupRaid(self, guild, cluster) -> None:
+        """Cleanup (and kick) every member of a raid cluster at once, including the raid messages the history no longer has"""
+        logger.warning("Raid detected, cleaning up %s users", len(cluster))
+        RAID_MEMBERS.inc(amount=len(cluster))
+        if not self.raidKick:
+            botlogCh = self.bot.get_channel(self.bot.config.snapshot.botlogChannel)
             try:
-                spamChannel = self.bot.get_channel(chid)
-                msg = await spamChannel.fetch_message(mid)
-                # text message beats attachments
-                if msg.attachments:
-                    line = f"{msg.channel.name}: {msg.attachments[0].filename} <{msg.attachments[0].url}>"
-                if msg.content:
-                    line = f"{msg.channel.name}: {msg.content}"
-                logger.warning(line)
-                await msg.delete()
-                if len(blMsg) + len(line) > 4090:
-                    await self.sendReport(botlogCh, blMsg)
-                    blMsg = line
-                else:
-                    blMsg += line + "\n"
+                await self.bot.actionQueue.send(botlogCh, f"Raid detected, deleting the messages of {len(cluster)} users. Spam Report:")
             except Exception as E:
                 logger.exception(E)
-        await self.sendReport(botlogCh, blMsg)
-    
-    async def sendReport(self, ch, msg) -> None:
-        await ch.send(embed=embedBuilder.ninjaEmbed(description=msg[:4096].rstrip()))
+        cleanups = []
+        for authorId, entries in cluster.items():
+            messages = [(entry.messageId, entry.channelId, entry.report) for entry in entries]
+            member = guild.get_member(authorId)
+            if member:
+                cleanups.append(self.cleanupMember(member, kick=self.raidKick, messages=messages))
+            else:
+                # already gone, only their messages are left to remove
+                cleanups.append(self.cleanupMember(discord.Object(authorId), kick=False, messages=messages))
+        await asyncio.gather(*cleanups)
 
-    # use task to cleanup old user objects
-    @tasks.loop(minutes=2)
+    async def deleteOldMessages(self, msgs, botlogCh) -> None:
+        """Delete the recorded messages channel by channel and report them from what was recorded"""
+        byChannel: dict[int, list[int]] = {}
+        lines = []
+        for mid, chid, text in msgs:
+            byChannel.setdefault(chid, []).append(mid)
+            channel = self.bot.get_channel(chid)
+            line = f"{channel.name if channel else chid}: {text}"
+            logger.warning(line)
+            lines.append(line)
+        # the queue runs channels in parallel and keeps the deletes ahead of everything else
+        results = await asyncio.gather(*(self._purgeChannel(chid, mids) for chid, mids in byChannel.items()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.exception(result)
+        await self.sendReport(botlogCh, lines)
+
+    async def _purgeChannel(self, chid, mids) -> None:
+        channel = self.bot.get_channel(chid) or self.bot.get_partial_messageable(chid)
+        await self.bot.actionQueue.purge(channel, mids, priority=Priority.MODERATION)
+
+    async def sendReport(self, ch, lines: list[str]) -> None:
+        for embeds in embedBuilder.reportPages(lines):
+            await self.bot.actionQueue.send(ch, embeds=embeds)
+
+    # forget users once they have been idle for the configured time
+    @tasks.loop(seconds=1)
+    @timedLoop
     async def historyCleanupJob(self) -> None:
-        logger.debug("Running antispam history-cleanup job")
-        logger.debug(f"self.h before history-cleanup: {self.h}")
-        now = datetime.now().timestamp()
-        for uid, d in self.h.copy().items():
-            if now - d["lmts"] > 60:
-                del self.h[uid]
-        logger.debug(f"self.h after history-cleanup: {self.h}")
+        expired = self.expiry.advance(time.monotonic())
+        for uid in expired:
+            self.h.pop(uid, None)
+        TRACKED_USERS.set(len(self.h))
+        if self.raidIndex:
+            self.raidIndex.expire(time.monotonic())
+            RAID_INDEX_SIZE.set(len(self.raidIndex))
+        if expired:
+            EVICTED_USERS.inc(amount=len(expired))
+            logger.debug("Evicted %s users from anti-spam history, %s still tracked", len(expired), len(self.h))
 
     @historyCleanupJob.before_loop
     async def before_historyCleanupJob(self) -> None:
@@ -188,9 +291,10 @@ class NinjaAntiSpam(commands.Cog):
 
     # cleanup old message in botlog channel
     @tasks.loop(hours=12)
+    @timedLoop
     async def botlogCleanupJob(self) -> None:
         logger.debug("Running botlog channel cleanup job")
-        botlogChannel = self.bot.get_channel(int(self.bot.config.get("botlogChannel")))
+        botlogChannel = self.bot.get_channel(self.bot.config.snapshot.botlogChannel)
         async for message in botlogChannel.history(limit=300, before=datetime.today()-timedelta(days=30)):
             if message.author == self.bot.user and "has been kicked" not in message.content:
                 await message.delete()
@@ -205,7 +309,7 @@ class NinjaAntiSpam(commands.Cog):
         return []
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
         self.historyCleanupJob.cancel()
         self.botlogCleanupJob.cancel()
 
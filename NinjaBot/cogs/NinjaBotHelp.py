@@ -7,7 +7,7 @@ logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaBotHelp(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = True
 
@@ -31,7 +31,7 @@ class NinjaBotHelp(commands.Cog):
         return [c.name for c in self.get_commands()]
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaBotHelp(bot))
\ No newline at end of file
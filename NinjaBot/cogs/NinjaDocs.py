@@ -3,7 +3,6 @@ import utils.embedBuilder as embedBuilder
 import re
 import asyncio
 import json
-import aiohttp
 import discord
 import time
 from discord import app_commands
@@ -16,10 +15,10 @@ logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaDocs(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = False
-        self.http = aiohttp.ClientSession()
+        self.http = bot.httpService
         self.ninjaDocsBaseUrl = "https://docs.vdo.ninja/"
         self.gbBaseUrl = "https://api.gitbook.com/v1/"
         self.gbHeaders = {
@@ -29,7 +28,7 @@ class NinjaDocs(commands.Cog):
 
     @staticmethod
     def _checkIfInATEC(interaction: discord.Interaction) -> bool:
-        return str(interaction.channel_id) not in interaction.client.config.get("autoThreadEnabledChannels")
+        return interaction.channel_id not in interaction.client.config.snapshot.autoThreadChannels
 
     # app command for manually asking questions to gitbook lens
     @app_commands.command()
@@ -89,7 +88,7 @@ class NinjaDocs(commands.Cog):
 
         # questions need to be at least 15 characters long
         if not len(message) > 15: return None
-        logger.debug(f"Question: {message}")
+        logger.debug("Question: %s", message)
 
         # query lens
         answer = {}
@@ -146,10 +145,10 @@ class NinjaDocs(commands.Cog):
             # and cache is no older then 7 days
             if time.time() - self.urlCache[pageKey][0] > 7*86400:
                 # remove from cache
-                logger.debug(f"removed {str(self.urlCache[pageKey])} from cache because of age")
+                logger.debug("removed %s from cache because of age", self.urlCache[pageKey])
                 self.urlCache.pop(pageKey)
             else:
-                logger.debug(f"returning from cache {pageKey} -> {str(self.urlCache[pageKey])}")
+                logger.debug("returning from cache %s -> %s", pageKey, self.urlCache[pageKey])
                 return self.urlCache[pageKey][1]
 
         # it's not in cache, run request
@@ -158,7 +157,7 @@ class NinjaDocs(commands.Cog):
             pageUrl = self.ninjaDocsBaseUrl + pageResponse["path"] + self.resolveSectionIdToAnchor(pageResponse, pageSelection)
             # save to cache
             self.urlCache.update({pageKey: (int(time.time()), pageUrl)})
-            logger.debug(f"returning from api {pageKey} -> {pageUrl}")
+            logger.debug("returning from api %s -> %s", pageKey, pageUrl)
             return pageUrl
         return None
 
@@ -174,7 +173,7 @@ class NinjaDocs(commands.Cog):
     # perform a get request to the gitbook api
     async def doGbGetApiRequest(self, endpoint: str, params: dict | None = None) -> dict | None:
         try:
-            async with self.http.get(self.gbBaseUrl + endpoint, params=params, headers=self.gbHeaders) as resp:
+            async with self.http.get(self.gbBaseUrl + endpoint, cog=type(self).__name__, params=params, headers=self.gbHeaders) as resp:
                 apiResponse = await resp.json(content_type="application/json")
                 if resp.status == 200: return apiResponse
                 return None
@@ -185,14 +184,14 @@ class NinjaDocs(commands.Cog):
     # perform a post request to the gitbook api
     async def doGbPostApiRequest(self, endpoint: str, data: dict) -> dict | None:
         try:
-            async with self.http.post(self.gbBaseUrl + endpoint, json=data, headers=self.gbHeaders) as resp:
+            async with self.http.post(self.gbBaseUrl + endpoint, cog=type(self).__name__, json=data, headers=self.gbHeaders) as resp:
                 apiResponse = await resp.json(content_type=None)
-                logger.debug(await resp.text())
-                logger.info(f"'status code': '{resp.status}', "\
-                            f"'content_type': '{resp.content_type}', "\
-                            f"'X-Ratelimit-Limit': '{resp.headers.get('X-Ratelimit-Limit')}', "\
-                            f"'X-Ratelimit-Remaining': '{resp.headers.get('X-Ratelimit-Remaining')}', "\
-                            f"'X-Ratelimit-Reset': '{resp.headers.get('X-Ratelimit-Reset')}'")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(await resp.text())
+                logger.info("'status code': '%s', 'content_type': '%s', "\
+                            "'X-Ratelimit-Limit': '%s', 'X-Ratelimit-Remaining': '%s', 'X-Ratelimit-Reset': '%s'",
+                            resp.status, resp.content_type, resp.headers.get('X-Ratelimit-Limit'),
+                            resp.headers.get('X-Ratelimit-Remaining'), resp.headers.get('X-Ratelimit-Reset'))
                 # logger.debug(json.dumps(apiResponse, indent=2))
                 if resp.status == 200: return apiResponse
                 return None
@@ -209,7 +208,7 @@ class NinjaDocs(commands.Cog):
         return []
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaDocs(bot))
\ No newline at end of file
@@ -2,25 +2,22 @@ import logging
 import pathlib
 from re import S
 from discord.ext import commands, tasks
-from utils.commandReplyProcessor import commandProc
 from utils.jsonFile import fileHelper
+from utils.roleIndex import moderatorOnly
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaDynCmds(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = False
         self._fh = fileHelper(pathlib.Path(__file__).parent.resolve() / "../suggestions.json")
         self.commands = {}
         self.loadCommands.start()
 
-    async def process_command(self, ctx) -> bool:
-        return await commandProc(self, ctx)
-
     @commands.command(hidden=True, aliases=["addcom"])
-    @commands.has_role("Moderator")
+    @moderatorOnly()
     async def add(self, ctx: commands.Context, command: str, reply: str, *args) -> None:
         """Command to dynamically add a command to the bot. Should not be used (but works)."""
         if args:
@@ -38,7 +35,7 @@ class NinjaDynCmds(commands.Cog):
             await ctx.send(f"Command '{command}' with reply '{reply}' has been added")
 
     @commands.command(hidden=True, aliases=["delcom"])
-    @commands.has_role("Moderator")
+    @moderatorOnly()
     async def delete(self, ctx: commands.Context, command: str) -> None:
         if command in self.commands:
             del self.commands[command]
@@ -60,6 +57,7 @@ class NinjaDynCmds(commands.Cog):
     async def _loadFromFile(self) -> None:
         logger.debug("Loading dyn cmds from file")
         self.commands = await self._fh.read()
+        self.bot.commandRegistry.setSource("dyncmds", self.commands)
 
     async def _saveToFile(self) -> None:
         logger.debug("Saving dyn cmds to file")
@@ -75,8 +73,9 @@ class NinjaDynCmds(commands.Cog):
         return list(self.commands.keys())
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
         self.loadCommands.cancel()
+        self.bot.commandRegistry.removeSource("dyncmds")
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaDynCmds(bot))
\ No newline at end of file
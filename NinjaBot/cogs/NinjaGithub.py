@@ -1,13 +1,12 @@
 import logging
-import aiohttp
 from discord.ext import commands, tasks
-from utils.commandReplyProcessor import commandProc
+from utils.metrics import timedLoop
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaGithub(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = False
         self.githubUrl = self.bot.config.get("githubUrl")
@@ -16,19 +15,17 @@ class NinjaGithub(commands.Cog):
 
     async def fetchCommands(self) -> None:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.githubUrl) as resp:
-                    self.commands = await resp.json(content_type="text/plain")
+            async with self.bot.httpService.get(self.githubUrl, cog=type(self).__name__) as resp:
+                self.commands = await resp.json(content_type="text/plain")
+            self.bot.commandRegistry.setSource("github", self.commands)
         except Exception as E:
             raise E
         else:
             logger.debug("Sucessfully loaded commands from github")
             #logger.debug(json.dumps(self.commands, indent=2, sort_keys=True))
 
-    async def process_command(self, ctx) -> bool:
-        return await commandProc(self, ctx)
-
     @tasks.loop(hours=1)
+    @timedLoop
     async def regularUpdater(self) -> None:
         logger.debug("Regular github update started")
         await self.fetchCommands()
@@ -38,8 +35,9 @@ class NinjaGithub(commands.Cog):
         return list(self.commands.keys())
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
         self.regularUpdater.cancel()
+        self.bot.commandRegistry.removeSource("github")
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaGithub(bot))
\ No newline at end of file
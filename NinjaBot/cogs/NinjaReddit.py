@@ -1,18 +1,24 @@
 import logging
-import asyncpraw
 import utils.embedBuilder as embedBuilder
 import re
 from discord.ext import commands, tasks
 from discord import Colour
-from asyncio import sleep
+from utils.lazyImport import importModule
+from utils.metrics import timedLoop
+from utils.actionQueue import Priority
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaReddit(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = True
+        self.Reddit = None
+
+    async def cog_load(self) -> None:
+        # asyncpraw is heavy, only import it when the cog actually gets loaded
+        asyncpraw = await importModule("asyncpraw")
         self.Reddit = asyncpraw.Reddit(
             client_id=self.bot.config.get("redditClientId"),
             client_secret=self.bot.config.get("redditClientSecret"),
@@ -21,11 +27,12 @@ class NinjaReddit(commands.Cog):
         self.redditChecker.start()
 
     @tasks.loop(minutes=5)
+    @timedLoop
     async def redditChecker(self) -> None:
         logger.debug("Running reddit checker")
         try:
             postedSubmissions = self.bot.config.get("redditPostedSubmissions") or []
-            logger.debug(f"Posted submissions so far: '{postedSubmissions}'")
+            logger.debug("Posted submissions so far: '%s'", postedSubmissions)
             toPostSubmissions = []
             # get subreddit and submissions
             ninjaSubreddit = await self.Reddit.subreddit("VDONinja")
@@ -47,11 +54,10 @@ class NinjaReddit(commands.Cog):
             # post all open submissions
             logger.debug(toPostSubmissions)
             try:
-                redditChannel = self.bot.get_channel(int(self.bot.config.get("redditChannel")))
+                redditChannel = self.bot.get_channel(self.bot.config.snapshot.redditChannel)
                 for submission in toPostSubmissions:
-                    await redditChannel.send(embed=self._formatSubmission(submission))
+                    await self.bot.actionQueue.send(redditChannel, embed=self._formatSubmission(submission), priority=Priority.ANNOUNCEMENT)
                     postedSubmissions.append(submission.id)
-                    await sleep(2) # do some reate limiting ourselfs
             except Exception as E:
                 logger.exception(E)
             finally:
@@ -114,8 +120,10 @@ class NinjaReddit(commands.Cog):
         return []
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
         self.redditChecker.cancel()
+        if self.Reddit:
+            await self.Reddit.close()
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaReddit(bot))
\ No newline at end of file
@@ -1,14 +1,28 @@
 # NinjaThreadManager.py
+import asyncio
 import logging
 import re
+import time
 import discord
 import utils.embedBuilder as embedBuilder
 import utils.ai as ai
 from discord.ext import commands
 from discord import app_commands
+from utils.ai import AiResponseIncomplete
+from utils.aiScheduler import AiRequestCancelled
+from utils.messageDispatch import messageListener, MessageEnvelope
+from utils.metrics import REGISTRY
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
+AI_FIRST_TOKEN = REGISTRY.histogram("ninjabot_ai_first_token_seconds", "Time until the first part of an AI answer is visible in discord", ("service",))
+AI_PLACEHOLDER = "*NinjaBot is thinking...*"
+# marks an answer that is still being written
+AI_CURSOR = " ▌"
+# appended to an answer the AI service failed to finish
+AI_INCOMPLETE = "\n\n*The answer was cut off by an error, please ask again or wait for human assistance.*"
+AI_DISCLAIMER = "\nThe above response was generated by a Large Language Model, so take it with a grain of salt!"
+
 # The popup modal to rename a thread
 class ThreadTitleChangeModal(discord.ui.Modal, title="Rename Thread"):
     newTitle = discord.ui.TextInput(label="New Title", required=True)
@@ -44,7 +58,7 @@ class ThreadManagementButtons(discord.ui.View):
             and interaction.data.get("custom_id") == "close":
             return True
         # allow moderators to do everything everywhere
-        if hasattr(interaction, "message") and hasattr(interaction.user, "roles") and discord.utils.get(getattr(interaction.user, "roles"), name="Moderator"):
+        if hasattr(interaction, "message") and self.ntm.bot.roleIndex.isModerator(interaction.user.id):
             return True
         await interaction.response.send_message("Sorry, only staff can use this button!", ephemeral=True)
         return False
@@ -76,75 +90,55 @@ class AIReplyButtons(discord.ui.View):
         if hasattr(interaction, "user") and interaction.user.id == self.threadCreationUser:
             return True
         # allow moderators to do everything
-        if hasattr(interaction, "message") and hasattr(interaction.user, "roles") and discord.utils.get(getattr(interaction.user, "roles"), name="Moderator"):
+        if hasattr(interaction, "message") and self.ntm.bot.roleIndex.isModerator(interaction.user.id):
             return True
         await interaction.response.send_message("Sorry, you can't use this button", ephemeral=True)
         return False
 
 class NinjaThreadManager(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = True
         self.ai = ai.NinjaAI(bot)
+        # discord allows about 5 edits per 5 seconds in a channel, stay well below that
+        self.streamEditInterval = float(self.ai.ai_config.get("streamEditInterval", 1.5))
+
+    # Ignore bot messages
+    @messageListener()
+    async def handleMessage(self, env: MessageEnvelope) -> None:
+        message = env.message
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
-        # Ignore bot messages
-        if message.author == self.bot.user or message.author.bot:
-            return
-                
         # Handle reply to bot in an existing thread
-        if isinstance(message.channel, discord.Thread) and message.reference and message.reference.message_id and self.ai:
+        if env.isThread and message.reference and message.reference.message_id and self.ai:
             try:
-                # Get the message being replied to
-                replied_message = await message.channel.fetch_message(message.reference.message_id)
+                # Get the author of the message being replied to, discord usually sends the message along
+                replied_author = await self._getRepliedAuthor(message)
                 
                 # If it's a reply to a bot message, process it for AI response
-                if replied_message.author == self.bot.user:
-                    # Get thread history for context
-                    messages = []
-                    async for msg in message.channel.history(limit=20):
-                        messages.append({
-                            "content": msg.content,
-                            "author": {
-                                "id": msg.author.id,
-                                "bot": msg.author.bot
-                            }
-                        })
-                    messages.reverse()  # Oldest first
+                if replied_author == self.bot.user.id:
+                    # Get thread history for context, oldest first
+                    messages = await self.bot.threadCache.history(message.channel, 20)
                     
                     # Get AI response with channel context
                     channel_id_str = str(message.channel.parent_id)  # Parent channel of the thread
-                    ai_response = await self.ai.get_ai_response(messages, channel_id_str)
-                    
-                    if ai_response:
-                        embed = embedBuilder.ninjaEmbed(description=ai_response)
-                        await message.reply(
-                            embed=embed,
-                            view=AIReplyButtons(self, message.channel.owner_id)
-                        )
+                    await self._streamReply(
+                        lambda **kwargs: self.bot.actionQueue.send(message.channel, reference=message, **kwargs),
+                        messages, channel_id_str, AIReplyButtons(self, message.channel.owner_id),
+                        threadId=message.channel.id, userId=message.author.id
+                    )
                     return
             except Exception as e:
-                logger.exception(f"Error processing reply message: {e}")
+                logger.exception("Error processing reply message: %s", e)
         
         # Handle regular messages in threads - ONLY process initial messages, not any follow-ups
-        if isinstance(message.channel, discord.Thread) and self.ai:
+        if env.isThread and self.ai:
             try:
-                channel_id_str = str(message.channel.parent_id)
+                channel_id_str = str(env.parentId)
                 
-                if self.bot.config.has("aiEnabledChannels") and channel_id_str in self.bot.config.get("aiEnabledChannels"):
-                    # Get all messages in the thread so far
-                    thread_messages = []
-                    async for msg in message.channel.history(limit=10):
-                        thread_messages.append({
-                            "content": msg.content,
-                            "author": {
-                                "id": msg.author.id,
-                                "bot": msg.author.bot
-                            }
-                        })
-                    thread_messages.reverse()  # Convert to oldest first
+                if env.isAiChannel:
+                    # Get all messages in the thread so far, oldest first
+                    thread_messages = await self.bot.threadCache.history(message.channel, 10)
                     
                     # Only respond if this is the first user message after the welcome message
                     # Check message count - if more than 2 (welcome + first message), don't respond automatically
@@ -166,57 +160,44 @@ class NinjaThreadManager(commands.Cog):
                         if not has_ai_response:
                             # Check if we should respond based on message history
                             should_respond = await self.ai.should_respond_with_history(thread_messages, channel_id_str)
-                            logger.info(f"Should respond based on message history: {should_respond}")
+                            logger.info("Should respond based on message history: %s", should_respond)
                             
                             if should_respond:
-                                # Get AI response
-                                ai_response = await self.ai.get_ai_response(thread_messages, channel_id_str)
-                                
-                                if ai_response:
-                                    embed = embedBuilder.ninjaEmbed(description=ai_response)
-                                    await message.channel.send(
-                                        "**Here's what NinjaBot thinks might help with your question:**",
-                                        embed=embed,
-                                        view=AIReplyButtons(self, message.channel.owner_id)
-                                    )
+                                post = lambda **kwargs: self.bot.actionQueue.send(
+                                    message.channel, "**Here's what NinjaBot thinks might help with your question:**", **kwargs)
+                                view = AIReplyButtons(self, message.channel.owner_id)
+                                question = "\n".join(msg.get("content", "") for msg in user_messages)
+                                # Answer known questions from the commands, everything else goes to the AI
+                                if not await self._faqReply(post, question, view):
+                                    await self._streamReply(post, thread_messages, channel_id_str, view,
+                                                            threadId=message.channel.id, userId=message.author.id)
             except Exception as e:
-                logger.exception(f"Error processing thread message: {e}")
-        
-        # Get context for regular message processing (thread creation)
-        ctx = await self.bot.get_context(message)
+                logger.exception("Error processing thread message: %s", e)
         
         # Check if we should create a thread
-        if (not isinstance(ctx.message.channel, discord.DMChannel) 
-            and self.bot.config.has("autoThreadEnabledChannels") 
-            and self.bot.config.has("autoThreadWelcomeMapping") 
-            and str(ctx.channel.id) in self.bot.config.get("autoThreadEnabledChannels")):
+        if not env.isDM and env.isAutoThreadChannel:
 
             # Create thread
             try:
-                createdThread = await ctx.message.create_thread(
-                    name=self._getThreadTitle(ctx.message), 
+                createdThread = await message.create_thread(
+                    name=self._getThreadTitle(message), 
                     auto_archive_duration=10080, 
                     reason=__name__
                 )
                 
                 # Send welcome message
-                welcomeMapping = self.bot.config.get("autoThreadWelcomeMapping")
                 try:
-                    if str(ctx.channel.id) in welcomeMapping:
-                        welcomeText = self.bot.config.get(welcomeMapping[str(ctx.channel.id)])
-                        welcomeText = welcomeText.format(usermention=ctx.message.author.mention)
+                    welcomeText = self.bot.config.snapshot.welcomeTexts.get(env.channelId)
+                    if welcomeText:
+                        welcomeText = welcomeText.format(usermention=message.author.mention)
                         embed = embedBuilder.ninjaEmbed(description=welcomeText)
-                        await createdThread.send(embed=embed, view=ThreadManagementButtons(self, ctx.message.author.id))
+                        await createdThread.send(embed=embed, view=ThreadManagementButtons(self, message.author.id))
                 except Exception as e:
-                    logger.exception(f"Error sending welcome message: {e}")
+                    logger.exception("Error sending welcome message: %s", e)
                 
                 # Add logged in staff to thread
                 try:
-                    # Fix: Get loggedOnSupportStaff without default value
-                    loggedOnSupportStaff = self.bot.config.get("loggedOnSupportStaff")
-                    if loggedOnSupportStaff is None:
-                        loggedOnSupportStaff = []
-                        
+                    loggedOnSupportStaff = self.bot.config.snapshot.loggedOnSupportStaff
                     for staff in loggedOnSupportStaff:
                         user = self.bot.get_user(staff)
                         # if user not in cache, try api request
@@ -224,56 +205,47 @@ class NinjaThreadManager(commands.Cog):
                             user = await self.bot.fetch_user(staff)
                         await createdThread.add_user(user)
                 except Exception as e:
-                    logger.exception(f"Error adding staff to thread: {e}")
+                    logger.exception("Error adding staff to thread: %s", e)
                 
                 # Check if AI should respond in this channel
-                if self.ai and self.bot.config.has("aiEnabledChannels") and ctx.message.content:
-                    # Fix: Get aiEnabledChannels without default value
-                    ai_enabled_channels = self.bot.config.get("aiEnabledChannels")
-                    if ai_enabled_channels is None:
-                        ai_enabled_channels = []
-                        
-                    logger.info(f"Checking if AI should respond in channel: {ctx.channel.id}")
-                    logger.debug(f"AI enabled channels: {ai_enabled_channels}")
+                if self.ai and message.content:
+                    logger.info("Checking if AI should respond in channel: %s", env.channelId)
                     
                     if self.bot.config.has("ai"):
-                        logger.debug(f"AI config: {self.bot.config.get('ai')}")
+                        logger.debug("AI config: %s", self.bot.config.get('ai'))
                     
-                    channel_id_str = str(ctx.channel.id)
-                    logger.info(f"Current channel ID: {channel_id_str}")
-                    logger.info(f"Channel in AI enabled list: {channel_id_str in ai_enabled_channels}")
+                    channel_id_str = str(env.channelId)
+                    logger.info("Channel in AI enabled list: %s", env.isAiChannel)
                     
-                    if channel_id_str in ai_enabled_channels:
+                    if env.isAiChannel:
                         try:
                             # Format message for AI
                             messages = [{
-                                "content": ctx.message.content,
+                                "content": message.content,
                                 "author": {
-                                    "id": ctx.message.author.id,
+                                    "id": message.author.id,
                                     "bot": False
                                 }
                             }]
                             
                             # Check if AI should respond to this message
                             should_respond = await self.ai.should_respond(messages)
-                            logger.info(f"AI should respond: {should_respond}")
+                            logger.info("AI should respond: %s", should_respond)
                             
                             if should_respond:
-                                # Get AI response with channel context
-                                ai_response = await self.ai.get_ai_response(messages, channel_id_str)
-                                
-                                if ai_response:
-                                    ai_response += "\nThe above response was generated by a Large Language Model, so take it with a grain of salt!"
-                                    ai_embed = embedBuilder.ninjaEmbed(description=ai_response)
-                                    await createdThread.send(
-                                        "**Here's what NinjaBot thinks might help with your question. If it answers your question, click the button below or reply for more assistance:**",
-                                        embed=ai_embed,
-                                        view=AIReplyButtons(self, ctx.message.author.id)
-                                    )
+                                post = lambda **kwargs: self.bot.actionQueue.send(
+                                    createdThread,
+                                    "**Here's what NinjaBot thinks might help with your question. If it answers your question, click the button below or reply for more assistance:**",
+                                    **kwargs)
+                                view = AIReplyButtons(self, message.author.id)
+                                # Answer known questions from the commands, otherwise get AI response with channel context
+                                if not await self._faqReply(post, message.content, view):
+                                    await self._streamReply(post, messages, channel_id_str, view, AI_DISCLAIMER,
+                                                            threadId=createdThread.id, userId=message.author.id)
                         except Exception as e:
-                            logger.exception(f"Error in AI response process: {e}")
+                            logger.exception("Error in AI response process: %s", e)
             except Exception as e:
-                logger.exception(f"Error creating thread: {e}")
+                logger.exception("Error creating thread: %s", e)
 
 
     @app_commands.command(description="Change the thread title")
@@ -356,17 +328,8 @@ class NinjaThreadManager(commands.Cog):
             
         await interaction.response.defer()
         
-        # Get thread history for context
-        messages = []
-        async for msg in interaction.channel.history(limit=20):
-            messages.append({
-                "content": msg.content,
-                "author": {
-                    "id": msg.author.id,
-                    "bot": msg.author.bot
-                }
-            })
-        messages.reverse()  # Oldest first
+        # Get thread history for context, oldest first
+        messages = await self.bot.threadCache.history(interaction.channel, 20)
         
         # Add the current question
         messages.append({
@@ -379,17 +342,101 @@ class NinjaThreadManager(commands.Cog):
         
         # Get AI response with channel context
         channel_id_str = str(interaction.channel.parent_id)  # Parent channel of the thread
-        ai_response = await self.ai.get_ai_response(messages, channel_id_str)
+        reply = await self._streamReply(
+            lambda **kwargs: interaction.followup.send(wait=True, **kwargs),
+            messages, channel_id_str, AIReplyButtons(self, interaction.channel.owner_id),
+            threadId=interaction.channel.id, userId=interaction.user.id
+        )
         
-        if ai_response:
-            embed = embedBuilder.ninjaEmbed(description=ai_response)
-            await interaction.followup.send(
-                embed=embed,
-                view=AIReplyButtons(self, interaction.channel.owner_id)
-            )
-        else:
+        if reply is None:
             await interaction.followup.send("Sorry, I couldn't generate a response. Please try again or wait for human assistance.")
 
+    async def _faqReply(self, post, question: str, view: discord.ui.View) -> bool:
+        """Post the command reply answering 'question' if the FAQ index is confident enough, True if it did"""
+        match = self.bot.faqIndex.answer(question)
+        if match is None:
+            return False
+        logger.info("Answering from command %s, confidence %.2f", match.name, match.confidence)
+        await post(embed=embedBuilder.ninjaEmbed(description=match.reply[:embedBuilder.DESCRIPTION_LIMIT]), view=view)
+        return True
+
+    async def _streamReply(self, post, messages: list[dict], channel_id: str, view: discord.ui.View,
+                           footer: str = "", threadId: int | None = None, userId: int | None = None) -> discord.Message | None:
+        """Post a placeholder with post(embed=...) and edit the AI answer into it while it's generated
+
+        Edits are throttled to one per streamEditInterval and run while the
+        answer keeps streaming in, the buttons are added with the final edit.
+        Returns the message, or None if the AI didn't answer or the request was
+        cancelled (superseded by the user's next one, thread closed) and the
+        placeholder was removed again. An answer the AI service failed to
+        finish is marked as cut off, any other error removes the placeholder
+        and is re-raised.
+        """
+        start = time.perf_counter()
+        reply = await post(embed=embedBuilder.ninjaEmbed(description=AI_PLACEHOLDER))
+        try:
+            return await self._editStreamInto(reply, messages, channel_id, view, footer, threadId, userId, start)
+        except Exception:
+            # never leave the placeholder (or a half written answer) behind
+            try:
+                await self.bot.actionQueue.delete(reply)
+            except Exception as E:
+                logger.warning("Could not remove AI placeholder: %s", E)
+            raise
+
+    async def _editStreamInto(self, reply: discord.Message, messages: list[dict], channel_id: str, view: discord.ui.View,
+                              footer: str, threadId: int | None, userId: int | None, start: float) -> discord.Message | None:
+        limit = embedBuilder.DESCRIPTION_LIMIT - len(AI_CURSOR)
+        text = ""
+        visible = False
+        edit: asyncio.Task | None = None
+        lastEdit = 0.0
+        try:
+            async for part in self.ai.stream_ai_response(messages, channel_id, threadId, userId):
+                text += part
+                if not visible:
+                    # the first part goes out right away, that's what the user is waiting for
+                    await self.bot.actionQueue.edit(reply, embed=embedBuilder.ninjaEmbed(description=text[:limit] + AI_CURSOR))
+                    AI_FIRST_TOKEN.observe(time.perf_counter() - start, self.ai.ai_config.get("service", "NONE").upper())
+                    visible = True
+                    lastEdit = time.perf_counter()
+                elif (edit is None or edit.done()) and time.perf_counter() - lastEdit >= self.streamEditInterval:
+                    if edit is not None:
+                        # raises if the last edit failed, e.g. the placeholder was deleted
+                        edit.result()
+                    edit = asyncio.create_task(self.bot.actionQueue.edit(
+                        reply, embed=embedBuilder.ninjaEmbed(description=text[:limit] + AI_CURSOR)))
+                    lastEdit = time.perf_counter()
+            if edit is not None:
+                await edit
+        except AiRequestCancelled as E:
+            logger.info("AI answer in %s cancelled: %s", threadId, E)
+            text = ""
+        except AiResponseIncomplete as E:
+            logger.warning("AI answer in %s is incomplete: %s", threadId, E)
+            footer = AI_INCOMPLETE + footer
+        finally:
+            if edit is not None and not edit.done():
+                edit.cancel()
+        if not text:
+            await self.bot.actionQueue.delete(reply)
+            return None
+        # the marker of an incomplete answer must not be cut off
+        text = text[:embedBuilder.DESCRIPTION_LIMIT - len(footer)] + footer
+        await self.bot.actionQueue.edit(reply, embed=embedBuilder.ninjaEmbed(description=text), view=view)
+        return reply
+
+    async def _getRepliedAuthor(self, message: discord.Message) -> int:
+        """Author id of the message 'message' replies to, only fetched if neither discord nor the cache have it"""
+        reference = message.reference
+        if isinstance(reference.resolved, discord.Message):
+            return reference.resolved.author.id
+        record = self.bot.threadCache.find(message.channel.id, reference.message_id)
+        if record is not None:
+            return record.authorId
+        replied_message = await message.channel.fetch_message(reference.message_id)
+        return replied_message.author.id
+
     async def cog_command_error(self, ctx, error) -> None:
         """Post error that happen inside this cog to channel"""
         await ctx.send(str(error))
@@ -409,9 +456,8 @@ class NinjaThreadManager(commands.Cog):
         return []
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
-        if self.ai:
-            await self.ai.close()
+        logger.debug("Shutting down %s", self.__class__.__name__)
+        self.ai.close()
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaThreadManager(bot))
\ No newline at end of file
@@ -1,28 +1,26 @@
 import logging
 import re
 import discord
-import aiohttp
 import json
 from functools import partial
 from discord.ext import commands
 from datetime import datetime
+from utils.messageDispatch import messageListener, MessageEnvelope
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaUpdates(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = True
-        self.http = aiohttp.ClientSession()
+        self.http = bot.httpService
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
+    @messageListener(allowDM=False, channels="updatesChannel")
+    async def handleMessage(self, env: MessageEnvelope) -> None:
+        message = env.message
         # Check if config options are there and are the expected values
-        if (self.bot.config.has("updatesChannel") \
-            and self.bot.config.has("allowedUpdateUsers") \
-            and message.channel.id == int(self.bot.config.get("updatesChannel")) \
-            and str(message.author.id) in self.bot.config.get("allowedUpdateUsers")) \
+        if env.authorId in self.bot.config.snapshot.allowedUpdateUsers \
             and self.bot.config.has("githubApiKey") \
             and self.bot.config.has("githubGistId"):
 
@@ -33,7 +31,7 @@ class NinjaUpdates(commands.Cog):
 
             try:
                 # get latest gist raw url from github api
-                async with self.http.get(f"https://api.github.com/gists/{self.bot.config.get('githubGistId')}", headers=ghHeaders) as resp:
+                async with self.http.get(f"https://api.github.com/gists/{self.bot.config.get('githubGistId')}", cog=type(self).__name__, headers=ghHeaders) as resp:
                     gistApiData = await resp.json(content_type="application/json")
                     if resp.status == 200 and "files" in gistApiData and "updates.json" in gistApiData["files"]:
                         raw_url = gistApiData["files"]["updates.json"]["raw_url"]
@@ -41,7 +39,7 @@ class NinjaUpdates(commands.Cog):
                         return
 
                 # fetch gist data
-                async with self.http.get(raw_url) as resp:
+                async with self.http.get(raw_url, cog=type(self).__name__) as resp:
                     if resp.status != 200: return
                     gistContent = await resp.json(content_type=None)
                     # we rely on the file beeing there and having content
@@ -84,7 +82,7 @@ class NinjaUpdates(commands.Cog):
 
                 #logger.debug(json.dumps(gistContent, indent=4))
                 # send updated data to github
-                async with self.http.patch(f"https://api.github.com/gists/{self.bot.config.get('githubGistId')}", json=patchData, headers=ghHeaders) as gistApiResp:
+                async with self.http.patch(f"https://api.github.com/gists/{self.bot.config.get('githubGistId')}", cog=type(self).__name__, json=patchData, headers=ghHeaders) as gistApiResp:
                     if gistApiResp.status == 200:
                         logger.info("Successfully updated gist data")
                     else:
@@ -95,10 +93,10 @@ class NinjaUpdates(commands.Cog):
     
     @commands.Cog.listener()
     async def on_raw_message_edit(self, partialMessage) -> None:
-        if partialMessage.channel_id != int(self.bot.config.get("updatesChannel")): return # Ignore everything not from the update channel
+        if partialMessage.channel_id != self.bot.config.snapshot.updatesChannel: return # Ignore everything not from the update channel
         channel = self.bot.get_channel(partialMessage.channel_id)
         message = await channel.fetch_message(partialMessage.message_id)
-        await self.on_message(message)
+        await self.handleMessage(self.bot.messageDispatcher.envelope(message))
 
     async def formatMessageContent(self, message: discord.Message) -> str:
         content = message.content
@@ -127,8 +125,7 @@ class NinjaUpdates(commands.Cog):
         return []
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
-        await self.http.close()
+        logger.debug("Shutting down %s", self.__class__.__name__)
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaUpdates(bot))
\ No newline at end of file
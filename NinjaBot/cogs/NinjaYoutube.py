@@ -1,19 +1,30 @@
+import asyncio
 import logging
-import googleapiclient.discovery
+import time
 from discord.ext import commands, tasks
-from asyncio import sleep
+from utils.lazyImport import importModule
+from utils.metrics import timedLoop
+from utils.actionQueue import Priority
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
 class NinjaYoutube(commands.Cog):
     def __init__(self, bot) -> None:
-        logger.debug(f"Loading {self.__class__.__name__}")
+        logger.debug("Loading %s", self.__class__.__name__)
         self.bot = bot
         self.isInternal = True
-        self.youtube = googleapiclient.discovery.build("youtube", "v3", developerKey = self.bot.config.get("youtubeApiKey"))
+        self.youtube = None
+
+    async def cog_load(self) -> None:
+        # the google api client is heavy, import and build it off the event loop
+        discovery = await importModule("googleapiclient.discovery")
+        start = time.perf_counter()
+        self.youtube = await asyncio.to_thread(discovery.build, "youtube", "v3", developerKey = self.bot.config.get("youtubeApiKey"))
+        logger.info("Built youtube client in %.3fs", time.perf_counter() - start)
         self.youtubeChecker.start()
 
     @tasks.loop(hours=1)
+    @timedLoop
     async def youtubeChecker(self) -> None:
         logger.debug("Running youtube checker")
 
@@ -26,12 +37,13 @@ class NinjaYoutube(commands.Cog):
                 safeSearch="none",
                 type="video"
             )
-            response = request.execute()
+            # the google client is blocking, don't stall the event loop with it
+            response = await asyncio.to_thread(request.execute)
 
             if response and response["kind"] == "youtube#searchListResponse" and "items" in response and response["items"]:
                 postedVideos = self.bot.config.get("youtubePostedVideo") or []
                 toPostVideos = []
-                logger.debug(f"Posted videos so far: '{postedVideos}'")
+                logger.debug("Posted videos so far: '%s'", postedVideos)
                 logger.debug(response["items"])
                 for video in response["items"]:
                     if video["kind"] != "youtube#searchResult" and video["id"]["kind"] != "youtube#video": continue
@@ -56,11 +68,11 @@ class NinjaYoutube(commands.Cog):
             # post all open videos
             logger.debug(toPostVideos)
             try:
-                youtubeChannel = self.bot.get_channel(int(self.bot.config.get("youtubeDiscordChannel")))
+                youtubeChannel = self.bot.get_channel(self.bot.config.snapshot.youtubeDiscordChannel)
                 for video in toPostVideos:
-                    await youtubeChannel.send(f"New video by Steve! Check it out: https://www.youtube.com/watch?v={video['id']['videoId']}")
+                    await self.bot.actionQueue.send(youtubeChannel, f"New video by Steve! Check it out: https://www.youtube.com/watch?v={video['id']['videoId']}",
+                                                    priority=Priority.ANNOUNCEMENT)
                     postedVideos.append(video["id"]["videoId"])
-                    await sleep(2) # do some reate limiting ourselfs
             except Exception as E:
                 logger.exception(E)
             finally:
@@ -77,7 +89,7 @@ class NinjaYoutube(commands.Cog):
         return []
 
     async def cog_unload(self) -> None:
-        logger.debug(f"Shutting down {self.__class__.__name__}")
+        logger.debug("Shutting down %s", self.__class__.__name__)
         self.youtubeChecker.cancel()
 
 async def setup(bot) -> None:
@@ -1,54 +1,34 @@
 import discord
 import asyncio
+import hashlib
+import json
 import logging
 import pathlib
+import time
 import discord
 import discord.ext.commands
-import logging.handlers
 from discord.ext import commands
 from utils.config import Config
+from utils.commandRegistry import CommandRegistry
+from utils.commandReplyProcessor import sendCommandReply
+from utils.messageDispatch import MessageDispatcher
+from utils.logSetup import setupLogging, applyLogLevels
+from utils.httpService import HttpService
+from utils.actionQueue import ActionQueue
+from utils.roleIndex import RoleIndex
+from utils.deletionScheduler import DeletionScheduler
+from utils.threadCache import ThreadCache
+from utils.aiCache import AiCache
+from utils.aiScheduler import AiScheduler
+from utils.faqIndex import FaqIndex
+from utils.metrics import REGISTRY, MetricsExporter, instrumentDiscordRequest
 
 # get local directory as path object
 LOCALDIR = pathlib.Path(__file__).parent.resolve()
 
-# setup logger
-generalLogLevel = logging.DEBUG
-formatter = logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", datefmt="%Y-%m-%d %H:%M:%S", style="{")
-
-# rotating log file handler
-rotateFileHnd = logging.handlers.RotatingFileHandler(
-    filename="ninjaBot.log",
-    encoding="utf-8",
-    maxBytes=32 * 1024 * 1024,  # 32 MiB
-    backupCount=5,  # Rotate through 5 files
-)
-rotateFileHnd.setLevel(generalLogLevel)
-rotateFileHnd.setFormatter(formatter)
-
-# cmd output
-streamHnd = logging.StreamHandler()
-streamHnd.setLevel(generalLogLevel)
-streamHnd.setFormatter(formatter)
-
-# discord logger
-dcL = logging.getLogger("discord")
-dcL.propagate = False
-dcL.setLevel(generalLogLevel)
-dcL.addHandler(rotateFileHnd)
-dcL.addHandler(streamHnd)
-
-logging.getLogger("discord.http").setLevel(logging.INFO)
-logging.getLogger("discord.gateway").setLevel(logging.INFO)
-logging.getLogger("discord.client").setLevel(logging.INFO)
-logging.getLogger("discord.webhook").setLevel(logging.INFO)
-
-# NinjaBot logger
-nbL = logging.getLogger("NinjaBot")
-nbL.propagate = False
-nbL.setLevel(generalLogLevel)
-nbL.addHandler(rotateFileHnd)
-nbL.addHandler(streamHnd)
-logger = nbL
+# setup logger, the levels get refined from the config once it's loaded
+logListener, logSampler = setupLogging("ninjaBot.log", logging.INFO)
+logger = logging.getLogger("NinjaBot")
 
 # disable voice client warning
 discord.VoiceClient.warn_nacl = False
@@ -61,84 +41,206 @@ intents.typing = False
 # configure allowed mentions so bot can't ping @everyone
 mentions = discord.AllowedMentions(everyone=False)
 
+# all the extensions we want to use
+# statically defined for security reasons
+# latency critical extensions, loaded before the bot connects
+CRITICAL_EXTENSIONS = (
+    "cogs.NinjaBotUtils",       # internal bot commands
+    "cogs.NinjaAntiSpam",       # spammer detection system
+    "cogs.NinjaBotHelp",        # the bot help command
+    "cogs.NinjaGithub",         # commands from github
+    "cogs.NinjaDynCmds",        # commands added through the bot
+    "cogs.NinjaThreadManager",  # auto-thread manager
+)
+# pollers, loaded in the background once the bot is ready
+# these must not define app commands since they are loaded after the command sync
+DEFERRED_EXTENSIONS = (
+    "cogs.NinjaReddit",         # reddit events
+    "cogs.NinjaYoutube",        # youtube uploads
+    "cogs.NinjaUpdates",        # updates.vdon.ninja page
+)
+
 # create config handler
-config = Config(file=LOCALDIR / "discordbot.cfg")
+config = Config(file=LOCALDIR / "discordbot.cfg", flushDelay=5)
+
+CONFIG_STATS = REGISTRY.gauge("ninjabot_config_stats", "Config set/write counters", ("stat",))
+LISTENER_TASKS = REGISTRY.gauge("ninjabot_message_listener_tasks", "Message listener tasks currently running")
+MODERATORS = REGISTRY.gauge("ninjabot_moderators", "Members in the moderator role index")
 
 class NinjaBot(commands.Bot):
     def __init__(self, config, *args, **kwargs) -> None:
         self.config = config
+        # custom commands take precedence over native commands
+        # in order: dynamic command -> github -> native command
+        self.commandRegistry = CommandRegistry(self.config.snapshot.commandPrefix, ("dyncmds", "github", CommandRegistry.NATIVE))
+        self.messageDispatcher = MessageDispatcher(self)
+        # one pooled http client shared by all cogs
+        self.httpService = HttpService.fromConfig(self.config.get("http"))
+        # outbound discord actions (sends, deletes, ...) with priorities
+        self.actionQueue = ActionQueue.fromConfig(self.config.get("actionQueue"))
+        # messages to delete later (e.g. warnings), survives restarts
+        self.deletionScheduler = DeletionScheduler(self, LOCALDIR / "pendingDeletions.json")
+        self._deferredExtensionsTask: asyncio.Task | None = None
         super().__init__(
-            command_prefix=self.config.get("commandPrefix"),
+            command_prefix=self.config.snapshot.commandPrefix,
             intents=intents,
             allowed_mentions=mentions,
             help_command=None
         )
+        # time every discord REST call by route
+        self.http.request = instrumentDiscordRequest(self.http.request)
+        self.metricsExporter: MetricsExporter | None = None
+        # who holds the moderator role, kept up to date from gateway events
+        self.roleIndex = RoleIndex(self, self.config.get("moderatorRole") or "Moderator")
+        # recent thread messages for AI context, fed from gateway events
+        self.threadCache = ThreadCache.fromConfig(self, self.config.get("threadCache"))
+        # AI answers to repeated questions, kept across cog reloads
+        self.aiCache = AiCache.fromConfig(self.config.get("aiCache"), LOCALDIR / "aiCache.json")
+        # limits and deduplicates the calls to the AI providers
+        self.aiScheduler = AiScheduler.fromConfig(self, self.config.get("aiScheduler"))
+        # command replies as canned answers for support questions, follows the command registry
+        self.faqIndex = FaqIndex.fromConfig(self.config.get("faq"))
+        self.faqIndex.follow(self.commandRegistry)
+        REGISTRY.addCollector(self._collectMetrics)
+
+    # keep native commands in the command registry in sync
+    def add_command(self, command, /) -> None:
+        super().add_command(command)
+        self.commandRegistry.setSource(CommandRegistry.NATIVE, self.all_commands)
+
+    def remove_command(self, name, /):
+        command = super().remove_command(name)
+        self.commandRegistry.setSource(CommandRegistry.NATIVE, self.all_commands)
+        return command
+
+    # register/unregister the message listeners of cogs
+    async def add_cog(self, cog, /, **kwargs) -> None:
+        await super().add_cog(cog, **kwargs)
+        self.messageDispatcher.register(cog)
+
+    async def remove_cog(self, name, /, **kwargs):
+        cog = await super().remove_cog(name, **kwargs)
+        if cog is not None:
+            self.messageDispatcher.unregister(cog)
+        return cog
+
+    # runs exactly once per process before connecting to the gateway
+    async def setup_hook(self) -> None:
+        metricsConfig = self.config.get("metrics") or {}
+        if metricsConfig.get("port") or metricsConfig.get("file"):
+            self.metricsExporter = MetricsExporter(REGISTRY, port=int(metricsConfig.get("port") or 0),
+                                                   file=metricsConfig.get("file") or "",
+                                                   interval=float(metricsConfig.get("interval") or 60))
+            await self.metricsExporter.start()
+
+        self.roleIndex.reconcileJob.start()
+        await self.deletionScheduler.start()
+        await self.aiCache.load()
+        await self._loadExtensions(CRITICAL_EXTENSIONS)
 
-    # informational event when bot has finished logging in
-    async def on_ready(self) -> None:
-        logger.info(f"Bot logged in as {self.user}")
-
-        # load all the extensions we want to use
-        # statically defined for security reasons
-
-        # internal bot commands
-        await self.load_extension("cogs.NinjaBotUtils")
-        # spammer detection system
-        await self.load_extension("cogs.NinjaAntiSpam")
-        # the bot help command
-        await self.load_extension("cogs.NinjaBotHelp")
-        # commands from github
-        await self.load_extension("cogs.NinjaGithub")
-        # commands added through the bot
-        await self.load_extension("cogs.NinjaDynCmds")
-        # reddit events
-        await self.load_extension("cogs.NinjaReddit")
-        # youtube uploads
-        await self.load_extension("cogs.NinjaYoutube")
-        # updates.vdon.ninja page
-        await self.load_extension("cogs.NinjaUpdates")
-        # auto-thread manager
-        await self.load_extension("cogs.NinjaThreadManager")
-
-        # takes care of pushing all application commands to discord
-        guild = int(self.config.get("guild"))
-        self.tree.copy_global_to(guild=discord.Object(id=guild))
-        await self.tree.sync(guild=discord.Object(id=guild))
         # attach error handler to tree to handle app command errors
         self.tree.on_error = self.on_app_command_error
+        await self._syncAppCommands()
+
+    def _collectMetrics(self) -> None:
+        for stat, value in self.config.stats().items():
+            CONFIG_STATS.set(value, stat)
+        LISTENER_TASKS.set(self.messageDispatcher.inFlight)
+        MODERATORS.set(len(self.roleIndex))
+
+    async def _loadExtensions(self, extensions: tuple[str, ...]) -> None:
+        # the extensions don't depend on each other so load them concurrently
+        start = time.perf_counter()
+        await asyncio.gather(*(self._loadExtension(ext) for ext in extensions))
+        loaded = len([ext for ext in extensions if ext in self.extensions])
+        logger.info("Loaded %s/%s extensions in %.3fs", loaded, len(extensions), time.perf_counter() - start)
 
+    async def _loadExtension(self, name: str) -> None:
+        start = time.perf_counter()
+        try:
+            await self.load_extension(name)
+        except Exception as E:
+            logger.error("Failed to load extension %s", name)
+            logger.exception(E)
+        else:
+            logger.info("Loaded extension %s in %.3fs", name, time.perf_counter() - start)
+
+    def _appCommandHash(self, guild: discord.Object) -> str:
+        """Return a stable hash over the app command payload that would be synced"""
+        payload = [cmd.to_dict(self.tree) for cmd in self.tree.get_commands(guild=guild)]
+        payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+        return hashlib.sha256(json.dumps({"application": self.application_id, "guild": guild.id, "commands": payload}, sort_keys=True).encode()).hexdigest()
+
+    # takes care of pushing all application commands to discord, but only if they changed
+    async def _syncAppCommands(self) -> None:
+        guild = discord.Object(id=self.config.snapshot.guild)
+        self.tree.copy_global_to(guild=guild)
+        treeHash = self._appCommandHash(guild)
+        if treeHash == self.config.get("appCommandHash"):
+            logger.info("App commands unchanged, skipping sync")
+            return
+        await self.tree.sync(guild=guild)
+        await self.config.set("appCommandHash", treeHash)
+        logger.info("Synced app commands")
+
+    # informational event when bot has finished logging in
+    # this fires again on every reconnect so don't do any heavy lifting in here
+    async def on_ready(self) -> None:
+        logger.info("Bot logged in as %s", self.user)
+        if self._deferredExtensionsTask is None:
+            # only on the first ready, activate the pollers in the background
+            self._deferredExtensionsTask = asyncio.create_task(self._loadExtensions(DEFERRED_EXTENSIONS), name="NinjaBot: deferred extensions")
         # for funsies
         await self.change_presence(status=discord.Status.online, activity=discord.Game("helping hand"))
         logger.info("Bot is done loading")
 
     async def on_message(self, message: discord.Message) -> None:
-        ctx = await self.get_context(message)
+        # compute the shared message facts once and hand them to all cog listeners
+        # before dispatching, so listeners already find the message in the thread history
+        self.threadCache.addMessage(message)
+        env = self.messageDispatcher.envelope(message)
+        self.messageDispatcher.dispatch(env)
 
-        if (ctx.author == self.user \
-            or ctx.author.bot \
-            or str(ctx.channel.id) in self.config.get("autoThreadEnabledChannels")):
+        # cheap prefix check + table lookup before doing any other work
+        match = self.commandRegistry.match(message.content)
+        if env.isBot or env.isAutoThreadChannel:
             # ignore messages by the bot itself or other bots or autoThread channels
             return
-        elif ctx.message.content.startswith(self.config.get("commandPrefix")):
-            # might be a command. pass it around to see if anyone wants to deal with it
-            # in order: github -> dynamic command -> native command
-            dynamicCommands = self.get_cog("NinjaDynCmds")
-            if dynamicCommands and await dynamicCommands.process_command(ctx): #type:ignore
-                return
-            NinjaGithub = self.get_cog("NinjaGithub")
-            if NinjaGithub and await NinjaGithub.process_command(ctx):  #type:ignore
-                return
-            # otherwise look elsewhere for command
-            logger.debug("Command not found by custom handlers, try processing native commands")
-            await self.process_commands(message)
+        if match is None:
+            prefix = self.commandRegistry.prefix
+            if message.content.startswith(prefix) and message.content[len(prefix):len(prefix) + 1].strip():
+                # what on_command_error logs for CommandNotFound, without building a context for it
+                logger.info("user '%s' tried to run '%s' which is unknown/invalid", message.author.name, message.content)
+            return
+
+        entry, line = match
+        ctx = await self.get_context(message)
+        if entry.reply is not None:
+            await sendCommandReply(self, ctx, entry.reply, line)
+        else:
+            logger.debug("Processing native command")
+            await self.invoke(ctx)
     
+    async def close(self) -> None:
+        self.roleIndex.reconcileJob.cancel()
+        await self.deletionScheduler.close()
+        await self.aiScheduler.close()
+        await self.aiCache.save()
+        await self.actionQueue.close()
+        await super().close()
+        if self.metricsExporter:
+            await self.metricsExporter.close()
+        await self.httpService.close()
+        # write out pending config changes
+        await self.config.close()
+
     # reload all extensions
     async def reloadExtensions(self, ctx) -> None:
         await ctx.send("Reloading bot extensions")
         try:
             for ext in list(self.extensions.keys()):
                 if ext != "cogs.NinjaThreadManager":
-                    logger.debug(f"Reloading extension {ext}")
+                    logger.debug("Reloading extension %s", ext)
                     await self.reload_extension(ext)
         except Exception as E:
             await ctx.send("There was an error while reloading bot extensions:")
@@ -152,13 +254,13 @@ class NinjaBot(commands.Bot):
         if isinstance(err, discord.ext.commands.MissingPermissions) \
             or isinstance(err, discord.ext.commands.MissingRole):
             # silently ignore no-permissions errors
-            logger.info(f"user '{ctx.author.name}' tried to run '{ctx.message.content}' without permissions")
+            logger.info("user '%s' tried to run '%s' without permissions", ctx.author.name, ctx.message.content)
         elif isinstance(err, discord.ext.commands.CommandNotFound):
-            logger.info(f"user '{ctx.author.name}' tried to run '{ctx.message.content}' which is unknown/invalid")
+            logger.info("user '%s' tried to run '%s' which is unknown/invalid", ctx.author.name, ctx.message.content)
         elif isinstance(err, discord.ext.commands.MissingRequiredArgument):
-            logger.info(f"user '{ctx.author.name}' tried to run '{ctx.message.content}' without providing all required arguments")
+            logger.info("user '%s' tried to run '%s' without providing all required arguments", ctx.author.name, ctx.message.content)
         elif isinstance(err, discord.ext.commands.NoPrivateMessage):
-            logger.info(f"user '{ctx.author.name}' tried to run '{ctx.message.content}' in a private message")
+            logger.info("user '%s' tried to run '%s' in a private message", ctx.author.name, ctx.message.content)
         else:
             logger.exception(err)
     
@@ -168,8 +270,8 @@ class NinjaBot(commands.Bot):
             await interaction.response.send_message(str(err), ephemeral=True)
         elif isinstance(err, discord.app_commands.CheckFailure):
             # log check failures
-            logger.info(f"user '{interaction.user.display_name}' tried to run '\
-                        '{getattr(interaction.command, "qualified_name", "Unknown interaction")}' but '{err}'")
+            logger.info("user '%s' tried to run '%s' but '%s'", interaction.user.display_name,
+                        getattr(interaction.command, "qualified_name", "Unknown interaction"), err)
             # inform user of their poor choice
             await interaction.response.send_message("You cannot run this command here", ephemeral=True)
         else:
@@ -182,9 +284,12 @@ async def main() -> None:
     except Exception as E:
         logger.error("Error while parsing the configuration file")
         logger.exception(E)
+        logListener.stop()
         return
 
-    logger.info(f"Token loaded. Loading bot and extensions.")
+    applyLogLevels(config.get("logLevels"))
+    logSampler.interval = float(config.get("logSampleInterval") or 0)
+    logger.info("Token loaded. Loading bot and extensions.")
 
     nBot = NinjaBot(config)
 
@@ -197,6 +302,7 @@ async def main() -> None:
         pass
     await nBot.close()
     logger.info("Bot process exited. Closing program.")
+    logListener.stop()
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
@@ -207,6 +313,5 @@ general TODO list:
 - (Bonus) (NinjaUpdates) Improvement: convert discord formatting into html for update page (include images and user avatar)
 - (Bonus) Improvement: add register and unregister method to main bot class (save first part of command and callback?)
 - (Bonus) Improvement: use cog_unload to run unregister and update to update (check if valid)
-- (Bonus) (NinjaAntiSpam) Improvement: improve spam detection by factoring in message posting speed?
 - (Bonus) (NinjaDocs) Improvement: Cache resolved docs urls
 """
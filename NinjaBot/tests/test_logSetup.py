@@ -0,0 +1,56 @@
+import logging
+import unittest
+from utils.logSetup import SamplingFilter
+
+class ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+class SamplingFilterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sampler = SamplingFilter(10)
+        self.handler = ListHandler()
+        self.handler.addFilter(self.sampler)
+        self.logger = logging.getLogger("NinjaBot.tests.samplingFilter")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self) -> None:
+        self.logger.removeHandler(self.handler)
+
+    def test_unhashable_messages(self) -> None:
+        class Unhashable:
+            __hash__ = None
+
+            def __str__(self) -> str:
+                return "unhashable"
+
+        # separate call sites, so none of them is sampled away
+        self.logger.debug(["a", "b"])
+        self.logger.debug({"items": []})
+        self.logger.debug(Unhashable())
+        self.assertEqual(["['a', 'b']", "{'items': []}", "unhashable"], [r.getMessage() for r in self.handler.records])
+
+    def test_samples_per_call_site(self) -> None:
+        for i in range(5):
+            self.logger.debug(["item", i])
+        self.assertEqual(1, len(self.handler.records))
+        self.assertEqual(4, next(iter(self.sampler._lastSeen.values()))[1])
+
+    def test_messages_are_not_kept(self) -> None:
+        self.logger.debug(["payload"])
+        self.assertNotIn(["payload"], [part for key in self.sampler._lastSeen for part in key])
+
+    def test_quiet_call_sites_are_pruned(self) -> None:
+        self.logger.debug("once")
+        self.assertEqual(1, len(self.sampler._lastSeen))
+        self.sampler._prune(float("inf"))
+        self.assertEqual({}, self.sampler._lastSeen)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Hashable
+import discord
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+QUEUE_DEPTH = REGISTRY.gauge("ninjabot_action_queue_depth", "Outbound discord actions waiting to run", ("priority",))
+QUEUE_WAIT = REGISTRY.histogram("ninjabot_action_queue_wait_seconds", "Time outbound discord actions spent queued", ("priority",))
+
+# discord only bulk deletes up to 100 messages that are less than 14 days old, keep some margin on the age
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+class Priority(IntEnum):
+    """Lower runs first"""
+    MODERATION = 0
+    INTERACTIVE = 1
+    ANNOUNCEMENT = 2
+
+@dataclass(order=True, slots=True)
+class _Job:
+    priority: int
+    seq: int
+    factory: Callable[[], Awaitable] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    name: str = field(compare=False)
+    queuedAt: float = field(compare=False)
+
+class ActionQueue:
+    """Bot wide queue for outbound discord actions
+
+    Jobs are grouped into buckets that mirror discord's rate limit buckets
+    (action + channel). A bucket runs its jobs one after another, highest
+    priority first, while different buckets run concurrently. discord.py
+    already waits out 429s per bucket, so a rate limited bucket only holds up
+    its own jobs. Moderation jobs bypass the concurrency limit and the
+    backpressure, everything else waits while too many jobs are pending.
+    """
+    def __init__(self, concurrency: int = 8, maxPending: int = 200) -> None:
+        self.maxPending = maxPending
+        self._slots = asyncio.Semaphore(concurrency)
+        self._hasSpace = asyncio.Event()
+        self._hasSpace.set()
+        self._buckets: dict[Hashable, list[_Job]] = {}
+        self._workers: dict[Hashable, asyncio.Task] = {}
+        self._seq = itertools.count()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @classmethod
+    def fromConfig(cls, options: dict | None) -> "ActionQueue":
+        options = options or {}
+        return cls(concurrency=int(options.get("concurrency", 8)), maxPending=int(options.get("maxPending", 200)))
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def submit(self, bucket: Hashable, factory: Callable[[], Awaitable], priority: Priority = Priority.INTERACTIVE,
+                     name: str = "") -> asyncio.Future:
+        """Queue a job and return a future for its result
+
+        'factory' is called without arguments when it's the job's turn and must return an awaitable.
+        """
+        if priority != Priority.MODERATION:
+            while self._pending >= self.maxPending:
+                await self._hasSpace.wait()
+        future = asyncio.get_running_loop().create_future()
+        # don't complain about failed fire-and-forget jobs, they are logged by the worker
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job = _Job(int(priority), next(self._seq), factory, future, name, time.perf_counter())
+        heapq.heappush(self._buckets.setdefault(bucket, []), job)
+        self._pending += 1
+        self._idle.clear()
+        if self._pending >= self.maxPending:
+            self._hasSpace.clear()
+        QUEUE_DEPTH.inc(Priority(priority).name)
+        if bucket not in self._workers:
+            self._workers[bucket] = asyncio.create_task(self._worker(bucket), name=f"NinjaBot: action bucket {bucket}")
+        return future
+
+    async def run(self, bucket: Hashable, factory: Callable[[], Awaitable], priority: Priority = Priority.INTERACTIVE,
+                  name: str = "") -> Any:
+        """Queue a job and wait for its result"""
+        return await (await self.submit(bucket, factory, priority, name))
+
+    async def _worker(self, bucket: Hashable) -> None:
+        heap = self._buckets[bucket]
+        try:
+            while heap:
+                job = heapq.heappop(heap)
+                priority = Priority(job.priority)
+                QUEUE_DEPTH.dec(priority.name)
+                try:
+                    if job.future.cancelled():
+                        continue
+                    QUEUE_WAIT.observe(time.perf_counter() - job.queuedAt, priority.name)
+                    try:
+                        if priority == Priority.MODERATION:
+                            result = await job.factory()
+                        else:
+                            async with self._slots:
+                                result = await job.factory()
+                    except asyncio.CancelledError:
+                        job.future.cancel()
+                        raise
+                    except Exception as E:
+                        logger.warning("Action %s in bucket %s failed: %s", job.name, bucket, E)
+                        if not job.future.done():
+                            job.future.set_exception(E)
+                    else:
+                        if not job.future.done():
+                            job.future.set_result(result)
+                finally:
+                    self._jobDone()
+        finally:
+            for job in heap:
+                # only reached on cancellation, don't leave waiters hanging
+                job.future.cancel()
+                QUEUE_DEPTH.dec(Priority(job.priority).name)
+                self._jobDone()
+            heap.clear()
+            del self._buckets[bucket]
+            del self._workers[bucket]
+
+    def _jobDone(self) -> None:
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+        if self._pending < self.maxPending:
+            self._hasSpace.set()
+
+    async def send(self, channel: discord.abc.Messageable, *args, priority: Priority = Priority.INTERACTIVE, **kwargs) -> discord.Message:
+        """Send a message, arguments are the same as for channel.send()"""
+        return await self.run(("send", getattr(channel, "id", None)), lambda: channel.send(*args, **kwargs), priority, "send")
+
+    async def edit(self, message: discord.Message, priority: Priority = Priority.INTERACTIVE, **kwargs) -> discord.Message:
+        """Edit a message, arguments are the same as for message.edit()"""
+        return await self.run(("edit", message.channel.id), lambda: message.edit(**kwargs), priority, "edit")
+
+    async def fetch(self, channel: discord.abc.Messageable, messageId: int, priority: Priority = Priority.INTERACTIVE) -> discord.Message:
+        """Fetch a message from a channel"""
+        return await self.run(("fetch", getattr(channel, "id", None)), lambda: channel.fetch_message(messageId), priority, "fetch")
+
+    async def delete(self, message: discord.Message, priority: Priority = Priority.INTERACTIVE) -> None:
+        """Delete a message, use the bot's deletionScheduler to delete it later"""
+        await self.run(("delete", message.channel.id), message.delete, priority, "delete")
+
+    async def purge(self, channel: discord.abc.Messageable, messageIds: list[int], priority: Priority = Priority.INTERACTIVE) -> None:
+        """Delete messages by id without fetching them, in bulk where discord allows it"""
+        bulkLimit = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        if hasattr(channel, "delete_messages"):
+            # bulk delete only takes messages younger than 14 days, 100 at a time
+            recent = [discord.Object(mid) for mid in messageIds if discord.utils.snowflake_time(mid) > bulkLimit]
+            older = [mid for mid in messageIds if discord.utils.snowflake_time(mid) <= bulkLimit]
+        else:
+            recent, older = [], list(messageIds)
+        jobs = []
+        for i in range(0, len(recent), BULK_DELETE_LIMIT):
+            chunk = recent[i:i + BULK_DELETE_LIMIT]
+            jobs.append(self.run(("bulkDelete", channel.id), lambda chunk=chunk: channel.delete_messages(chunk), priority, "bulkDelete"))
+        for mid in older:
+            message = channel.get_partial_message(mid)
+            jobs.append(self.run(("delete", channel.id), message.delete, priority, "delete"))
+        await asyncio.gather(*jobs)
+
+    async def join(self) -> None:
+        """Wait until no job is queued or running"""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        """Cancel everything that is still queued, call this on shutdown"""
+        if self._pending:
+            logger.info("Dropping %s queued discord actions on shutdown", self._pending)
+        tasks = list(self._workers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
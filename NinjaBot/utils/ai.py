@@ -1,21 +1,48 @@
+import asyncio
 import logging
 import json
 import aiohttp
 import re
 import time
-from typing import Union, Dict, List, Any, Optional
+from typing import Union, Dict, List, Any, Optional, AsyncIterator
+from utils.aiScheduler import AiRequestCancelled
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
+MAINTENANCE_RESPONSE = "I'm currently under maintenance. Please wait for a human to assist you."
+# a stream may run for minutes, only the wait for the next part of it is limited
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+PROVIDERS = ("OPENAI", "GEMINI", "OLLAMA")
+# the ai options that change answers, part of the response cache key
+CACHE_KEY_OPTIONS = ("service", "model", "api_url", "temperature", "max_tokens")
+
+class AiResponseIncomplete(Exception):
+    """The AI service failed after part of the response was already yielded"""
+
 class NinjaAI:
     """A helper class to handle AI integrations for the bot"""
     def __init__(self, bot) -> None:
         self.bot = bot
-        self.http = aiohttp.ClientSession()
+        self.http = bot.httpService
         self.ai_config = self._get_ai_config()
         self.channel_instructions = self._get_channel_instructions()
-        logger.info(f"NinjaAI initialized with config: {self.ai_config}")
-        logger.info(f"Channel instructions configured: {list(self.channel_instructions.keys()) if self.channel_instructions else 'None'}")
+        self.cache = bot.aiCache
+        self.scheduler = bot.aiScheduler
+        bot.config.addListener(self._on_config_change)
+        logger.info("NinjaAI initialized with config: %s", self.ai_config)
+        logger.info("Channel instructions configured: %s", list(self.channel_instructions.keys()) if self.channel_instructions else 'None')
+
+    def close(self) -> None:
+        """Stop following config changes"""
+        self.bot.config.removeListener(self._on_config_change)
+
+    def _on_config_change(self, key: str, value: Any) -> None:
+        """Pick up changed AI settings, answers cached with the old ones are dropped"""
+        if key in ("ai", "channelInstructions"):
+            logger.info("AI config %s changed, reloading", key)
+            self.ai_config = self._get_ai_config()
+            self.channel_instructions = self._get_channel_instructions()
+            self.cache.clear()
         
     def _get_ai_config(self) -> Dict[str, Any]:
         """Get AI configuration from the bot config"""
@@ -32,7 +59,7 @@ class NinjaAI:
         # Try to get AI configuration from bot config
         if self.bot.config.has("ai"):
             ai_config = self.bot.config.get("ai")
-            logger.info(f"Found AI config in bot config: {ai_config}")
+            logger.info("Found AI config in bot config: %s", ai_config)
             return ai_config
             
         logger.warning("No AI config found in bot config, using defaults")
@@ -56,16 +83,16 @@ class NinjaAI:
         
         # If we have channel-specific instructions, use them
         if channel_id in self.channel_instructions:
-            logger.info(f"Using channel-specific instruction for channel {channel_id}")
+            logger.info("Using channel-specific instruction for channel %s", channel_id)
             return self.channel_instructions[channel_id]
         
-        logger.info(f"No channel-specific instruction found for channel {channel_id}, using default")
+        logger.info("No channel-specific instruction found for channel %s, using default", channel_id)
         return default_instruction
         
     # In NinjaAI.py - Add this new method (as shown before)
     async def should_respond_with_history(self, messages: List[Dict[str, Any]], channel_id: str = None) -> bool:
         """Determine if the AI should respond based on consolidated user message history"""
-        logger.debug(f"Checking if AI should respond to message history in channel {channel_id}")
+        logger.debug("Checking if AI should respond to message history in channel %s", channel_id)
         
         # Check if AI is enabled
         if not self.ai_config.get("enabled", False):
@@ -99,11 +126,11 @@ class NinjaAI:
         
         # Combine all messages from the user
         combined_content = " ".join(user_messages)
-        logger.debug(f"Combined message content: '{combined_content}'")
+        logger.debug("Combined message content: '%s'", combined_content)
         
         # If the combined content is too short, don't respond
         if len(combined_content) < 15:
-            logger.info(f"Combined message content is too short ({len(combined_content)} chars), will not respond")
+            logger.info("Combined message content is too short (%s chars), will not respond", len(combined_content))
             return False
             
         # Check if the user is asking a question in any of their messages
@@ -112,8 +139,8 @@ class NinjaAI:
         has_question = "?" in combined_content.lower()
         has_question_word = any(word in combined_content.lower().split() for word in question_indicators)
         
-        logger.debug(f"Combined message has question mark: {has_question}")
-        logger.debug(f"Combined message has question words: {has_question_word}")
+        logger.debug("Combined message has question mark: %s", has_question)
+        logger.debug("Combined message has question words: %s", has_question_word)
         
         if has_question or has_question_word:
             logger.info("Combined messages appear to be a question, will respond")
@@ -124,7 +151,7 @@ class NinjaAI:
     
     async def should_respond(self, messages: List[Dict[str, Any]], channel_id: str = None) -> bool:
         """Determine if the AI should respond based on the message history"""
-        logger.debug(f"Checking if AI should respond to messages in channel {channel_id}: {messages}")
+        logger.debug("Checking if AI should respond to messages in channel %s: %s", channel_id, messages)
         
         # Check if AI is enabled
         if not self.ai_config.get("enabled", False):
@@ -137,7 +164,7 @@ class NinjaAI:
             return False
             
         initial_message = messages[0].get("content", "")
-        logger.debug(f"Initial message: '{initial_message}'")
+        logger.debug("Initial message: '%s'", initial_message)
         
         # If there are no messages or the initial message is too short, don't respond
         if not initial_message:
@@ -145,7 +172,7 @@ class NinjaAI:
             return False
             
         if len(initial_message) < 15:
-            logger.info(f"Initial message is too short ({len(initial_message)} chars), will not respond")
+            logger.info("Initial message is too short (%s chars), will not respond", len(initial_message))
             return False
             
         # Check if the user is asking a question
@@ -154,8 +181,8 @@ class NinjaAI:
         has_question = "?" in initial_message.lower()
         has_question_word = any(word in initial_message.lower().split() for word in question_indicators)
         
-        logger.debug(f"Message has question mark: {has_question}")
-        logger.debug(f"Message has question words: {has_question_word}")
+        logger.debug("Message has question mark: %s", has_question)
+        logger.debug("Message has question words: %s", has_question_word)
         
         # Simple heuristic: if the message contains a question mark or question words, respond
         if has_question or has_question_word:
@@ -262,186 +289,359 @@ class NinjaAI:
             
         return formatted_messages
     
-    async def get_ai_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Union[str, None]:
-        """Get AI response based on the configured AI service"""
+    
+    def _cache_key(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Union[str, None]:
+        """Response cache key for the user messages of a conversation, None if it can't be cached"""
+        question = "\n".join(msg.get("content", "") for msg in messages if not msg.get("author", {}).get("bot", False))
+        model_config = {option: self.ai_config.get(option) for option in CACHE_KEY_OPTIONS}
+        return self.cache.key(question, self._get_system_instruction(channel_id), model_config)
+
+    async def get_ai_response(self, messages: List[Dict[str, Any]], channel_id: str = None, thread_id: int = None,
+                              user_id: int = None) -> Union[str, None]:
+        """Get AI response based on the configured AI service
+
+        Raises AiRequestCancelled if a newer request of the user in the thread
+        or closing the thread cancelled it.
+        """
         service = self.ai_config.get("service", "NONE").upper()
-        logger.info(f"Getting AI response using service: {service} for channel: {channel_id}")
+        logger.info("Getting AI response using service: %s for channel: %s", service, channel_id)
+        try:
+            parts = [text async for text in self._generate(service, messages, channel_id, False, thread_id, user_id)]
+        except AiResponseIncomplete:
+            # a cut off answer is no answer
+            return None
+        return "".join(parts) or None
+
+    async def stream_ai_response(self, messages: List[Dict[str, Any]], channel_id: str = None, thread_id: int = None,
+                                 user_id: int = None) -> AsyncIterator[str]:
+        """Yield the AI response in parts as the configured AI service generates it
+
+        Errors are logged and end the stream, if parts were yielded already
+        AiResponseIncomplete is raised so the caller can tell the answer is
+        cut off. With "stream": false in the
+        ai config the whole response is yielded at once. Only completed responses
+        are cached, a cached one is yielded at once as well. Raises
+        AiRequestCancelled like get_ai_response.
+        """
+        service = self.ai_config.get("service", "NONE").upper()
+        stream = self.ai_config.get("stream", True)
+        logger.info("%s AI response using service: %s for channel: %s", "Streaming" if stream else "Getting", service, channel_id)
+        async for text in self._generate(service, messages, channel_id, stream, thread_id, user_id):
+            yield text
+
+    async def _generate(self, service: str, messages: List[Dict[str, Any]], channel_id: str, stream: bool,
+                        thread_id: int = None, user_id: int = None) -> AsyncIterator[str]:
+        """The response from the cache or from the AI service, called through the bot's AI scheduler"""
+        if service not in PROVIDERS:
+            logger.warning("Unsupported AI service: %s", service)
+            yield MAINTENANCE_RESPONSE
+            return
+        
+        cache_key = self._cache_key(messages, channel_id)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached:
+            logger.info("Answering from the AI response cache")
+            yield cached
+            return
+        
+        # identical questions asked at the same time share one call
+        scheduled = self.scheduler.stream(lambda: self._provider_response(service, messages, channel_id, stream),
+                                          service, user_id, thread_id, cache_key)
+        parts = []
+        try:
+            async for text in scheduled:
+                parts.append(text)
+                yield text
+        except AiRequestCancelled:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("HTTP error or timeout while getting response from %s: %s", service, e)
+            if parts:
+                raise AiResponseIncomplete(str(e)) from e
+            return
+        except Exception as e:
+            logger.exception("Error getting response from %s: %s", service, e)
+            if parts:
+                raise AiResponseIncomplete(str(e)) from e
+            return
+        finally:
+            await scheduled.aclose()
+        if parts and cache_key:
+            self.cache.put(cache_key, "".join(parts))
+
+    async def _provider_response(self, service: str, messages: List[Dict[str, Any]], channel_id: str, stream: bool) -> AsyncIterator[str]:
+        """The response of the AI service, in parts as they arrive when streaming"""
+        if not stream:
+            if service == "OPENAI":
+                response = await self._get_openai_response(messages, channel_id)
+            elif service == "GEMINI":
+                response = await self._get_gemini_response(messages, channel_id)
+            else:
+                response = await self._get_ollama_response(messages, channel_id)
+            if response:
+                yield response
+            return
         
         if service == "OPENAI":
-            return await self._get_openai_response(messages, channel_id)
+            parts = self._stream_openai_response(messages, channel_id)
         elif service == "GEMINI":
-            return await self._get_gemini_response(messages, channel_id)
-        elif service == "OLLAMA":
-            return await self._get_ollama_response(messages, channel_id)
+            parts = self._stream_gemini_response(messages, channel_id)
         else:
-            logger.warning(f"Unsupported AI service: {service}")
-            return "I'm currently under maintenance. Please wait for a human to assist you."
-    
-    async def _get_openai_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Union[str, None]:
-        """Get response from OpenAI API"""
+            parts = self._stream_ollama_response(messages, channel_id)
         try:
-            api_key = self.ai_config.get("api_key", "")
-            model = self.ai_config.get("model", "gpt-3.5-turbo")
-            temperature = self.ai_config.get("temperature", 0.7)
-            max_tokens = self.ai_config.get("max_tokens", 1000)
+            async for text in parts:
+                yield text
+        finally:
+            await parts.aclose()
+
+    async def _iter_lines(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """Non-empty lines of a streamed response body as they arrive"""
+        async for line in response.content:
+            line = line.decode("utf-8").strip()
+            if line:
+                yield line
+
+    async def _iter_sse(self, response: aiohttp.ClientResponse) -> AsyncIterator[Any]:
+        """Decoded json payloads of a server-sent events response"""
+        async for line in self._iter_lines(response):
+            # events, ids and ":" keep-alive comments carry nothing we need
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            yield json.loads(data)
+
+    def _openai_request(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Optional[tuple]:
+        """URL, headers and request data for OpenAI API, None if it's not configured"""
+        api_key = self.ai_config.get("api_key", "")
+        if not api_key:
+            logger.error("OpenAI API key not configured")
+            return None
             
-            if not api_key:
-                logger.error("OpenAI API key not configured")
-                return None
-                
-            # Format messages for OpenAI
-            formatted_messages = self._format_messages_for_openai(messages, channel_id)
+        request_data = {
+            "model": self.ai_config.get("model", "gpt-3.5-turbo"),
+            "messages": self._format_messages_for_openai(messages, channel_id),
+            "temperature": self.ai_config.get("temperature", 0.7),
+            "max_tokens": self.ai_config.get("max_tokens", 1000)
+        }
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        return "https://api.openai.com/v1/chat/completions", headers, request_data
+    
+    def _gemini_request(self, messages: List[Dict[str, Any]], channel_id: str = None, method: str = "generateContent") -> Optional[tuple]:
+        """URL, headers and request data for Gemini API, None if it's not configured"""
+        api_key = self.ai_config.get("api_key", "")
+        if not api_key:
+            logger.error("Gemini API key not configured")
+            return None
             
-            # Prepare request data
-            request_data = {
-                "model": model,
-                "messages": formatted_messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens
+        model = self.ai_config.get("model", "gemini-pro")
+        request_data = {
+            "contents": self._format_messages_for_gemini(messages, channel_id),
+            "generationConfig": {
+                "temperature": self.ai_config.get("temperature", 0.7),
+                "maxOutputTokens": self.ai_config.get("max_tokens", 1000),
+                "topP": 0.95,
+                "topK": 40
             }
+        }
+        # streamGenerateContent sends a json array unless asked for server-sent events
+        params = "alt=sse&" if method == "streamGenerateContent" else ""
+        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}?{params}key={api_key}"
+        return api_url, {}, request_data
+    
+    def _ollama_request(self, messages: List[Dict[str, Any]], channel_id: str = None, stream: bool = False) -> Optional[tuple]:
+        """URL, headers and request data for Ollama API, None if it's not configured"""
+        api_url = self.ai_config.get("api_url", "http://localhost:11434/api/chat")
+        if not api_url:
+            logger.error("Ollama API URL not configured")
+            return None
             
-            # Make request to OpenAI API
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
+        request_data = {
+            "model": self.ai_config.get("model", "llama2"),
+            "messages": self._format_messages_for_ollama(messages, channel_id),
+            "options": {
+                "temperature": self.ai_config.get("temperature", 0.7)
+            },
+            "stream": stream
+        }
+        return api_url, {}, request_data
+    
+    async def _get_openai_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Union[str, None]:
+        """Get response from OpenAI API"""
+        try:
+            request = self._openai_request(messages, channel_id)
+            if request is None:
+                return None
+            api_url, headers, request_data = request
             
-            logger.debug(f"Sending request to OpenAI API with data: {json.dumps(request_data)}")
+            logger.debug("Sending request to OpenAI API with data: %s", request_data)
             
             async with self.http.post(
-                "https://api.openai.com/v1/chat/completions",
+                api_url,
+                cog="NinjaAI",
                 headers=headers,
                 json=request_data
             ) as response:
                 response_text = await response.text()
-                logger.debug(f"OpenAI API response: {response_text}")
+                logger.debug("OpenAI API response: %s", response_text)
                 
                 if response.status != 200:
-                    logger.error(f"OpenAI API returned status {response.status}")
+                    logger.error("OpenAI API returned status %s", response.status)
                     return None
                     
                 response_data = json.loads(response_text)
                 return response_data["choices"][0]["message"]["content"]
                 
         except Exception as e:
-            logger.exception(f"Error getting response from OpenAI: {e}")
+            logger.exception("Error getting response from OpenAI: %s", e)
             return None
     
+    async def _stream_openai_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> AsyncIterator[str]:
+        """Stream response from OpenAI API, sent as server-sent events"""
+        request = self._openai_request(messages, channel_id)
+        if request is None:
+            return
+        api_url, headers, request_data = request
+        request_data["stream"] = True
+        
+        logger.debug("Sending streaming request to OpenAI API with data: %s", request_data)
+        async with self.http.post(api_url, cog="NinjaAI", headers=headers, json=request_data, timeout=STREAM_TIMEOUT) as response:
+            if response.status != 200:
+                logger.error("OpenAI API returned status %s: %s", response.status, await response.text())
+                return
+            async for event in self._iter_sse(response):
+                for choice in event.get("choices", ()):
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+    
     async def _get_gemini_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Union[str, None]:
         """Get response from Gemini API"""
         try:
-            api_key = self.ai_config.get("api_key", "")
-            model = self.ai_config.get("model", "gemini-pro")
-            temperature = self.ai_config.get("temperature", 0.7)
-            max_tokens = self.ai_config.get("max_tokens", 1000)
-            
-            if not api_key:
-                logger.error("Gemini API key not configured")
+            request = self._gemini_request(messages, channel_id)
+            if request is None:
                 return None
-                
-            # Format messages for Gemini
-            formatted_messages = self._format_messages_for_gemini(messages, channel_id)
-            
-            # Prepare request data
-            request_data = {
-                "contents": formatted_messages,
-                "generationConfig": {
-                    "temperature": temperature,
-                    "maxOutputTokens": max_tokens,
-                    "topP": 0.95,
-                    "topK": 40
-                }
-            }
-            
-            # Make request to Gemini API
-            api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+            api_url, headers, request_data = request
             
             # Log request data for debugging
-            logger.info(f"Sending request to Gemini API: {api_url}")
-            logger.debug(f"Request data: {json.dumps(request_data)}")
+            logger.info("Sending request to Gemini API: %s", api_url.split("?")[0])
+            logger.debug("Request data: %s", request_data)
             
             try:
                 async with self.http.post(
                     api_url,
+                    cog="NinjaAI",
                     json=request_data
                 ) as response:
                     response_text = await response.text()
-                    logger.debug(f"Gemini API response status: {response.status}")
-                    logger.debug(f"Gemini API raw response: {response_text}")
+                    logger.debug("Gemini API response status: %s", response.status)
+                    logger.debug("Gemini API raw response: %s", response_text)
                     
                     if response.status != 200:
-                        logger.error(f"Gemini API returned error status {response.status}")
+                        logger.error("Gemini API returned error status %s", response.status)
                         return None
                     
                     try:
                         response_data = json.loads(response_text)
                     except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse Gemini API response as JSON: {e}")
+                        logger.error("Failed to parse Gemini API response as JSON: %s", e)
                         return None
                     
                     # Extract the response text from the Gemini API response
-                    if "candidates" in response_data and len(response_data["candidates"]) > 0:
-                        candidate = response_data["candidates"][0]
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            parts = candidate["content"]["parts"]
-                            if parts and "text" in parts[0]:
-                                return parts[0]["text"]
+                    text = self._gemini_text(response_data)
+                    if text is not None:
+                        return text
                     
-                    logger.error(f"Unexpected response format from Gemini: {response_data}")
+                    logger.error("Unexpected response format from Gemini: %s", response_data)
                     return None
             except aiohttp.ClientError as e:
-                logger.error(f"HTTP client error when calling Gemini API: {e}")
+                logger.error("HTTP client error when calling Gemini API: %s", e)
                 return None
                 
         except Exception as e:
-            logger.exception(f"Error getting response from Gemini: {e}")
+            logger.exception("Error getting response from Gemini: %s", e)
             return None
+
+    def _gemini_text(self, response_data: Dict[str, Any]) -> Union[str, None]:
+        """Text of the first candidate of a Gemini API response (or streamed response part)"""
+        if "candidates" in response_data and len(response_data["candidates"]) > 0:
+            candidate = response_data["candidates"][0]
+            if "content" in candidate and "parts" in candidate["content"]:
+                parts = candidate["content"]["parts"]
+                if parts and "text" in parts[0]:
+                    return parts[0]["text"]
+        return None
+    
+    async def _stream_gemini_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> AsyncIterator[str]:
+        """Stream response from Gemini API, streamGenerateContent as server-sent events"""
+        request = self._gemini_request(messages, channel_id, "streamGenerateContent")
+        if request is None:
+            return
+        api_url, headers, request_data = request
+        
+        logger.info("Sending streaming request to Gemini API: %s", api_url.split("?")[0])
+        async with self.http.post(api_url, cog="NinjaAI", json=request_data, timeout=STREAM_TIMEOUT) as response:
+            if response.status != 200:
+                logger.error("Gemini API returned error status %s: %s", response.status, await response.text())
+                return
+            async for event in self._iter_sse(response):
+                text = self._gemini_text(event)
+                if text:
+                    yield text
     
     async def _get_ollama_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> Union[str, None]:
         """Get response from Ollama API"""
         try:
-            api_url = self.ai_config.get("api_url", "http://localhost:11434/api/chat")
-            model = self.ai_config.get("model", "llama2")
-            temperature = self.ai_config.get("temperature", 0.7)
-            
-            if not api_url:
-                logger.error("Ollama API URL not configured")
+            request = self._ollama_request(messages, channel_id)
+            if request is None:
                 return None
-                
-            # Format messages for Ollama
-            formatted_messages = self._format_messages_for_ollama(messages, channel_id)
-            
-            # Prepare request data
-            request_data = {
-                "model": model,
-                "messages": formatted_messages,
-                "options": {
-                    "temperature": temperature
-                },
-                "stream": False
-            }
+            api_url, headers, request_data = request
             
-            logger.debug(f"Sending request to Ollama API with data: {json.dumps(request_data)}")
+            logger.debug("Sending request to Ollama API with data: %s", request_data)
             
             # Make request to Ollama API
             async with self.http.post(
                 api_url,
+                cog="NinjaAI",
                 json=request_data
             ) as response:
                 response_text = await response.text()
-                logger.debug(f"Ollama API response: {response_text}")
+                logger.debug("Ollama API response: %s", response_text)
                 
                 if response.status != 200:
-                    logger.error(f"Ollama API returned status {response.status}")
+                    logger.error("Ollama API returned status %s", response.status)
                     return None
                     
                 response_data = json.loads(response_text)
                 return response_data["message"]["content"]
                 
         except Exception as e:
-            logger.exception(f"Error getting response from Ollama: {e}")
+            logger.exception("Error getting response from Ollama: %s", e)
             return None
-            
-    async def close(self):
-        """Close the HTTP session"""
-        await self.http.close()
\ No newline at end of file
+    
+    async def _stream_ollama_response(self, messages: List[Dict[str, Any]], channel_id: str = None) -> AsyncIterator[str]:
+        """Stream response from Ollama API, one json object per line"""
+        request = self._ollama_request(messages, channel_id, stream=True)
+        if request is None:
+            return
+        api_url, headers, request_data = request
+        
+        logger.debug("Sending streaming request to Ollama API with data: %s", request_data)
+        async with self.http.post(api_url, cog="NinjaAI", json=request_data, timeout=STREAM_TIMEOUT) as response:
+            if response.status != 200:
+                logger.error("Ollama API returned status %s: %s", response.status, await response.text())
+                return
+            async for line in self._iter_lines(response):
+                part = json.loads(line)
+                if "error" in part:
+                    # raised so the partial answer isn't cached
+                    raise RuntimeError(f"Ollama API returned an error: {part['error']}")
+                text = part.get("message", {}).get("content")
+                if text:
+                    yield text
+                if part.get("done"):
+                    return
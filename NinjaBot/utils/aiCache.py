@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from utils.jsonFile import fileHelper
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+LOOKUPS = REGISTRY.counter("ninjabot_ai_cache_lookups_total", "AI response cache lookups by result", ("result",))
+CACHE_SIZE = REGISTRY.gauge("ninjabot_ai_cache_entries", "Answers in the AI response cache")
+
+# the same greetings NinjaDocs strips before asking lens
+GREETINGS = re.compile(r"\b(?:hello|hey|hi|everyone|thanks)\b", re.IGNORECASE)
+MENTIONS = re.compile(r"<(?:@[!&]?|#)\d+>")
+PUNCTUATION = re.compile(r"[^\w\s]+")
+WHITESPACE = re.compile(r"\s+")
+
+def normalizeQuestion(text: str) -> str:
+    """Lower case text without greetings, mentions, punctuation and extra whitespace"""
+    text = MENTIONS.sub(" ", text)
+    text = GREETINGS.sub(" ", text)
+    text = PUNCTUATION.sub(" ", text.lower())
+    return WHITESPACE.sub(" ", text).strip()
+
+def contextHash(systemInstruction: str, modelConfig: dict) -> str:
+    """Short hash of everything besides the question that shapes an answer"""
+    data = json.dumps([systemInstruction, modelConfig], sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+class AiCache:
+    """AI answers by normalized question, so repeated questions don't go to the LLM again
+
+    Keys combine the normalized question with a hash of the system
+    instruction and model config, so a different channel or model never gets
+    a wrong answer. Entries expire after ttl seconds and the least recently
+    used ones are dropped once more than maxEntries are cached. With a file
+    the cache is loaded on start and written on shutdown.
+    """
+    def __init__(self, maxEntries: int = 500, ttl: float = 86400, file: str | os.PathLike | None = None) -> None:
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        # key -> (expiry unix time, answer), wall clock time so it stays valid across restarts
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._file = file
+        self._fh = fileHelper(file) if file else None
+
+    @classmethod
+    def fromConfig(cls, options: dict | None, file: str | os.PathLike) -> "AiCache":
+        options = options or {}
+        return cls(maxEntries=int(options.get("maxEntries", 500)), ttl=float(options.get("ttl", 86400)),
+                   file=file if options.get("persist", False) else None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, question: str, systemInstruction: str, modelConfig: dict) -> str | None:
+        """Cache key for a question, None if nothing is left of it after normalization"""
+        question = normalizeQuestion(question)
+        if not question:
+            return None
+        return f"{contextHash(systemInstruction, modelConfig)}:{question}"
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            LOOKUPS.inc("miss")
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            CACHE_SIZE.set(len(self._entries))
+            LOOKUPS.inc("expired")
+            return None
+        LOOKUPS.inc("hit")
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, answer: str) -> None:
+        self._entries[key] = (time.time() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+        CACHE_SIZE.set(len(self._entries))
+
+    def clear(self) -> None:
+        if self._entries:
+            logger.info("Dropping %s cached AI answers", len(self._entries))
+        self._entries.clear()
+        CACHE_SIZE.set(0)
+
+    async def load(self) -> None:
+        """Read answers cached by the last run, expired ones are skipped"""
+        if self._fh is None or not os.path.exists(self._file):
+            return
+        try:
+            now = time.time()
+            for key, expires, answer in await self._fh.read():
+                if expires > now:
+                    self._entries[key] = (float(expires), answer)
+            logger.info("Loaded %s cached AI answers", len(self._entries))
+        except Exception as E:
+            logger.error("Could not load cached AI answers, starting empty: %s", E)
+            self._entries.clear()
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+        CACHE_SIZE.set(len(self._entries))
+
+    async def save(self) -> None:
+        if self._fh is None:
+            return
+        try:
+            await self._fh.write([[key, expires, answer] for key, (expires, answer) in self._entries.items()])
+        except Exception as E:
+            logger.error("Could not save cached AI answers: %s", E)
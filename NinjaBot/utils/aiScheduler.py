@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Hashable
+import discord
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+QUEUE_DEPTH = REGISTRY.gauge("ninjabot_ai_queue_depth", "AI requests waiting for a free slot", ("provider",))
+QUEUE_WAIT = REGISTRY.histogram("ninjabot_ai_queue_wait_seconds", "Time AI requests waited for a free slot", ("provider",))
+RUNNING = REGISTRY.gauge("ninjabot_ai_running", "AI requests talking to their provider", ("provider",))
+REQUESTS = REGISTRY.counter("ninjabot_ai_requests_total", "AI requests by how they ended", ("provider", "result"))
+
+# a local model usually runs one answer at a time
+DEFAULT_PROVIDER_CONCURRENCY = {"OLLAMA": 1}
+
+class AiRequestCancelled(Exception):
+    """The request was superseded by a newer one or its thread was closed"""
+
+class _Request:
+    __slots__ = ("provider", "userId", "threadId", "cancelled", "wake")
+
+    def __init__(self, provider: str, userId: int | None, threadId: int | None) -> None:
+        self.provider = provider
+        self.userId = userId
+        self.threadId = threadId
+        self.cancelled = ""
+        self.wake = asyncio.Event()
+
+class _Flight:
+    """One provider call and everything it produced so far, shared by identical requests"""
+    __slots__ = ("key", "parts", "finished", "error", "subscribers", "task")
+
+    def __init__(self, key: Hashable | None) -> None:
+        self.key = key
+        self.parts: list[str] = []
+        self.finished = False
+        self.error: BaseException | None = None
+        self.subscribers: set[_Request] = set()
+        self.task: asyncio.Task | None = None
+
+    def wakeAll(self) -> None:
+        for request in self.subscribers:
+            request.wake.set()
+
+class AiScheduler:
+    """Runs AI provider calls with bounded concurrency
+
+    A call needs a free global slot, a free slot of its provider and the
+    user must not have perUser calls running already. Waiting calls get
+    slots round robin by user, so one user can't crowd out everyone else.
+    Identical requests (same key) that overlap share one call, each of them
+    sees every part from the start. A new request of a user in a thread
+    supersedes their older one there and archiving or deleting a thread
+    cancels its requests, the call only stops once nobody waits for it
+    anymore. Calls that don't get a slot within maxWait or take longer than
+    timeout fail with a TimeoutError.
+    """
+    def __init__(self, bot, concurrency: int = 4, providerConcurrency: dict[str, int] | None = None, perUser: int = 1,
+                 timeout: float = 120, maxWait: float = 60) -> None:
+        self.bot = bot
+        self.concurrency = concurrency
+        self.providerConcurrency = DEFAULT_PROVIDER_CONCURRENCY | {k.upper(): v for k, v in (providerConcurrency or {}).items()}
+        self.perUser = perUser
+        self.timeout = timeout
+        self.maxWait = maxWait
+        self._running = 0
+        self._byProvider: dict[str, int] = {}
+        self._byUser: dict[int | None, int] = {}
+        # user -> waiting (request, future), dict order is the round robin order
+        self._waiting: dict[int | None, deque[tuple[_Request, asyncio.Future]]] = {}
+        self._flights: dict[Hashable, _Flight] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._threads: dict[int, set[_Request]] = {}
+        for event in ("on_raw_thread_update", "on_raw_thread_delete"):
+            bot.add_listener(getattr(self, event), event)
+
+    @classmethod
+    def fromConfig(cls, bot, options: dict | None) -> "AiScheduler":
+        options = options or {}
+        return cls(bot, concurrency=int(options.get("concurrency", 4)),
+                   providerConcurrency={k: int(v) for k, v in (options.get("providerConcurrency") or {}).items()},
+                   perUser=int(options.get("perUser", 1)), timeout=float(options.get("timeout", 120)),
+                   maxWait=float(options.get("maxWait", 60)))
+
+    async def stream(self, factory: Callable[[], AsyncIterator[str]], provider: str, userId: int | None = None,
+                     threadId: int | None = None, key: Hashable | None = None) -> AsyncIterator[str]:
+        """Yield the parts factory() produces once the call gets its slot
+
+        Raises AiRequestCancelled when superseded or the thread is closed and
+        re-raises errors of the call, parts produced before are yielded first.
+        """
+        request = _Request(provider.upper(), userId, threadId)
+        if threadId is not None:
+            requests = self._threads.setdefault(threadId, set())
+            if userId is not None:
+                for older in [r for r in requests if r.userId == userId]:
+                    self._cancel(older, "superseded")
+            requests.add(request)
+
+        flight = self._flights.get(key) if key is not None else None
+        if flight is None:
+            flight = _Flight(key)
+            if key is not None:
+                self._flights[key] = flight
+            flight.task = asyncio.create_task(self._fly(flight, factory, request), name=f"NinjaBot: AI request {request.provider}")
+            self._tasks.add(flight.task)
+            flight.task.add_done_callback(self._tasks.discard)
+        else:
+            REQUESTS.inc(request.provider, "coalesced")
+        flight.subscribers.add(request)
+
+        try:
+            index = 0
+            while True:
+                while index < len(flight.parts):
+                    yield flight.parts[index]
+                    index += 1
+                if request.cancelled:
+                    raise AiRequestCancelled(request.cancelled)
+                if flight.finished:
+                    break
+                request.wake.clear()
+                await request.wake.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers.discard(request)
+            if not flight.subscribers and not flight.finished:
+                # nobody is interested in the answer anymore
+                flight.task.cancel()
+            if threadId is not None:
+                requests = self._threads.get(threadId)
+                if requests is not None:
+                    requests.discard(request)
+                    if not requests:
+                        del self._threads[threadId]
+
+    async def _fly(self, flight: _Flight, factory: Callable[[], AsyncIterator[str]], request: _Request) -> None:
+        provider = request.provider
+        try:
+            await self._acquire(request)
+            try:
+                RUNNING.inc(provider)
+                async with asyncio.timeout(self.timeout):
+                    async for part in factory():
+                        flight.parts.append(part)
+                        flight.wakeAll()
+            finally:
+                RUNNING.dec(provider)
+                self._release(request)
+            REQUESTS.inc(provider, "done")
+        except asyncio.CancelledError:
+            REQUESTS.inc(provider, "cancelled")
+            flight.error = AiRequestCancelled("cancelled")
+        except TimeoutError as E:
+            REQUESTS.inc(provider, "timeout")
+            flight.error = E
+        except Exception as E:
+            REQUESTS.inc(provider, "error")
+            flight.error = E
+        finally:
+            flight.finished = True
+            flight.wakeAll()
+            if flight.key is not None and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    async def _acquire(self, request: _Request) -> None:
+        """Wait for a slot, at most maxWait seconds"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(request.userId, deque()).append((request, waiter))
+        QUEUE_DEPTH.inc(request.provider)
+        start = time.perf_counter()
+        try:
+            self._dispatch()
+            async with asyncio.timeout(self.maxWait):
+                await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # got the slot just as we gave up, hand it back
+                self._release(request)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            QUEUE_DEPTH.dec(request.provider)
+            QUEUE_WAIT.observe(time.perf_counter() - start, request.provider)
+
+    def _release(self, request: _Request) -> None:
+        self._running -= 1
+        self._byProvider[request.provider] -= 1
+        self._byUser[request.userId] -= 1
+        if not self._byUser[request.userId]:
+            del self._byUser[request.userId]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand out free slots, one per user and round, users that got one go to the back"""
+        granted = True
+        while granted and self._running < self.concurrency:
+            granted = False
+            for userId in list(self._waiting):
+                queue = self._waiting[userId]
+                while queue and queue[0][1].done():
+                    # gave up waiting
+                    queue.popleft()
+                if not queue:
+                    del self._waiting[userId]
+                    continue
+                request, waiter = queue[0]
+                if self._running >= self.concurrency:
+                    return
+                if self._byProvider.get(request.provider, 0) >= self.providerConcurrency.get(request.provider, self.concurrency):
+                    continue
+                if self._byUser.get(userId, 0) >= self.perUser:
+                    continue
+                queue.popleft()
+                del self._waiting[userId]
+                if queue:
+                    self._waiting[userId] = queue
+                self._running += 1
+                self._byProvider[request.provider] = self._byProvider.get(request.provider, 0) + 1
+                self._byUser[userId] = self._byUser.get(userId, 0) + 1
+                waiter.set_result(None)
+                granted = True
+
+    def _cancel(self, request: _Request, reason: str) -> None:
+        if not request.cancelled:
+            request.cancelled = reason
+            REQUESTS.inc(request.provider, reason)
+            request.wake.set()
+
+    def cancelThread(self, threadId: int, reason: str = "archived") -> None:
+        """Cancel all requests made for a thread"""
+        for request in list(self._threads.get(threadId, ())):
+            self._cancel(request, reason)
+
+    async def on_raw_thread_update(self, payload: discord.RawThreadUpdateEvent) -> None:
+        if payload.data.get("thread_metadata", {}).get("archived"):
+            self.cancelThread(payload.thread_id)
+
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent) -> None:
+        self.cancelThread(payload.thread_id, "deleted")
+
+    async def close(self) -> None:
+        """Stop all running calls"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
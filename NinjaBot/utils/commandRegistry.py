@@ -0,0 +1,90 @@
+import logging
+from typing import Callable, NamedTuple
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class CommandEntry(NamedTuple):
+    """A resolved command. 'reply' is None for native bot commands"""
+    source: str
+    reply: str | None
+
+class CommandRegistry:
+    """Merges all command sources into a single prebuilt lookup table
+
+    Sources are merged in priority order, the first source defining a command wins.
+    The table is only rebuilt when a source changes, so a lookup is one prefix
+    check plus one dict lookup. Listeners are called with the source name
+    after every rebuild.
+    """
+    NATIVE = "native"
+
+    def __init__(self, prefix: str, priority: tuple[str, ...]) -> None:
+        self.prefix = prefix
+        self._priority = priority
+        self._sources: dict[str, dict[str, str | None]] = {}
+        self._table: dict[str, CommandEntry] = {}
+        self._listeners: list[Callable[[str], None]] = []
+
+    def addListener(self, listener: Callable[[str], None]) -> None:
+        """Call listener(source) whenever the commands of a source change"""
+        self._listeners.append(listener)
+
+    def setSource(self, source: str, commands: dict) -> None:
+        """Replace all commands of a source and rebuild the lookup table"""
+        if source not in self._priority:
+            raise ValueError(f"Unknown command source '{source}'")
+        if source == self.NATIVE:
+            self._sources[source] = dict.fromkeys(commands)
+        else:
+            self._sources[source] = {str(k).lower(): v for k, v in commands.items()}
+        self._rebuild()
+        self._notify(source)
+
+    def removeSource(self, source: str) -> None:
+        """Drop a source, e.g. when its cog gets unloaded"""
+        if self._sources.pop(source, None) is not None:
+            self._rebuild()
+            self._notify(source)
+
+    def _notify(self, source: str) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(source)
+            except Exception as E:
+                logger.exception(E)
+
+    def _rebuild(self) -> None:
+        table = {}
+        # walk sources from lowest to highest priority so higher ones overwrite
+        for source in reversed(self._priority):
+            for name, reply in self._sources.get(source, {}).items():
+                table[name] = CommandEntry(source, reply)
+        # swap in one go so lookups never see a partial table
+        self._table = table
+        logger.debug("Rebuilt command table with %s commands", len(table))
+
+    def match(self, content: str) -> tuple[CommandEntry, list[str]] | None:
+        """Return the command entry and the split line if content is a known command"""
+        if not content.startswith(self.prefix):
+            return None
+        line = content[len(self.prefix):].split()
+        if not line:
+            return None
+        entry = self._table.get(line[0])
+        if entry is None:
+            # text commands ignore case, native ones are case sensitive like discord.py's invoke
+            entry = self._table.get(line[0].lower())
+            if entry is None or entry.source == self.NATIVE:
+                return None
+        return entry, line
+
+    def replies(self) -> dict[str, str]:
+        """All commands with a text reply and their reply, as the table resolves them"""
+        return {name: entry.reply for name, entry in self._table.items() if entry.reply is not None}
+
+    def has(self, name: str) -> bool:
+        return name.lower() in self._table
+
+    def commandsBySource(self, source: str) -> list:
+        """Return the names of all commands a source provides"""
+        return list(self._sources.get(source, {}).keys())
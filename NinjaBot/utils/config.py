@@ -1,18 +1,93 @@
+import asyncio
 import logging
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
 from utils.jsonFile import fileHelper
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
+def _toInt(value) -> int | None:
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        logger.warning("Ignoring invalid id '%s' in config", value)
+        return None
+
+def _toIdSet(values) -> frozenset[int]:
+    if not values:
+        return frozenset()
+    if not isinstance(values, list):
+        values = [values]
+    return frozenset(i for i in map(_toInt, values) if i is not None)
+
+@dataclass(frozen=True, slots=True)
+class ConfigSnapshot:
+    """Typed, pre-parsed view of the config options used on hot paths"""
+    commandPrefix: str
+    guild: int | None
+    botlogChannel: int | None
+    updatesChannel: int | None
+    redditChannel: int | None
+    youtubeDiscordChannel: int | None
+    autoThreadChannels: frozenset[int]
+    aiChannels: frozenset[int]
+    lensChannels: frozenset[int]
+    allowedUpdateUsers: frozenset[int]
+    loggedOnSupportStaff: tuple[int, ...]
+    # channel id -> welcome text with the mapping already resolved
+    welcomeTexts: Mapping[int, str]
+
+    @classmethod
+    def compile(cls, options: dict) -> "ConfigSnapshot":
+        welcomeTexts = {}
+        for channel, textKey in (options.get("autoThreadWelcomeMapping") or {}).items():
+            channelId = _toInt(channel)
+            if channelId is not None and isinstance(options.get(textKey), str):
+                welcomeTexts[channelId] = options[textKey]
+        return cls(
+            commandPrefix=options.get("commandPrefix") or "!",
+            guild=_toInt(options.get("guild")),
+            botlogChannel=_toInt(options.get("botlogChannel")),
+            updatesChannel=_toInt(options.get("updatesChannel")),
+            redditChannel=_toInt(options.get("redditChannel")),
+            youtubeDiscordChannel=_toInt(options.get("youtubeDiscordChannel")),
+            autoThreadChannels=_toIdSet(options.get("autoThreadEnabledChannels")),
+            aiChannels=_toIdSet(options.get("aiEnabledChannels")),
+            lensChannels=_toIdSet(options.get("lensEnabledChannels")),
+            allowedUpdateUsers=_toIdSet(options.get("allowedUpdateUsers")),
+            loggedOnSupportStaff=tuple(i for i in map(_toInt, options.get("loggedOnSupportStaff") or []) if i is not None),
+            welcomeTexts=MappingProxyType(welcomeTexts)
+        )
+
 class Config:
-    """A helper class to handle the bot config file"""
-    def __init__(self, file: str | Path) -> None:
+    """A helper class to handle the bot config file
+
+    With a flushDelay > 0 changes are written behind: set() only marks the config
+    dirty and all changes within the delay are collapsed into a single write.
+    Listeners are called with the key and new value after every set().
+    """
+    def __init__(self, file: str | Path, flushDelay: float = 0) -> None:
         self._fh = fileHelper(file)
         self._configOptions = {}
+        self.snapshot = ConfigSnapshot.compile(self._configOptions)
+        self._flushDelay = flushDelay
+        self._dirty = False
+        self._flushTask: asyncio.Task | None = None
+        self._flushLock = asyncio.Lock()
+        self._stats = {"sets": 0, "writes": 0, "coalesced": 0, "failedWrites": 0}
+        self._listeners: list[Callable[[str, Any], None]] = []
 
     async def parse(self) -> None:
         """read config file"""
         self._configOptions = await self._fh.read()
+        self._flushDelay = float(self._configOptions.get("configFlushDelay", self._flushDelay))
+        self._compile()
+
+    def _compile(self) -> None:
+        """build a new snapshot and swap it in as a whole so readers never see a partial update"""
+        self.snapshot = ConfigSnapshot.compile(self._configOptions)
 
     def get(self, key):
         """return a config option by the given key"""
@@ -21,12 +96,71 @@ class Config:
     def has(self, key):
         return bool(key in self._configOptions)
 
+    def stats(self) -> dict:
+        """return counters about config writes"""
+        return dict(self._stats)
+
+    def addListener(self, listener: Callable[[str, Any], None]) -> None:
+        """call listener(key, newVal) whenever an option is set"""
+        self._listeners.append(listener)
+
+    def removeListener(self, listener: Callable[[str, Any], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
     async def set(self, key, newVal) -> None:
         """set a config option to a new value + trigger flush"""
         self._configOptions[key] = newVal
-        await self._flushToFile()
-        logger.debug(f"changed {key} to {newVal}")
+        self._compile()
+        self._stats["sets"] += 1
+        logger.debug("changed %s to %s", key, newVal)
+        for listener in list(self._listeners):
+            try:
+                listener(key, newVal)
+            except Exception as E:
+                logger.exception(E)
+        if self._flushDelay <= 0:
+            self._dirty = True
+            await self.flush()
+            return
+        if self._dirty:
+            # a write is already pending, this change will go out with it
+            self._stats["coalesced"] += 1
+        self._dirty = True
+        if self._flushTask is None or self._flushTask.done():
+            self._flushTask = asyncio.create_task(self._delayedFlush(), name="NinjaBot: config flush")
+
+    async def _delayedFlush(self) -> None:
+        # keep going as long as changes come in while we are writing
+        while self._dirty:
+            await asyncio.sleep(self._flushDelay)
+            try:
+                await self.flush()
+            except Exception:
+                # already logged by the file helper, retry after the next delay
+                pass
+
+    async def flush(self) -> None:
+        """Write config options from memory to file if there are unsaved changes"""
+        async with self._flushLock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await self._fh.write(self._configOptions)
+            except BaseException as E:
+                # failed or cancelled, either way the changes still have to be written
+                self._dirty = True
+                if isinstance(E, Exception):
+                    self._stats["failedWrites"] += 1
+                raise
+            self._stats["writes"] += 1
 
-    async def _flushToFile(self) -> None:
-        """Write config options from memory to file"""
-        await self._fh.write(self._configOptions)
\ No newline at end of file
+    async def close(self) -> None:
+        """Flush pending changes, call this on shutdown"""
+        if self._flushTask and not self._flushTask.done():
+            # no need to wait out the delay, but a write it already started has to finish or give up first
+            self._flushTask.cancel()
+            await asyncio.gather(self._flushTask, return_exceptions=True)
+        await self.flush()
+        logger.debug("Config writes: %s", self._stats)
@@ -0,0 +1,105 @@
+import logging
+import re
+from dataclasses import dataclass, fields
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+@dataclass(frozen=True, slots=True)
+class ContentRule:
+    """What to look for in a message and what to do when it's found"""
+    name: str
+    pattern: str
+    # delete the offending message
+    delete: bool = True
+    # warning posted in the channel, {mention} is replaced with the author mention, other braces are kept as they are
+    warn: str = ""
+    # seconds until the warning is removed again, 0 keeps it
+    warnLifetime: float = 0
+    # added to the author's abuse score
+    abuse: float = 0
+    ignoreCase: bool = False
+
+DEFAULT_RULES = {
+    "invite": ContentRule(
+        "invite", r"(?:https?://)?(?:www\.)?(?:discord(?:app)?\.(?:gg|io|me|li|com))/(?!channels/)\S{,20}",
+        warn="Hey there {mention}, any discord (invite) links are not allowed here! Repeated posts may lead to moderation actions!",
+        warnLifetime=4, abuse=1.5),
+    # youtube and twitch stream keys
+    "streamKey": ContentRule(
+        "streamKey", r"live_\d{8}_[a-zA-Z0-9]{32}|(?:[a-z0-9]{4}-){4}[a-z0-9]{4}",
+        warn="Hey there {mention}, there was a stream key found in your last message. "
+             "For your safety the message was deleted. You can post your message again without doxing yourself ;)",
+        warnLifetime=12),
+    # facebook and restream keys, only recognizable as the last path segment of an ingest url
+    "rtmpUrl": ContentRule(
+        "rtmpUrl", r"rtmps?://\S+/(?:FB-\d+-\d+-[\w-]{10,}|re_\d+_[a-zA-Z0-9]{10,})",
+        warn="Hey there {mention}, your last message contained an RTMP url with what looks like a stream key. "
+             "For your safety the message was deleted.",
+        warnLifetime=12),
+    "vdoPassword": ContentRule(
+        "vdoPassword", r"(?:vdo|obs)\.ninja/\S*?[?&](?:password|pass|pw|p)=[^&\s]+",
+        warn="Hey there {mention}, your last message contained a VDO.Ninja link with a room password. "
+             "For your safety the message was deleted, please share links without the password.",
+        warnLifetime=12, ignoreCase=True),
+}
+
+class ContentRules:
+    """All content rules compiled into one regex
+
+    Every rule becomes a named group of a single alternation, so a message is
+    scanned once no matter how many rules there are and scanning stops at the
+    first match.
+    """
+    def __init__(self, rules: list[ContentRule]) -> None:
+        self.rules: dict[str, ContentRule] = {}
+        parts = []
+        for rule in rules:
+            # rule names don't have to be valid group names, the position does the mapping
+            group = f"rule{len(parts)}"
+            part = f"(?P<{group}>{'(?i:' + rule.pattern + ')' if rule.ignoreCase else rule.pattern})"
+            try:
+                # compiled together with the others, group names or global flags inside a pattern can clash
+                re.compile("|".join(parts + [part]))
+            except re.error as e:
+                logger.error("Ignoring content rule %s, invalid pattern: %s", rule.name, e)
+                continue
+            self.rules[group] = rule
+            parts.append(part)
+        self._regex = re.compile("|".join(parts)) if parts else None
+
+    @classmethod
+    def fromConfig(cls, options: dict | None) -> "ContentRules":
+        """Default rules, updated by the config. A rule set to null is disabled"""
+        known = {f.name for f in fields(ContentRule)}
+        if not isinstance(options, dict):
+            if options is not None:
+                logger.error("Ignoring content rules config, expected an object of rules: %r", options)
+            options = {}
+        rules = []
+        for name in {**DEFAULT_RULES, **options}:
+            override = options.get(name, {})
+            if override is None:
+                continue
+            if not isinstance(override, dict):
+                logger.error("Ignoring config of content rule %s, expected an object or null: %r", name, override)
+                override = {}
+            default = DEFAULT_RULES.get(name)
+            values = {"name": name, **({f: getattr(default, f) for f in known} if default else {})}
+            values.update((k, v) for k, v in override.items() if k in known and k != "name")
+            if "pattern" not in values:
+                logger.error("Ignoring content rule %s without a pattern", name)
+                continue
+            rules.append(ContentRule(**values))
+        return cls(rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(self, text: str) -> ContentRule | None:
+        """The rule matching first in the text, if any"""
+        if not text or self._regex is None:
+            return None
+        found = self._regex.search(text)
+        if found is None:
+            return None
+        return self.rules[found.lastgroup]
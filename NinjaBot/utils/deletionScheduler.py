@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+import discord
+from utils.jsonFile import fileHelper
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+SCHEDULED_DELETIONS = REGISTRY.gauge("ninjabot_scheduled_deletions", "Messages waiting for their scheduled deletion")
+
+class DeletionScheduler:
+    """Deletes messages once their time is up, e.g. temporary bot warnings
+
+    Pending deletions are kept in a heap ordered by due time and a single
+    task sleeps until the earliest one. Everything due within batchWindow
+    of it is deleted together, grouped by channel so the action queue can
+    bulk delete. The pending list is written to a json file, so deletions
+    survive restarts and are caught up on the next start.
+    """
+    def __init__(self, bot, file: str | os.PathLike, batchWindow: float = 1.0, saveDelay: float = 5.0) -> None:
+        self.bot = bot
+        self.batchWindow = batchWindow
+        self.saveDelay = saveDelay
+        # (due unix time, channel id, message id), wall clock time so it stays valid across restarts
+        self._heap: list[tuple[float, int, int]] = []
+        self._fh = fileHelper(file)
+        self._file = file
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._saveTask: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def start(self) -> None:
+        """Load deletions left over from the last run and start waiting for due ones"""
+        if os.path.exists(self._file):
+            try:
+                self._heap = [(float(due), int(channelId), int(messageId)) for due, channelId, messageId in await self._fh.read()]
+                heapq.heapify(self._heap)
+                logger.info("Loaded %s pending message deletions", len(self._heap))
+            except Exception as E:
+                logger.error("Could not load pending message deletions, starting empty: %s", E)
+        SCHEDULED_DELETIONS.set(len(self._heap))
+        self._task = asyncio.create_task(self._run(), name="NinjaBot: deletion scheduler")
+
+    def schedule(self, message: discord.Message | discord.PartialMessage, delay: float) -> None:
+        """Delete 'message' in 'delay' seconds, returns immediately"""
+        entry = (time.time() + delay, message.channel.id, message.id)
+        heapq.heappush(self._heap, entry)
+        SCHEDULED_DELETIONS.set(len(self._heap))
+        if self._heap[0] is entry:
+            # new earliest deadline, the sleeping task has to wake up sooner
+            self._wakeup.set()
+        self._saveSoon()
+
+    async def deleteDue(self, now: float | None = None) -> int:
+        """Delete everything that is due by 'now' (plus the batch window), returns how many were deleted"""
+        until = (time.time() if now is None else now) + self.batchWindow
+        byChannel: dict[int, list[int]] = {}
+        count = 0
+        while self._heap and self._heap[0][0] <= until:
+            _, channelId, messageId = heapq.heappop(self._heap)
+            byChannel.setdefault(channelId, []).append(messageId)
+            count += 1
+        if not count:
+            return 0
+        SCHEDULED_DELETIONS.set(len(self._heap))
+        results = await asyncio.gather(*(self._purge(channelId, messageIds) for channelId, messageIds in byChannel.items()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                # most likely deleted by someone else already, no point in trying again
+                logger.warning("Scheduled deletion failed: %s", result)
+        self._saveSoon()
+        return count
+
+    async def _purge(self, channelId: int, messageIds: list[int]) -> None:
+        channel = self.bot.get_channel(channelId) or self.bot.get_partial_messageable(channelId)
+        await self.bot.actionQueue.purge(channel, messageIds)
+
+    async def _run(self) -> None:
+        # channels have to be cached to bulk delete
+        await self.bot.wait_until_ready()
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.deleteDue()
+            except Exception as E:
+                logger.exception(E)
+
+    def _saveSoon(self) -> None:
+        """Write the pending deletions after a short delay, so bursts cause a single write"""
+        if self._saveTask is None or self._saveTask.done():
+            self._saveTask = asyncio.create_task(self._saveLater(), name="NinjaBot: save pending deletions")
+
+    async def _saveLater(self) -> None:
+        await asyncio.sleep(self.saveDelay)
+        await self._save()
+
+    async def _save(self) -> None:
+        try:
+            await self._fh.write(sorted(self._heap))
+        except Exception as E:
+            logger.error("Could not save pending message deletions: %s", E)
+
+    async def close(self) -> None:
+        """Stop the scheduler and write out what is still pending"""
+        for task in (self._task, self._saveTask):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._task is not None:
+            await self._save()
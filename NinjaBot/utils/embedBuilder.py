@@ -1,7 +1,36 @@
 from discord import Embed
 
+# discord limits for embeds, per description and for all embeds of one message
+DESCRIPTION_LIMIT = 4096
+MESSAGE_LIMIT = 6000
+EMBEDS_PER_MESSAGE = 10
+
 class ninjaEmbed(Embed):
     def __init__(self, description: str="", title: str | None = None):
         # for now this doesn't do much
         # but we can configure a color or unified look here
-        super().__init__(description=description, title=title)
\ No newline at end of file
+        super().__init__(description=description, title=title)
+
+def reportPages(lines: list[str]) -> list[list[ninjaEmbed]]:
+    """Pack lines into as few messages as possible, each a list of embeds within discord's limits"""
+    pages = []
+    embeds = []
+    description = ""
+    used = 0
+    for line in lines:
+        line = line[:DESCRIPTION_LIMIT - 1]
+        if len(description) + len(line) + 1 > DESCRIPTION_LIMIT or used + len(line) + 1 > MESSAGE_LIMIT:
+            if description:
+                embeds.append(ninjaEmbed(description=description.rstrip()))
+                description = ""
+            if len(embeds) == EMBEDS_PER_MESSAGE or used + len(line) + 1 > MESSAGE_LIMIT:
+                pages.append(embeds)
+                embeds = []
+                used = 0
+        description += line + "\n"
+        used += len(line) + 1
+    if description:
+        embeds.append(ninjaEmbed(description=description.rstrip()))
+    if embeds:
+        pages.append(embeds)
+    return pages
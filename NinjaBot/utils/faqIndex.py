@@ -0,0 +1,153 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import NamedTuple
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+LOOKUPS = REGISTRY.counter("ninjabot_faq_lookups_total", "FAQ index lookups by result", ("result",))
+
+WORDS = re.compile(r"[a-z0-9]+")
+# words that say nothing about which answer is meant
+STOPWORDS = frozenset((
+    "a", "about", "after", "all", "also", "am", "an", "and", "any", "anyone", "are", "as", "at", "be", "been", "but",
+    "by", "can", "could", "do", "does", "doing", "for", "from", "get", "got", "had", "has", "have", "hello", "help",
+    "here", "hey", "hi", "how", "i", "if", "im", "in", "into", "is", "it", "its", "just", "know", "like", "me", "my",
+    "need", "of", "on", "one", "or", "our", "please", "so", "some", "than", "thanks", "that", "the", "their", "them",
+    "then", "there", "this", "to", "try", "trying", "up", "use", "using", "want", "was", "we", "what", "when", "where",
+    "which", "who", "why", "will", "with", "would", "you", "your", "https", "http", "www", "com",
+))
+
+def tokenize(text: str) -> list[str]:
+    """Lower case words without stopwords, plurals reduced to the singular"""
+    tokens = []
+    for word in WORDS.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+class FaqMatch(NamedTuple):
+    name: str
+    reply: str
+    score: float
+    # share of the question's weight that the answer covers, 0..1
+    confidence: float
+
+class FaqIndex:
+    """BM25 index over the text replies of all bot commands
+
+    Commands are the curated answers to the questions support threads keep
+    asking, so a question that clearly matches one can be answered without
+    the LLM. Documents are the command name plus its reply. The index follows
+    the command registry: when a source changes only the commands whose reply
+    changed are reindexed. Answers are ranked by BM25, the confidence is the
+    idf weighted share of the question's words the best answer contains,
+    words no answer knows count fully against it.
+    """
+    def __init__(self, threshold: float = 0.75, minTerms: int = 2, exclude: tuple[str, ...] = (),
+                 k1: float = 1.2, b: float = 0.75, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.threshold = threshold
+        self.minTerms = minTerms
+        self.exclude = frozenset(name.lower() for name in exclude)
+        self.k1 = k1
+        self.b = b
+        self._replies: dict[str, str] = {}
+        self._lengths: dict[str, int] = {}
+        self._totalLength = 0
+        # term -> {command name: term frequency}
+        self._postings: dict[str, dict[str, int]] = {}
+
+    @classmethod
+    def fromConfig(cls, options: dict | None) -> "FaqIndex":
+        options = options or {}
+        return cls(threshold=float(options.get("threshold", 0.75)), minTerms=int(options.get("minTerms", 2)),
+                   exclude=tuple(options.get("exclude") or ()), enabled=bool(options.get("enabled", True)))
+
+    def __len__(self) -> int:
+        return len(self._replies)
+
+    def follow(self, registry) -> None:
+        """Index the registry's commands now and whenever one of its sources changes"""
+        def onChange(source: str) -> None:
+            # native commands have no reply to offer
+            if source != registry.NATIVE:
+                self.update(registry.replies())
+        registry.addListener(onChange)
+        self.update(registry.replies())
+
+    def update(self, replies: dict[str, str]) -> None:
+        """Make the index match 'replies', only new, changed and removed commands are touched"""
+        replies = {name: reply for name, reply in replies.items() if name not in self.exclude and reply}
+        changed = 0
+        for name in [name for name in self._replies if replies.get(name) != self._replies[name]]:
+            self._remove(name)
+            changed += 1
+        for name, reply in replies.items():
+            if name not in self._replies:
+                self._add(name, reply)
+                changed += 1
+        if changed:
+            logger.debug("FAQ index updated, %s changes, %s answers", changed, len(self._replies))
+
+    def _add(self, name: str, reply: str) -> None:
+        terms = Counter(tokenize(name) + tokenize(reply))
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[name] = tf
+        self._replies[name] = reply
+        self._lengths[name] = length = sum(terms.values())
+        self._totalLength += length
+
+    def _remove(self, name: str) -> None:
+        reply = self._replies.pop(name)
+        self._totalLength -= self._lengths.pop(name)
+        for term in set(tokenize(name) + tokenize(reply)):
+            postings = self._postings[term]
+            del postings[name]
+            if not postings:
+                del self._postings[term]
+
+    def _idf(self, df: int) -> float:
+        n = len(self._replies)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, question: str, limit: int = 3) -> list[FaqMatch]:
+        """Best matching answers for a question, best first"""
+        terms = set(tokenize(question))
+        if not terms or not self._replies:
+            return []
+        avgLength = self._totalLength / len(self._replies)
+        scores: dict[str, float] = {}
+        covered: dict[str, float] = {}
+        totalWeight = 0.0
+        for term in terms:
+            postings = self._postings.get(term, {})
+            idf = self._idf(len(postings))
+            totalWeight += idf
+            for name, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[name] / avgLength)
+                scores[name] = scores.get(name, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                covered[name] = covered.get(name, 0.0) + idf
+        best = sorted(scores, key=scores.get, reverse=True)[:limit]
+        return [FaqMatch(name, self._replies[name], scores[name], covered[name] / totalWeight) for name in best]
+
+    def answer(self, question: str) -> FaqMatch | None:
+        """The best answer if it's confident enough to skip asking the LLM"""
+        if not self.enabled:
+            return None
+        if len(set(tokenize(question))) < self.minTerms:
+            LOOKUPS.inc("short")
+            return None
+        matches = self.search(question, 1)
+        if not matches or matches[0].confidence < self.threshold:
+            LOOKUPS.inc("miss")
+            return None
+        LOOKUPS.inc("hit")
+        return matches[0]
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import aiohttp
+from yarl import URL
+from utils.metrics import REGISTRY, httpTraceConfig
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# total request timeouts in seconds, LLMs are slow, everything else should answer quickly
+DEFAULT_HOST_TIMEOUTS = {
+    "api.github.com": 15,
+    "gist.githubusercontent.com": 15,
+    "raw.githubusercontent.com": 15,
+    "api.gitbook.com": 30,
+    "api.openai.com": 120,
+    "generativelanguage.googleapis.com": 120,
+    "localhost": 300,
+    "127.0.0.1": 300,
+}
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+HTTP_RETRIES = REGISTRY.counter("ninjabot_http_retries_total", "Outbound HTTP requests that were retried", ("cog", "host", "reason"))
+
+class HttpService:
+    """Bot wide HTTP client with a single pooled connector
+
+    Cogs borrow it through bot.httpService instead of owning sessions, so TLS
+    connections to the same host are kept alive and reused between calls.
+    Idempotent requests are retried on connection errors and 429/5xx with
+    jittered exponential backoff.
+    """
+    def __init__(self, defaultTimeout: float = 30, hostTimeouts: dict | None = None, limit: int = 100,
+                 limitPerHost: int = 10, dnsCacheTtl: int = 300, retries: int = 2, backoff: float = 0.5) -> None:
+        self.defaultTimeout = defaultTimeout
+        self.hostTimeouts = DEFAULT_HOST_TIMEOUTS | (hostTimeouts or {})
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.dnsCacheTtl = dnsCacheTtl
+        self.retries = retries
+        self.backoff = backoff
+        self._session: aiohttp.ClientSession | None = None
+        self._closed = False
+        self._timeouts: dict[str, aiohttp.ClientTimeout] = {}
+
+    @classmethod
+    def fromConfig(cls, options: dict | None) -> "HttpService":
+        options = options or {}
+        return cls(
+            defaultTimeout=float(options.get("defaultTimeout", 30)),
+            hostTimeouts={host: float(t) for host, t in (options.get("timeouts") or {}).items()},
+            limit=int(options.get("limit", 100)),
+            limitPerHost=int(options.get("limitPerHost", 10)),
+            dnsCacheTtl=int(options.get("dnsCacheTtl", 300)),
+            retries=int(options.get("retries", 2)),
+            backoff=float(options.get("backoff", 0.5))
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use"""
+        if self._closed:
+            raise RuntimeError("HTTP service is closed")
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limitPerHost,
+                ttl_dns_cache=self.dnsCacheTtl,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[httpTraceConfig("NinjaBot")])
+        return self._session
+
+    def _timeout(self, host: str) -> aiohttp.ClientTimeout:
+        timeout = self._timeouts.get(host)
+        if timeout is None:
+            total = self.hostTimeouts.get(host, self.defaultTimeout)
+            timeout = self._timeouts[host] = aiohttp.ClientTimeout(total=total, sock_connect=min(10, total))
+        return timeout
+
+    def _delay(self, attempt: int, response: aiohttp.ClientResponse | None = None) -> float:
+        retryAfter = response.headers.get("Retry-After") if response is not None else None
+        if retryAfter:
+            try:
+                return min(float(retryAfter), 60)
+            except ValueError:
+                pass
+        # full jitter so parallel callers don't retry in lockstep
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str | URL, *, cog: str = "NinjaBot", retries: int | None = None,
+                      **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Perform a request, use as 'async with bot.httpService.get(url) as resp:'
+
+        'retries' defaults to the configured amount for idempotent methods and 0 otherwise.
+        """
+        method = method.upper()
+        url = URL(url)
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        kwargs.setdefault("timeout", self._timeout(url.host or ""))
+        kwargs["trace_request_ctx"] = {"cog": cog}
+
+        attempt = 0
+        while True:
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as E:
+                if attempt >= retries:
+                    raise
+                HTTP_RETRIES.inc(cog, url.host or "", type(E).__name__)
+                delay = self._delay(attempt)
+                logger.debug("%s %s failed with %s, retrying in %.2fs", method, url.host, type(E).__name__, delay)
+            else:
+                if response.status not in RETRY_STATUS or attempt >= retries:
+                    break
+                HTTP_RETRIES.inc(cog, url.host or "", str(response.status))
+                delay = self._delay(attempt, response)
+                response.release()
+                logger.debug("%s %s returned %s, retrying in %.2fs", method, url.host, response.status, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+        try:
+            yield response
+        finally:
+            response.release()
+
+    def get(self, url: str | URL, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str | URL, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str | URL, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    async def close(self) -> None:
+        """Close the shared session, safe to call more than once"""
+        self._closed = True
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.debug("HTTP service closed")
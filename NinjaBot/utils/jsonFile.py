@@ -1,6 +1,7 @@
 import aiofile
 import json
 import logging
+import os
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -10,11 +11,17 @@ class fileHelper:
         self._filename = filename
 
     async def write(self, data: dict) -> None:
-        """dump 'data' to the json file"""
+        """atomically dump 'data' to the json file"""
         logger.debug("writing data to json file")
+        # serialize before the first await so later changes to 'data' can't leak into this write
+        content = json.dumps(data, indent=4)
+        tmpFilename = f"{self._filename}.tmp"
         try:
-            async with aiofile.async_open(self._filename, mode="w") as f:
-                await f.write(json.dumps(data, indent=4))
+            # write to a temp file and swap it in, a crash can never leave a truncated file behind
+            async with aiofile.async_open(tmpFilename, mode="w") as f:
+                await f.write(content)
+                await f.file.fsync()
+            os.replace(tmpFilename, self._filename)
         except Exception as E:
             logger.exception(E)
             raise E
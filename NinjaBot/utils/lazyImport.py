@@ -0,0 +1,13 @@
+import asyncio
+import importlib
+import logging
+import time
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+async def importModule(name: str):
+    """Import a (heavy) module in a worker thread so the event loop keeps running, and log the cost"""
+    start = time.perf_counter()
+    module = await asyncio.to_thread(importlib.import_module, name)
+    logger.info("Imported %s in %.3fs", name, time.perf_counter() - start)
+    return module
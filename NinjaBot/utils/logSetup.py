@@ -0,0 +1,88 @@
+import logging
+import logging.handlers
+import queue
+import time
+
+class SamplingFilter(logging.Filter):
+    """Rate-limit high volume debug lines
+
+    Lets at most one record per call site (logger + source line) through
+    per interval and mentions how many were dropped in between.
+    """
+    def __init__(self, interval: float) -> None:
+        super().__init__()
+        self.interval = interval
+        # call site -> [last time let through, suppressed since]
+        self._lastSeen: dict[tuple[str, str, int], list] = {}
+        self._nextPrune = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0 or record.levelno > logging.DEBUG:
+            return True
+        # the message itself may be anything, even unhashable, and must not be kept alive
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        if now >= self._nextPrune:
+            self._prune(now)
+        state = self._lastSeen.get(key)
+        if state is None:
+            self._lastSeen[key] = [now, 0]
+            return True
+        if now - state[0] < self.interval:
+            state[1] += 1
+            return False
+        if state[1]:
+            record.msg = f"{record.msg} ({state[1]} similar lines suppressed)"
+        self._lastSeen[key] = [now, 0]
+        return True
+
+    def _prune(self, now: float) -> None:
+        """Forget call sites that were quiet for a whole interval and have nothing suppressed to report"""
+        self._lastSeen = {key: state for key, state in self._lastSeen.items() if now - state[0] < self.interval or state[1]}
+        self._nextPrune = now + self.interval
+
+def setupLogging(filename: str, level: int = logging.INFO) -> tuple[logging.handlers.QueueListener, SamplingFilter]:
+    """Send all bot and discord log records through a queue so handler I/O happens off the event loop"""
+    formatter = logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", datefmt="%Y-%m-%d %H:%M:%S", style="{")
+
+    # rotating log file handler
+    rotateFileHnd = logging.handlers.RotatingFileHandler(
+        filename=filename,
+        encoding="utf-8",
+        maxBytes=32 * 1024 * 1024,  # 32 MiB
+        backupCount=5,  # Rotate through 5 files
+    )
+    rotateFileHnd.setFormatter(formatter)
+
+    # cmd output
+    streamHnd = logging.StreamHandler()
+    streamHnd.setFormatter(formatter)
+
+    # the event loop only puts records into the queue, the listener thread writes them out
+    logQueue = queue.SimpleQueue()
+    queueHnd = logging.handlers.QueueHandler(logQueue)
+    sampler = SamplingFilter(0)
+    queueHnd.addFilter(sampler)
+    listener = logging.handlers.QueueListener(logQueue, rotateFileHnd, streamHnd, respect_handler_level=True)
+
+    for name in ("discord", "NinjaBot"):
+        log = logging.getLogger(name)
+        log.propagate = False
+        log.setLevel(level)
+        log.addHandler(queueHnd)
+
+    logging.getLogger("discord.http").setLevel(logging.INFO)
+    logging.getLogger("discord.gateway").setLevel(logging.INFO)
+    logging.getLogger("discord.client").setLevel(logging.INFO)
+    logging.getLogger("discord.webhook").setLevel(logging.INFO)
+
+    listener.start()
+    return listener, sampler
+
+def applyLogLevels(levels: dict | None) -> None:
+    """Set per-subsystem log levels, e.g. {"NinjaBot.cogs.NinjaAntiSpam": "DEBUG"}"""
+    for name, level in (levels or {}).items():
+        try:
+            logging.getLogger(name).setLevel(level.upper() if isinstance(level, str) else level)
+        except (TypeError, ValueError):
+            logging.getLogger("NinjaBot").warning("Invalid log level '%s' for '%s'", level, name)
@@ -0,0 +1,134 @@
+import asyncio
+import inspect
+import logging
+import time
+import discord
+from dataclasses import dataclass
+from utils.metrics import LISTENER_SECONDS, REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+USER_MESSAGE_TYPES = frozenset((discord.MessageType.default, discord.MessageType.reply))
+
+LISTENER_ERRORS = REGISTRY.counter("ninjabot_message_listener_errors_total", "Exceptions raised by on_message listeners", ("cog",))
+
+@dataclass(frozen=True, slots=True)
+class MessageEnvelope:
+    """Facts about a message that are computed once and shared by all listeners"""
+    message: discord.Message
+    authorId: int
+    isBot: bool
+    isDM: bool
+    isThread: bool
+    channelId: int
+    # the parent channel for threads, otherwise the channel itself
+    parentId: int
+    isUserMessage: bool
+    isAutoThreadChannel: bool
+    isAiChannel: bool
+    isModerator: bool
+
+@dataclass(frozen=True, slots=True)
+class MessageFilter:
+    """Declares which messages a listener wants to receive"""
+    allowBots: bool = False
+    allowDM: bool = True
+    userMessagesOnly: bool = False
+    threadsOnly: bool = False
+    skipModerators: bool = False
+    # config snapshot attribute holding the channel id(s) the listener is limited to
+    channels: str | None = None
+
+def messageListener(**filters):
+    """Mark a cog method as receiver for pre-processed message envelopes"""
+    messageFilter = MessageFilter(**filters)
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError("Message listeners must be coroutines")
+        func.__messageFilter__ = messageFilter
+        return func
+    return decorator
+
+class MessageDispatcher:
+    """Builds the message envelope and fans it out to all interested cog listeners"""
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self._listeners: list[tuple[MessageFilter, object, str]] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def register(self, cog) -> None:
+        for name, member in inspect.getmembers(type(cog)):
+            messageFilter = getattr(member, "__messageFilter__", None)
+            if messageFilter is not None:
+                self._listeners.append((messageFilter, getattr(cog, name), type(cog).__name__))
+                logger.debug("Registered message listener %s.%s", type(cog).__name__, name)
+
+    def unregister(self, cog) -> None:
+        self._listeners = [l for l in self._listeners if getattr(l[1], "__self__", None) is not cog]
+
+    @property
+    def inFlight(self) -> int:
+        """Number of listener tasks that are still running"""
+        return len(self._tasks)
+
+    def envelope(self, message: discord.Message) -> MessageEnvelope:
+        author = message.author
+        channel = message.channel
+        snapshot = self.bot.config.snapshot
+        isBot = author.bot or author == self.bot.user
+        isThread = isinstance(channel, discord.Thread)
+        parentId = channel.parent_id if isThread else channel.id
+        return MessageEnvelope(
+            message=message,
+            authorId=author.id,
+            isBot=isBot,
+            isDM=isinstance(channel, discord.DMChannel),
+            isThread=isThread,
+            channelId=channel.id,
+            parentId=parentId,
+            isUserMessage=message.type in USER_MESSAGE_TYPES,
+            isAutoThreadChannel=channel.id in snapshot.autoThreadChannels,
+            isAiChannel=parentId in snapshot.aiChannels,
+            isModerator=not isBot and self.bot.roleIndex.isModerator(author.id)
+        )
+
+    def _accepts(self, f: MessageFilter, env: MessageEnvelope) -> bool:
+        if env.isBot and not f.allowBots: return False
+        if env.isDM and not f.allowDM: return False
+        if f.userMessagesOnly and not env.isUserMessage: return False
+        if f.threadsOnly and not env.isThread: return False
+        if f.skipModerators and env.isModerator: return False
+        if f.channels is not None:
+            channels = getattr(self.bot.config.snapshot, f.channels)
+            if isinstance(channels, frozenset):
+                return env.channelId in channels
+            return env.channelId == channels
+        return True
+
+    def dispatch(self, env: MessageEnvelope) -> list[asyncio.Task]:
+        """Schedule every listener whose filter matches the envelope"""
+        scheduled = []
+        for messageFilter, callback, cogName in self._listeners:
+            if self._accepts(messageFilter, env):
+                task = asyncio.create_task(self._run(callback, env, cogName), name=f"NinjaBot: {cogName} message listener")
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                scheduled.append(task)
+        return scheduled
+
+    async def drain(self) -> None:
+        """Wait until all running listener tasks are done"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, callback, env: MessageEnvelope, cogName: str) -> None:
+        start = time.perf_counter()
+        try:
+            await callback(env)
+        except asyncio.CancelledError:
+            pass
+        except Exception as E:
+            LISTENER_ERRORS.inc(cogName)
+            logger.exception(E)
+        finally:
+            LISTENER_SECONDS.observe(time.perf_counter() - start, cogName)
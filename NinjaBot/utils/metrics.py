@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# latency buckets in seconds, from a fast dict lookup to a slow llm call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _formatLabels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _formatValue(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelNames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labelValues: tuple) -> tuple:
+        if len(labelValues) != len(self.labelNames):
+            raise ValueError(f"{self.name} expects labels {self.labelNames}")
+        return labelValues
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labelValues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_formatLabels(self.labelNames, labelValues)} {_formatValue(value)}")
+        return lines
+
+class Counter(_Metric):
+    """A value that only goes up"""
+    type = "counter"
+
+    def inc(self, *labelValues, amount: float = 1) -> None:
+        key = self._key(labelValues)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """A value that can go up and down"""
+    type = "gauge"
+
+    def set(self, value: float, *labelValues) -> None:
+        self._values[self._key(labelValues)] = value
+
+    def inc(self, *labelValues, amount: float = 1) -> None:
+        key = self._key(labelValues)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labelValues, amount: float = 1) -> None:
+        self.inc(*labelValues, amount=-amount)
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelNames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelNames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelValues) -> None:
+        key = self._key(labelValues)
+        state = self._values.get(key)
+        if state is None:
+            # per bucket counts (+Inf last), sum, count
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labelValues, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucketCount
+                le = f'le="{_formatValue(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_formatLabels(self.labelNames, labelValues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_formatLabels(self.labelNames, labelValues)} {_formatValue(total)}")
+            lines.append(f"{self.name}_count{_formatLabels(self.labelNames, labelValues)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Holds all metrics and renders them in the prometheus text format"""
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as {metric.type}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelNames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelNames)
+
+    def gauge(self, name: str, documentation: str, labelNames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelNames)
+
+    def histogram(self, name: str, documentation: str, labelNames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelNames, buckets=buckets)
+
+    def addCollector(self, collector: Callable[[], None]) -> None:
+        """Register a callback that updates gauges right before they get rendered"""
+        self._collectors.append(collector)
+
+    def removeCollector(self, collector: Callable[[], None]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as E:
+                logger.exception(E)
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+# the registry used by the whole bot
+REGISTRY = MetricsRegistry()
+
+LISTENER_SECONDS = REGISTRY.histogram("ninjabot_message_listener_seconds", "Time spent in on_message listeners", ("cog",))
+LOOP_SECONDS = REGISTRY.histogram("ninjabot_task_loop_seconds", "Duration of tasks.loop iterations", ("cog", "loop"))
+LOOP_RUNS = REGISTRY.counter("ninjabot_task_loop_runs_total", "tasks.loop iterations by outcome", ("cog", "loop", "status"))
+HTTP_SECONDS = REGISTRY.histogram("ninjabot_http_request_seconds", "Outbound HTTP request latency", ("cog", "host", "method", "status"))
+DISCORD_SECONDS = REGISTRY.histogram("ninjabot_discord_request_seconds", "Discord REST call latency", ("method", "route", "status"))
+
+def timedLoop(func):
+    """Record duration and outcome of every tasks.loop iteration, put it below @tasks.loop"""
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await func(self, *args, **kwargs)
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            cog = type(self).__name__
+            LOOP_SECONDS.observe(time.perf_counter() - start, cog, func.__name__)
+            LOOP_RUNS.inc(cog, func.__name__, status)
+    return wrapper
+
+def httpTraceConfig(cog: str) -> aiohttp.TraceConfig:
+    """Trace config for aiohttp sessions that records request latency per cog and host
+
+    A request can override the cog label with trace_request_ctx={"cog": "..."}.
+    """
+    async def onStart(session, ctx, params) -> None:
+        ctx.start = time.perf_counter()
+
+    def observe(ctx, params, status) -> None:
+        requestCog = cog
+        if isinstance(ctx.trace_request_ctx, dict):
+            requestCog = ctx.trace_request_ctx.get("cog", cog)
+        HTTP_SECONDS.observe(time.perf_counter() - ctx.start, requestCog, params.url.host or "", params.method, status)
+
+    async def onEnd(session, ctx, params) -> None:
+        observe(ctx, params, str(params.response.status))
+
+    async def onException(session, ctx, params) -> None:
+        observe(ctx, params, type(params.exception).__name__)
+
+    traceConfig = aiohttp.TraceConfig()
+    traceConfig.on_request_start.append(onStart)
+    traceConfig.on_request_end.append(onEnd)
+    traceConfig.on_request_exception.append(onException)
+    return traceConfig
+
+def instrumentDiscordRequest(request):
+    """Wrap discord.py's HTTPClient.request to time every REST call by route"""
+    @functools.wraps(request)
+    async def wrapper(route, **kwargs):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await request(route, **kwargs)
+        except Exception as E:
+            status = str(getattr(E, "status", type(E).__name__))
+            raise
+        finally:
+            DISCORD_SECONDS.observe(time.perf_counter() - start, route.method, route.path, status)
+    return wrapper
+
+class MetricsExporter:
+    """Expose the registry on a localhost http port and/or write it to a file periodically"""
+    def __init__(self, registry: MetricsRegistry, port: int = 0, file: str = "", interval: float = 60) -> None:
+        self.registry = registry
+        self.port = port
+        self.file = file
+        self.interval = interval
+        self._runner: web.AppRunner | None = None
+        self._fileTask: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handleMetrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+            logger.info("Serving metrics on http://127.0.0.1:%s/metrics", self.port)
+        if self.file:
+            self._fileTask = asyncio.create_task(self._fileWriter(), name="NinjaBot: metrics file writer")
+
+    async def _handleMetrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    def _writeFile(self, text: str) -> None:
+        tmpFile = f"{self.file}.tmp"
+        with open(tmpFile, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmpFile, self.file)
+
+    async def _fileWriter(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._writeFile, self.registry.render())
+            except Exception as E:
+                logger.exception(E)
+            await asyncio.sleep(self.interval)
+
+    async def close(self) -> None:
+        if self._fileTask:
+            self._fileTask.cancel()
+            self._fileTask = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,162 @@
+import logging
+import random
+from array import array
+from collections import deque
+from itertools import islice
+from dataclasses import dataclass, field
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# only this many characters of a message are fingerprinted
+MAX_FINGERPRINT_LENGTH = 512
+SHINGLE_SIZE = 5
+
+@dataclass(slots=True, eq=False)
+class IndexEntry:
+    authorId: int
+    messageId: int
+    channelId: int
+    timestamp: float
+    signature: array = field(repr=False)
+    bandKeys: tuple[int, ...] = field(repr=False)
+    # what the spam report shows for the message
+    report: str = field(default="", repr=False)
+
+class RaidIndex:
+    """Rolling MinHash/LSH index over recent messages from all users
+
+    Every message is reduced to a one permutation MinHash signature over
+    character shingles, the signature is split into bands and each band is
+    hashed into a bucket. Messages sharing a bucket are candidates and their
+    signatures estimate the jaccard similarity. If enough distinct authors
+    posted near identical messages within the window, they are reported as
+    a raid cluster. Lookups only touch the matching buckets and the newest
+    maxCandidates entries in each, so the cost per message doesn't depend on
+    how much traffic is indexed. Entries leave the index when they fall out
+    of the window or when maxEntries is reached, oldest first.
+    """
+    def __init__(self, window: float = 120, clusterSize: int = 10, similarity: float = 0.8, maxEntries: int = 5000,
+                 minLength: int = 30, bands: int = 16, rows: int = 4, maxCandidates: int = 100, seed: int | None = None) -> None:
+        self.window = window
+        self.clusterSize = clusterSize
+        self.similarity = similarity
+        self.maxEntries = maxEntries
+        self.minLength = minLength
+        self.bands = bands
+        self.rows = rows
+        self.maxCandidates = maxCandidates
+        self._salt = random.Random(seed).getrandbits(63)
+        self._entries: deque[IndexEntry] = deque()
+        # most buckets only ever hold one entry, plain lists keep them small
+        self._buckets: dict[int, list[IndexEntry]] = {}
+        # authors that were already reported, so a running raid picks up late joiners right away
+        self._flagged: dict[int, float] = {}
+
+    @classmethod
+    def fromConfig(cls, options: dict | None) -> "RaidIndex":
+        options = options or {}
+        return cls(
+            window=float(options.get("window", 120)),
+            clusterSize=int(options.get("clusterSize", 10)),
+            similarity=float(options.get("similarity", 0.8)),
+            maxEntries=int(options.get("maxEntries", 5000)),
+            minLength=int(options.get("minLength", 30)),
+            bands=int(options.get("bands", 16)),
+            rows=int(options.get("rows", 4)),
+            maxCandidates=int(options.get("maxCandidates", 100))
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: str) -> array:
+        """One permutation hashing, a single pass over the shingles instead of one per hash function"""
+        text = text[:MAX_FINGERPRINT_LENGTH]
+        size = self.bands * self.rows
+        salt = self._salt
+        bins = [None] * size
+        for shingle in {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}:
+            value, pos = divmod(hash(shingle) ^ salt, size)
+            current = bins[pos]
+            if current is None or value < current:
+                bins[pos] = value
+        # short messages leave bins empty, borrow from the next filled bin so signatures stay comparable
+        filled = [pos for pos, value in enumerate(bins) if value is not None]
+        if not filled:
+            return array("q", bytes(8 * size))
+        if len(filled) < size:
+            nextFilled = filled[0] + size
+            for pos in range(size - 1, -1, -1):
+                if bins[pos] is not None:
+                    nextFilled = pos
+                else:
+                    bins[pos] = hash((bins[nextFilled % size], nextFilled - pos))
+        return array("q", bins)
+
+    def _bandKeys(self, signature: array) -> tuple[int, ...]:
+        rows = self.rows
+        return tuple(hash((band, signature[band * rows:(band + 1) * rows].tobytes())) for band in range(self.bands))
+
+    def _estimate(self, a: array, b: array) -> float:
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def expire(self, now: float) -> None:
+        """Drop entries that fell out of the window or exceed the size limit"""
+        cutoff = now - self.window
+        entries = self._entries
+        while entries and (entries[0].timestamp < cutoff or len(entries) > self.maxEntries):
+            entry = entries.popleft()
+            # entries are inserted in time order, so the oldest entry is first in each of its buckets as well
+            for key in entry.bandKeys:
+                bucket = self._buckets[key]
+                if len(bucket) == 1:
+                    del self._buckets[key]
+                elif bucket[0] is entry:
+                    del bucket[0]
+                else:
+                    bucket.remove(entry)
+        if self._flagged:
+            self._flagged = {uid: ts for uid, ts in self._flagged.items() if ts >= cutoff}
+
+    def add(self, text: str, authorId: int, messageId: int, channelId: int, now: float, report: str = "") -> dict[int, list[IndexEntry]]:
+        """Index a (normalized) message and return the authors that should be cleaned up because of it
+
+        Every author comes with their indexed messages that are part of the
+        cluster, so they can be deleted even when nothing else remembers them.
+        An author that was reported before only comes back with the new message.
+        """
+        self.expire(now)
+        if len(text) < self.minLength:
+            return {}
+
+        signature = self.signature(text)
+        bandKeys = self._bandKeys(signature)
+        similar: dict[int, list[IndexEntry]] = {}
+        seen = set()
+        for key in bandKeys:
+            for candidate in islice(reversed(self._buckets.get(key, ())), self.maxCandidates):
+                if id(candidate) in seen:
+                    continue
+                seen.add(id(candidate))
+                if self._estimate(signature, candidate.signature) >= self.similarity:
+                    similar.setdefault(candidate.authorId, []).append(candidate)
+
+        entry = IndexEntry(authorId, messageId, channelId, now, signature, bandKeys, report)
+        self._entries.append(entry)
+        for key in bandKeys:
+            self._buckets.setdefault(key, []).append(entry)
+        if len(self._entries) > self.maxEntries:
+            self.expire(now)
+        similar.setdefault(authorId, []).append(entry)
+
+        if len(similar) < self.clusterSize and not (similar.keys() & self._flagged.keys()):
+            return {}
+        cluster = {uid: entries for uid, entries in similar.items() if uid not in self._flagged}
+        for uid in cluster:
+            self._flagged[uid] = now
+        if cluster:
+            logger.info("Raid cluster of %s authors detected, %s new", len(similar), len(cluster))
+        if authorId not in cluster:
+            # already reported, their new message still has to go
+            cluster[authorId] = [entry]
+        return cluster
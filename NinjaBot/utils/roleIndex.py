@@ -0,0 +1,99 @@
+import logging
+import discord
+from discord.ext import commands, tasks
+from utils.metrics import timedLoop
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class RoleIndex:
+    """Ids of the members holding the moderator role, kept current from gateway events
+
+    The role is resolved by name once and the member set is updated from
+    member and role events, so checking a member is a set lookup instead of
+    a scan over their roles. A periodic rebuild catches anything the events
+    missed (e.g. while disconnected).
+    """
+    def __init__(self, bot, roleName: str = "Moderator") -> None:
+        self.bot = bot
+        self.roleName = roleName
+        self.roleId: int | None = None
+        self._members: set[int] = set()
+        for event in ("on_ready", "on_guild_available", "on_member_update", "on_raw_member_remove",
+                      "on_guild_role_create", "on_guild_role_update", "on_guild_role_delete"):
+            bot.add_listener(getattr(self, event), event)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def isModerator(self, memberId: int) -> bool:
+        return memberId in self._members
+
+    def _guild(self) -> discord.Guild | None:
+        return self.bot.get_guild(self.bot.config.snapshot.guild)
+
+    def rebuild(self) -> None:
+        """Resolve the role and collect its members from the member cache"""
+        guild = self._guild()
+        role = discord.utils.get(guild.roles, name=self.roleName) if guild else None
+        members = {member.id for member in role.members} if role else set()
+        if role is None:
+            logger.warning("Role %s not found, nobody is treated as moderator", self.roleName)
+        elif self.roleId == role.id and members != self._members:
+            logger.info("Role index for %s was out of sync, %s members changed", self.roleName, len(members ^ self._members))
+        self.roleId = role.id if role else None
+        self._members = members
+
+    def _isOurs(self, guild: discord.Guild) -> bool:
+        return guild.id == self.bot.config.snapshot.guild
+
+    async def on_ready(self) -> None:
+        self.rebuild()
+
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        if self._isOurs(guild):
+            self.rebuild()
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        if self.roleId is None or not self._isOurs(after.guild):
+            return
+        if after.get_role(self.roleId):
+            self._members.add(after.id)
+        else:
+            self._members.discard(after.id)
+
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent) -> None:
+        if payload.guild_id == self.bot.config.snapshot.guild:
+            self._members.discard(payload.user.id)
+
+    async def _onRoleChange(self, role: discord.Role) -> None:
+        # only a role with our name showing up, being renamed or removed changes which role is meant
+        if self._isOurs(role.guild) and (role.id == self.roleId or role.name == self.roleName):
+            self.rebuild()
+
+    async def on_guild_role_create(self, role: discord.Role) -> None:
+        await self._onRoleChange(role)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        await self._onRoleChange(after)
+
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        await self._onRoleChange(role)
+
+    @tasks.loop(minutes=10)
+    @timedLoop
+    async def reconcileJob(self) -> None:
+        self.rebuild()
+
+    @reconcileJob.before_loop
+    async def before_reconcileJob(self) -> None:
+        await self.bot.wait_until_ready()
+
+def moderatorOnly():
+    """Command check like commands.has_role("Moderator"), answered from the bot's role index"""
+    def predicate(ctx: commands.Context) -> bool:
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        if not ctx.bot.roleIndex.isModerator(ctx.author.id):
+            raise commands.MissingRole(ctx.bot.roleIndex.roleName)
+        return True
+    return commands.check(predicate)
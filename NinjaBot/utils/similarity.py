@@ -0,0 +1,91 @@
+import logging
+import unicodedata
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# characters spammers sprinkle into messages to dodge exact matches
+ZERO_WIDTH = dict.fromkeys(map(ord, "\u00ad\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff"), None)
+
+def normalize(text: str) -> str:
+    """Fold case, compatibility characters, zero-width characters and whitespace runs"""
+    if text.isascii():
+        # nothing to fold besides case, skip the expensive unicode work
+        text = text.lower()
+    else:
+        text = unicodedata.normalize("NFKC", text).translate(ZERO_WIDTH).casefold()
+    return " ".join(text.split())
+
+def _commonPrefix(a: str, b: str, limit: int) -> int:
+    """Length of the common prefix of a and b, but at most 'limit'"""
+    # binary search with slice comparisons, they run in C instead of a python loop per character
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def _commonSuffix(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix of a and b, but at most 'limit'"""
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def boundedDistance(a: str, b: str, limit: int = 1) -> int:
+    """Levenshtein distance between a and b, or limit + 1 as soon as it's known to exceed limit
+
+    Only the diagonal band of width 2 * limit + 1 is computed and the
+    comparison stops once a whole row is above the limit, so the cost is
+    O(limit * len) at worst and usually much less.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    # the length difference alone is a lower bound for the distance
+    if len(b) - len(a) > limit:
+        return limit + 1
+    # string hashes are cached, so this rejects most unequal pairs before comparing characters
+    if hash(a) == hash(b) and a == b:
+        return 0
+
+    # strip the common prefix and suffix, they don't change the distance
+    start = _commonPrefix(a, b, len(a))
+    suffix = _commonSuffix(a, b, len(a) - start)
+    a = a[start:len(a) - suffix]
+    b = b[start:len(b) - suffix]
+    if not a:
+        return len(b) if len(b) <= limit else limit + 1
+    if limit == 1:
+        # after stripping, one substitution or one insertion is all that can be left
+        return 1 if len(b) == 1 else 2
+
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        rowMin = current[0] if low == 1 else over
+        ai = a[i - 1]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (ai != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            if cost > limit:
+                cost = over
+            current[j] = cost
+            if cost < rowMin:
+                rowMin = cost
+        if rowMin > limit:
+            return over
+        previous = current
+    return previous[len(b)]
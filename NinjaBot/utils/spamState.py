@@ -0,0 +1,157 @@
+import logging
+from array import array
+from typing import Iterator
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class MessageRing:
+    """Fixed capacity ring buffer of (message id, channel id, text) entries
+
+    Ids are stored as raw int64s, the text next to them is what ends up in
+    the spam report so the messages don't have to be fetched again. The
+    buffer grows up to its capacity and then overwrites the oldest entry,
+    so memory per user is bounded no matter how much they post.
+    """
+    __slots__ = ("capacity", "_data", "_texts", "_start", "_size")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self._data = array("q")
+        self._texts: list[str] = []
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _full(self) -> bool:
+        return len(self._texts) == self.capacity
+
+    def append(self, messageId: int, channelId: int, text: str = "") -> None:
+        if not self._full():
+            # still growing, entries are stored in order without wrapping
+            self._data.append(messageId)
+            self._data.append(channelId)
+            self._texts.append(text)
+            self._size += 1
+            return
+        index = (self._start + self._size) % self.capacity
+        self._data[2 * index] = messageId
+        self._data[2 * index + 1] = channelId
+        self._texts[index] = text
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            # overwrote the oldest entry
+            self._start = (self._start + 1) % self.capacity
+
+    def pop(self) -> tuple[int, int, str] | None:
+        """Remove and return the most recently added entry"""
+        if not self._size:
+            return None
+        if not self._full():
+            channelId = self._data.pop()
+            messageId = self._data.pop()
+            text = self._texts.pop()
+        else:
+            index = (self._start + self._size - 1) % self.capacity
+            messageId, channelId = self._data[2 * index], self._data[2 * index + 1]
+            text, self._texts[index] = self._texts[index], ""
+        self._size -= 1
+        return messageId, channelId, text
+
+    def remove(self, messageId: int) -> bool:
+        """Remove the entry of a message, returns False if it isn't (or no longer) recorded"""
+        entries = list(self)
+        for i in range(len(entries) - 1, -1, -1):
+            if entries[i][0] == messageId:
+                break
+        else:
+            return False
+        if i == len(entries) - 1:
+            self.pop()
+            return True
+        del entries[i]
+        # rare enough that rebuilding the (small) buffer in order is fine
+        self._data = array("q")
+        self._texts = []
+        self._start = 0
+        self._size = 0
+        for entry in entries:
+            self.append(*entry)
+        return True
+
+    def __iter__(self) -> Iterator[tuple[int, int, str]]:
+        """Oldest entry first"""
+        data = self._data
+        texts = self._texts
+        for i in range(self._size):
+            index = (self._start + i) % self.capacity
+            yield data[2 * index], data[2 * index + 1], texts[index]
+
+class RateWindow:
+    """Sliding window event counter made of a fixed number of circular buckets
+
+    Each bucket counts the events of window / buckets seconds. Moving forward
+    clears at most every bucket once, so adding and counting are O(1) and the
+    memory is fixed by the bucket count no matter how many events happen.
+    """
+    __slots__ = ("width", "_counts", "_head", "_tick", "total")
+
+    def __init__(self, window: float, buckets: int) -> None:
+        self.width = window / max(1, buckets)
+        self._counts = array("I", bytes(4 * max(1, buckets)))
+        self._head = 0
+        # absolute bucket number the head bucket belongs to
+        self._tick = None
+        self.total = 0
+
+    def _advance(self, now: float) -> None:
+        tick = int(now // self.width)
+        if self._tick is None or tick >= self._tick + len(self._counts):
+            # everything in the window is outdated (or nothing happened yet)
+            for i in range(len(self._counts)):
+                self._counts[i] = 0
+            self._head = 0
+            self.total = 0
+        else:
+            for _ in range(tick - self._tick):
+                self._head = (self._head + 1) % len(self._counts)
+                self.total -= self._counts[self._head]
+                self._counts[self._head] = 0
+        if self._tick is None or tick > self._tick:
+            self._tick = tick
+
+    def add(self, now: float, amount: int = 1) -> int:
+        """Count an event and return the number of events in the window including it"""
+        self._advance(now)
+        self._counts[self._head] += amount
+        self.total += amount
+        return self.total
+
+    def count(self, now: float) -> int:
+        self._advance(now)
+        return self.total
+
+class UserState:
+    """Everything anti-spam tracks about a single user"""
+    __slots__ = ("lastMessage", "lastKey", "lastSeen", "abuse", "messages", "channels", "rate", "rateLimitedAt", "spamSignal")
+
+    def __init__(self, lastMessage: str, lastKey: str, lastSeen: float, historySize: int,
+                 rateWindow: float = 10, rateBuckets: int = 10) -> None:
+        self.lastMessage = lastMessage
+        # the (normalized) form of lastMessage used for similarity checks
+        self.lastKey = lastKey
+        self.lastSeen = lastSeen
+        self.abuse = 0.0
+        self.messages = MessageRing(historySize)
+        self.channels: set[int] = set()
+        # how many messages the user posted recently
+        self.rate = RateWindow(rateWindow, rateBuckets)
+        # when posting too fast last raised abuse
+        self.rateLimitedAt: float | None = None
+        # whether a duplicate or content rule raised abuse, without one rate alone can't get the user kicked
+        self.spamSignal = False
+
+    def __repr__(self) -> str:
+        return f"<UserState abuse={self.abuse} messages={len(self.messages)} channels={len(self.channels)} rate={self.rate.total}>"
@@ -0,0 +1,129 @@
+import logging
+from collections import OrderedDict, deque
+import discord
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+LOOKUPS = REGISTRY.counter("ninjabot_thread_cache_lookups_total", "Thread history lookups by cache result", ("result",))
+
+class ThreadMessage:
+    """The parts of a thread message the AI context needs"""
+    __slots__ = ("id", "authorId", "isBot", "content")
+
+    def __init__(self, id: int, authorId: int, isBot: bool, content: str) -> None:
+        self.id = id
+        self.authorId = authorId
+        self.isBot = isBot
+        self.content = content
+
+    @classmethod
+    def fromMessage(cls, message: discord.Message) -> "ThreadMessage":
+        return cls(message.id, message.author.id, message.author.bot, message.content)
+
+    def asDict(self) -> dict:
+        """The format the AI helpers expect"""
+        return {"content": self.content, "author": {"id": self.authorId, "bot": self.isBot}}
+
+class ThreadCache:
+    """The latest messages of recently active threads, kept current from gateway events
+
+    A thread is only cached once its history is known to be complete: it was
+    created while the bot was running, or its history was fetched once after
+    a miss. From then on message, edit and delete events keep it current, so
+    building AI context doesn't need any REST calls. The least recently used
+    threads are dropped once more than maxThreads are cached.
+    """
+    def __init__(self, bot, maxThreads: int = 200, messagesPerThread: int = 20) -> None:
+        self.bot = bot
+        self.maxThreads = maxThreads
+        self.messagesPerThread = messagesPerThread
+        self._threads: OrderedDict[int, deque[ThreadMessage]] = OrderedDict()
+        # threads whose history is being fetched -> messages that arrived meanwhile
+        self._fetching: dict[int, list[ThreadMessage]] = {}
+        for event in ("on_thread_create", "on_raw_message_edit", "on_raw_message_delete",
+                      "on_raw_bulk_message_delete", "on_raw_thread_delete"):
+            bot.add_listener(getattr(self, event), event)
+
+    @classmethod
+    def fromConfig(cls, bot, options: dict | None) -> "ThreadCache":
+        options = options or {}
+        return cls(bot, maxThreads=int(options.get("maxThreads", 200)),
+                   messagesPerThread=int(options.get("messagesPerThread", 20)))
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def __contains__(self, threadId: int) -> bool:
+        return threadId in self._threads
+
+    def _store(self, threadId: int, messages: list[ThreadMessage]) -> deque[ThreadMessage]:
+        buffer = self._threads[threadId] = deque(messages, maxlen=self.messagesPerThread)
+        self._threads.move_to_end(threadId)
+        while len(self._threads) > self.maxThreads:
+            self._threads.popitem(last=False)
+        return buffer
+
+    def addMessage(self, message: discord.Message) -> None:
+        """Record a new message, the bot calls this before any listener sees the message"""
+        buffer = self._threads.get(message.channel.id)
+        if buffer is not None:
+            buffer.append(ThreadMessage.fromMessage(message))
+            self._threads.move_to_end(message.channel.id)
+        arrived = self._fetching.get(message.channel.id)
+        if arrived is not None:
+            arrived.append(ThreadMessage.fromMessage(message))
+
+    def find(self, threadId: int, messageId: int) -> ThreadMessage | None:
+        for record in self._threads.get(threadId, ()):
+            if record.id == messageId:
+                return record
+        return None
+
+    async def history(self, thread: discord.Thread, limit: int) -> list[dict]:
+        """The last 'limit' messages of the thread, oldest first, like reversed thread.history(limit=limit)"""
+        buffer = self._threads.get(thread.id)
+        if buffer is None or limit > self.messagesPerThread:
+            LOOKUPS.inc("miss")
+            arrived = self._fetching.setdefault(thread.id, [])
+            try:
+                fetched = [ThreadMessage.fromMessage(msg) async for msg in thread.history(limit=max(limit, self.messagesPerThread))]
+            finally:
+                if self._fetching.get(thread.id) is arrived:
+                    del self._fetching[thread.id]
+            # messages posted during the fetch may or may not be part of it, the ids give the posting order
+            merged = {record.id: record for record in fetched}
+            for record in (*self._threads.get(thread.id, ()), *arrived):
+                merged[record.id] = record
+            messages = [merged[messageId] for messageId in sorted(merged)]
+            self._store(thread.id, messages)
+            return [record.asDict() for record in messages[-limit:]]
+        LOOKUPS.inc("hit")
+        self._threads.move_to_end(thread.id)
+        start = max(0, len(buffer) - limit)
+        return [buffer[i].asDict() for i in range(start, len(buffer))]
+
+    async def on_thread_create(self, thread: discord.Thread) -> None:
+        # nothing was posted in a new thread yet, so the empty history is complete
+        if thread.id not in self._threads:
+            self._store(thread.id, [])
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        record = self.find(payload.channel_id, payload.message_id)
+        if record is not None and "content" in payload.data:
+            record.content = payload.data["content"]
+
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        record = self.find(payload.channel_id, payload.message_id)
+        if record is not None:
+            self._threads[payload.channel_id].remove(record)
+
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        buffer = self._threads.get(payload.channel_id)
+        if buffer:
+            kept = [record for record in buffer if record.id not in payload.message_ids]
+            buffer.clear()
+            buffer.extend(kept)
+
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent) -> None:
+        self._threads.pop(payload.thread_id, None)
@@ -0,0 +1,68 @@
+import logging
+import math
+from typing import Hashable
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class TimingWheel:
+    """Hashed timing wheel for entries that expire a fixed ttl after their last touch
+
+    Every entry sits in the slot of the tick it expires in. Since all entries
+    share the same ttl the wheel only needs to span one ttl, so advancing
+    the clock only ever looks at the slots that passed and the entries in
+    them. The cost scales with the number of expiring entries, not with the
+    number of tracked ones.
+    """
+    def __init__(self, ttl: float, resolution: float = 1.0) -> None:
+        self.ttl = ttl
+        self.resolution = resolution
+        self._slots: list[set] = [set() for _ in range(math.ceil(ttl / resolution) + 2)]
+        self._tickOf: dict[Hashable, int] = {}
+        self._lastTick: int | None = None
+
+    def __len__(self) -> int:
+        return len(self._tickOf)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tickOf
+
+    def _tick(self, timestamp: float) -> int:
+        return math.floor(timestamp / self.resolution)
+
+    def touch(self, key: Hashable, now: float) -> None:
+        """(Re)schedule the expiry of 'key' to now + ttl"""
+        tick = math.ceil((now + self.ttl) / self.resolution)
+        if self._lastTick is None:
+            self._lastTick = self._tick(now)
+        oldTick = self._tickOf.get(key)
+        if oldTick == tick:
+            return
+        if oldTick is not None:
+            self._slots[oldTick % len(self._slots)].discard(key)
+        self._slots[tick % len(self._slots)].add(key)
+        self._tickOf[key] = tick
+
+    def discard(self, key: Hashable) -> None:
+        tick = self._tickOf.pop(key, None)
+        if tick is not None:
+            self._slots[tick % len(self._slots)].discard(key)
+
+    def advance(self, now: float) -> list:
+        """Move the clock to 'now' and return all keys that expired on the way"""
+        currentTick = self._tick(now)
+        if self._lastTick is None:
+            self._lastTick = currentTick
+            return []
+        expired = []
+        # after a long pause there is no need to visit a slot more than once
+        start = max(self._lastTick + 1, currentTick - len(self._slots) + 1)
+        for tick in range(start, currentTick + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+            for key in [k for k in slot if self._tickOf[k] <= currentTick]:
+                slot.discard(key)
+                del self._tickOf[key]
+                expired.append(key)
+        self._lastTick = currentTick
+        return expired